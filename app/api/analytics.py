@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import Literal, Optional
+from uuid import UUID
+from datetime import datetime, timedelta, timezone
+from app.core.db import get_db
+from app.core.responses import FastJSONResponse
+from app.models.usage_rollup import UsageRollup
+from app.models.user_organization import UserOrganization
+from app.models.workspace_user import WorkspaceUser
+from app.services.usage import METRICS, bucket_start
+from app.utils.auth_utils import get_current_user
+
+router = APIRouter()
+
+DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+MAX_RANGE = {"hour": timedelta(days=31), "day": timedelta(days=731)}
+
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Rollup buckets are naive UTC; a query parameter with an offset is converted, not compared as is
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def check_access(db: Session, user, level: str, subject_id: UUID):
+    if level == "user":
+        allowed = subject_id == user.id
+    elif level == "workspace":
+        allowed = db.query(WorkspaceUser).filter_by(user_id=user.id, workspace_id=subject_id).first() is not None
+    else:
+        member = db.query(UserOrganization).filter_by(user_id=user.id, organization_id=subject_id).first()
+        allowed = member is not None and member.role == "admin"
+    if not allowed:
+        raise HTTPException(status_code=403, detail=f"No access to this {level}'s usage")
+
+
+# Reads only the rollup tables (app.services.usage); the current bucket lags by up to USAGE_FLUSH_SECONDS
+@router.get("/usage/{level}/{subject_id}")
+def get_usage(
+    level: Literal["user", "workspace", "organization"],
+    subject_id: UUID,
+    granularity: Literal["hour", "day"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    check_access(db, user, level, subject_id)
+    end = naive_utc(end) or datetime.utcnow()
+    start = bucket_start(naive_utc(start) or end - DEFAULT_RANGE[granularity], granularity)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > MAX_RANGE[granularity]:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RANGE[granularity].days} days of {granularity} buckets")
+
+    rows = db.query(UsageRollup.bucket_start, *(getattr(UsageRollup, m) for m in METRICS)).filter(
+        UsageRollup.level == level,
+        UsageRollup.subject_id == subject_id,
+        UsageRollup.granularity == granularity,
+        UsageRollup.bucket_start >= start,
+        UsageRollup.bucket_start < end,
+    ).order_by(UsageRollup.bucket_start).all()
+
+    buckets = [{"bucket_start": row[0], **dict(zip(METRICS, row[1:]))} for row in rows]
+    return FastJSONResponse({
+        "level": level,
+        "subject_id": subject_id,
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "totals": {m: sum(b[m] for b in buckets) for m in METRICS},
+        "buckets": buckets,
+    })
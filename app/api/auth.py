@@ -1,36 +1,61 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.core.db import get_db
 from app.models.user import User
-from app.utils.auth_utils import verify_password, create_access_token, get_password_hash
+from app.utils.auth_utils import create_access_token
+from app.services.password_hashing import hash_password, verify_and_update
 from app.schemas.user import RegisterRequest, TokenResponse
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
-@router.post("/register", response_model=TokenResponse)
-def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
-    if user:
-        raise HTTPException(status_code=400, detail="Email already registered")
+# Database work runs in the threadpool; only the awaits on the hash pool stay on the event loop.
+# Each helper ends its transaction, so a sign-in queued for the hash pool holds no DB connection
 
-    hashed_password = get_password_hash(request.password)
-    new_user = User(
-        email=request.email,
-        hashed_password=hashed_password,
-        full_name=request.full_name
-    )
+def _find_user(db: Session, email: str):
+    user = db.query(User.id, User.hashed_password).filter(User.email == email).first()
+    db.rollback()
+    return user
+
+
+def _create_user(db: Session, email: str, hashed_password: str, full_name: str):
+    new_user = User(email=email, hashed_password=hashed_password, full_name=full_name)
     db.add(new_user)
     db.commit()
-    db.refresh(new_user)
+    return new_user.id
+
 
-    access_token = create_access_token({"sub": str(new_user.id)})
+def _update_hash(db: Session, user_id, old_hash: str, new_hash: str):
+    # Unless the password was changed in the meantime
+    db.query(User).filter(User.id == user_id, User.hashed_password == old_hash).update(
+        {"hashed_password": new_hash}, synchronize_session=False
+    )
+    db.commit()
+
+
+@router.post("/register", response_model=TokenResponse)
+async def register_user(request: RegisterRequest, db: Session = Depends(get_db)):
+    if await run_in_threadpool(_find_user, db, request.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+
+    # bcrypt runs in the password hash pool, never in the threadpool the sync endpoints share
+    hashed_password = await hash_password(request.password)
+    user_id = await run_in_threadpool(_create_user, db, request.email, hashed_password, request.full_name)
+
+    access_token = create_access_token({"sub": str(user_id)})
     return TokenResponse(access_token=access_token)
 
 @router.post("/login", response_model=TokenResponse)
-def login_user(request: RegisterRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == request.email).first()
-    if not user or not verify_password(request.password, user.hashed_password):
+async def login_user(request: RegisterRequest, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_find_user, db, request.email)
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_and_update(request.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Stored with other bcrypt parameters than configured: upgrade it now that we have the password
+        await run_in_threadpool(_update_hash, db, user.id, user.hashed_password, new_hash)
 
     access_token = create_access_token({"sub": str(user.id)})
     return TokenResponse(access_token=access_token)
@@ -1,27 +1,52 @@
 from fastapi import APIRouter, Depends, Request, UploadFile, File, HTTPException
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from app.utils.auth_utils import get_current_user
-from app.services.vector_store import search_context, embed_and_store, delete_document_vectors
-from app.services.llm_router import stream_chat_response, get_full_chat_response  
-from app.services.redis_cache import store_chat_memory, get_chat_memory
+from app.services.vector_store import search_context, embed_query, embed_and_store, active_collection
+from app.services import ingestion, prefetch, response_cache, rate_limiter, reclaimer
+from app.services.llm_router import stream_chat_response, provider_for, LLMError, UnknownModelError
+from app.services.redis_cache import get_chat_memory
+from app.services.message_writer import writer as message_writer
+from app.services.usage import aggregator as usage
 from app.services.document_parser import extract_text_from_file
 from app.models.message import Message
 from app.models.chat import Chat
 from app.models.document import Document
 from app.models.workspace import Workspace
-from app.core.db import get_db
+from app.models.workspace_user import WorkspaceUser
+from app.models.user_organization import UserOrganization
+from app.core.config import settings
+from app.core.db import get_db, SessionLocal
+from app.core.responses import FastJSONResponse
+from app.core.metrics import timed, observe_stage, ADMISSION_SHED, CHAT_CANCELLED
+from app.utils.pagination import keyset_page, stream_ndjson, DEFAULT_PAGE_SIZE
+from app.utils.tokens import estimate_tokens
 from sqlalchemy.orm import Session
+from typing import List, Literal, Optional
+import anyio
+import asyncio
 import uuid
 import os
+import time
+import logging
 from datetime import datetime
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 class ChatRequest(BaseModel):
     chat_id: uuid.UUID
     message: str
     model: str 
+    # Which documents retrieval searches: this chat's, its workspace's, or its organization's
+    scope: Literal["chat", "workspace", "organization"] = "chat"
+
+class PrefetchRequest(BaseModel):
+    chat_id: uuid.UUID
+    # What the user has typed so far
+    draft: str
+    scope: Literal["chat", "workspace", "organization"] = "chat"
 
 class CreateChatRequest(BaseModel):
     workspace_id: uuid.UUID
@@ -38,6 +63,14 @@ def create_chat(
     workspace = db.query(Workspace).filter_by(id=request.workspace_id).first()
     if not workspace:
         raise HTTPException(status_code=404, detail="Workspace not found")
+    member = db.query(WorkspaceUser).filter_by(user_id=user.id, workspace_id=request.workspace_id).first()
+    if not member:
+        raise HTTPException(status_code=403, detail="Not a member of this workspace")
+
+    try:
+        provider_for(request.model)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # Create new chat
     chat = Chat(
@@ -57,26 +90,96 @@ def create_chat(
         "created_at": chat.created_at
     }
 
+# List and export queries select only these columns: rows go straight to the encoder, no ORM objects
+CHAT_COLUMNS = (Chat.id, Chat.title, Chat.model, Chat.created_at)
+MESSAGE_COLUMNS = (Message.id, Message.user_id, Message.content, Message.response, Message.status, Message.created_at)
+DOCUMENT_COLUMNS = (Document.id, Document.name, Document.uploaded_at)
+
+def scope_organization_id(db: Session, user, chat, scope: str):
+    """The chat's organization id, once the user is checked to be allowed to search the given scope.
+
+    Owning the chat is not enough to widen retrieval: the wider scopes need a membership of the
+    workspace or organization they search.
+    """
+    organization_id = chat.workspace.organization_id if chat.workspace else None
+    if scope == "organization" and organization_id is None:
+        raise HTTPException(status_code=400, detail="This chat's workspace does not belong to an organization")
+    if scope == "workspace":
+        member = db.query(WorkspaceUser).filter_by(user_id=user.id, workspace_id=chat.workspace_id).first()
+        if not member:
+            raise HTTPException(status_code=403, detail="Not a member of this workspace")
+    elif scope == "organization":
+        member = db.query(UserOrganization).filter_by(user_id=user.id, organization_id=organization_id).first()
+        if not member:
+            raise HTTPException(status_code=403, detail="Not a member of this organization")
+    return organization_id
+
+def serialize_chat(chat):
+    return {
+        "chat_id": chat.id,
+        "title": chat.title,
+        "model": chat.model,
+        "created_at": chat.created_at
+    }
+
+def serialize_message(m):
+    return {
+        "user_id": m.user_id,
+        "message": m.content,
+        "response": m.response,
+        "status": m.status,
+        "created_at": m.created_at
+    }
+
+@router.get("/quota")
+def get_quota(
+    workspace_id: Optional[uuid.UUID] = None,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Remaining budget in every bucket this user's requests are charged to; only a member sees a workspace's
+    if workspace_id is not None and not db.query(WorkspaceUser).filter_by(user_id=user.id, workspace_id=workspace_id).first():
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    return {"items": rate_limiter.usage(rate_limiter.subjects_for(db, user, workspace_id))}
+
 @router.get("/list/{workspace_id}")
 def list_chats(
     workspace_id: uuid.UUID,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     user=Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    chats = db.query(Chat).filter_by(
-        workspace_id=workspace_id,
-        user_id=user.id
-    ).order_by(Chat.created_at.desc()).all()
-    
-    return [
-        {
-            "chat_id": str(chat.id),
-            "title": chat.title,
-            "model": chat.model,
-            "created_at": chat.created_at
-        }
-        for chat in chats
-    ]
+    query = db.query(*CHAT_COLUMNS).filter(
+        Chat.workspace_id == workspace_id,
+        Chat.user_id == user.id,
+        Chat.deleted_at.is_(None)
+    )
+    chats, next_cursor = keyset_page(query, Chat.created_at, Chat.id, cursor, limit, descending=True)
+
+    return FastJSONResponse({
+        "items": [serialize_chat(chat) for chat in chats],
+        "next_cursor": next_cursor
+    })
+
+@router.get("/list/{workspace_id}/export")
+def export_chats(
+    workspace_id: uuid.UUID,
+    user=Depends(get_current_user)
+):
+    def rows():
+        export_db = SessionLocal()
+        try:
+            query = export_db.query(*CHAT_COLUMNS).filter(
+                Chat.workspace_id == workspace_id,
+                Chat.user_id == user.id,
+                Chat.deleted_at.is_(None)
+            ).order_by(Chat.created_at.desc(), Chat.id.desc())
+            yield from stream_ndjson(query, serialize_chat)
+        finally:
+            export_db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
 @router.post("/chat")
 async def chat_stream(
@@ -86,41 +189,162 @@ async def chat_stream(
     db: Session = Depends(get_db)
 ):
     # Verify chat exists and belongs to user
-    chat = db.query(Chat).filter_by(id=body.chat_id, user_id=user.id).first()
+    chat = db.query(Chat).filter_by(id=body.chat_id, user_id=user.id, deleted_at=None).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+
+    try:
+        provider_for(body.model)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    organization_id = scope_organization_id(db, user, chat, body.scope)
+
+    # Refuse before any embedding or search is spent on the turn. A zero token cost still rejects
+    # while a bucket is in debt from earlier completions
+    subjects = rate_limiter.subjects_for(db, user, chat.workspace_id)
+    rate_limiter.check(subjects, requests=1, prompt_tokens=0, completion_tokens=0)
     
-    memory = get_chat_memory(body.chat_id)
-    context_docs = search_context(body.message, body.chat_id)
+    with timed("chat.memory_read"):
+        memory = get_chat_memory(body.chat_id)
+    with timed("chat.retrieval"):
+        # One registry read for both: a collection switch between them would mix embedding models
+        collection = active_collection()
+        prefetched = await prefetch.take(body.chat_id, body.message, body.scope, collection)
+        if prefetched is None:
+            question_vector = embed_query(body.message, collection)
+            context_docs = search_context(
+                body.message, body.chat_id, question_vector,
+                scope=body.scope, workspace_id=chat.workspace_id, organization_id=organization_id,
+                collection=collection
+            )
+        else:
+            context_docs = prefetched.context
+            # The draft's vector only stands in for an identical question; the semantic cache
+            # (first turns only) needs the question's own
+            question_vector = prefetched.vector if prefetched.exact else None
+            if question_vector is None and not memory and settings.LLM_CACHE_SEMANTIC:
+                question_vector = embed_query(body.message, collection)
 
     # Combine memory and docs as prompt
-    memory_text = ""
-    if memory:
-        memory_text = "\n".join([f"User: {m['msg']}\nAssistant: {m['res']}" for m in memory[-5:]]) + "\n\n"
-    
-    context_text = f"Context from documents:\n{context_docs}\n\n" if context_docs else ""
-    
-    prompt = f"{memory_text}{context_text}User: {body.message}"
+    with timed("chat.prompt_build"):
+        memory_text = ""
+        if memory:
+            memory_text = "\n".join([f"User: {m['msg']}\nAssistant: {m['res']}" for m in memory[-5:]]) + "\n\n"
+        
+        context_text = f"Context from documents:\n{context_docs}\n\n" if context_docs else ""
+        
+        prompt = f"{memory_text}{context_text}User: {body.message}"
+
+    # The semantic tier only applies to first turns: with memory the question depends on the conversation
+    cache_version = response_cache.corpus_version(context_docs, collection.model) if not memory else None
+    # Semantic entries are shared within a workspace only (a chat of its own for chats without one)
+    cache_tenant = str(chat.workspace_id or chat.id)
+    with timed("chat.cache_lookup"):
+        cached = response_cache.lookup(body.model, prompt, cache_version, question_vector, cache_tenant)
+
+    # Cache hits cost no provider tokens; completion tokens are debited once the answer is known
+    prompt_tokens = estimate_tokens(prompt) if cached is None else 0
+    rate_limiter.debit(subjects, prompt_tokens=prompt_tokens)
+
+    def persist(response: str, status: str):
+        completion_tokens = 0
+        if cached is None:
+            completion_tokens = estimate_tokens(response)
+            rate_limiter.debit(subjects, completion_tokens=completion_tokens)
+            if status == "complete":
+                response_cache.store(
+                    body.model, prompt, response, cache_version, question_vector, cache_tenant
+                )
+        # Partial answers are kept in the history but not in the chat memory the next prompt is built from
+        with timed("chat.persist"):
+            message_writer.submit(
+                user.id, body.chat_id, body.message, response, status, body.model, prompt_tokens, completion_tokens
+            )
+        usage.record_turn(user.id, chat.workspace_id, organization_id, prompt_tokens, completion_tokens)
 
     async def event_stream():
-        # Stream chunks to frontend
-        async for chunk in stream_chat_response(body.model, prompt):
-            yield chunk
+        # Stream chunks to frontend, keeping them for storage
+        started = time.perf_counter()
+        first_chunk_at = None
+        chunks = []
+        if cached is not None:
+            source = response_cache.replay(cached.response)
+        else:
+            source = stream_chat_response(body.model, prompt)
+        deadline = asyncio.get_running_loop().time() + settings.CHAT_STREAM_TIMEOUT_SECONDS
+        status = "complete"
+        try:
+            while True:
+                try:
+                    # The deadline only wraps the wait for the next chunk, never the yield to the client
+                    async with asyncio.timeout_at(deadline):
+                        chunk = await anext(source)
+                except StopAsyncIteration:
+                    break
+                except TimeoutError:
+                    logger.warning("Chat %s: stream deadline reached after %d chunks", body.chat_id, len(chunks))
+                    status = "timeout"
+                    break
+                if await request.is_disconnected():
+                    status = "cancelled"
+                    break
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    observe_stage("chat.ttft", first_chunk_at - started)
+                chunks.append(chunk)
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            # The server cancelled the response task or dropped this generator: the client is gone
+            status = "cancelled"
+            raise
+        except LLMError as e:
+            # Headers are already sent; end the stream and keep nothing half-generated
+            logger.warning("Chat %s: generation failed: %s", body.chat_id, e)
+            return
+        finally:
+            # Stop the upstream generation right away; shielded so the pending cancellation cannot skip it
+            with anyio.CancelScope(shield=True):
+                await source.aclose()
+            if status == "cancelled":
+                CHAT_CANCELLED.inc()
+            elif status == "timeout":
+                ADMISSION_SHED.labels("generation", "deadline").inc()
+            if status != "complete":
+                persist("".join(chunks), status)
+        if status != "complete":
+            return
 
-        # Fetch full response for storage
-        final_response = await get_full_chat_response(body.model, prompt)
+        observe_stage("chat.stream", time.perf_counter() - started)
+        persist("".join(chunks), "complete")
 
-        # Save to Redis and DB
-        store_chat_memory(body.chat_id, body.message, final_response)
-        db.add(Message(
-            user_id=user.id,
-            chat_id=body.chat_id,
-            content=body.message,
-            response=final_response
-        ))
-        db.commit()
+    headers = cached.headers() if cached is not None else {"X-Cache": "miss"}
+    if settings.PREFETCH_ENABLED:
+        headers["X-Prefetch"] = "hit" if prefetched is not None else "miss"
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+# Speculative retrieval while the user types; chat_stream reuses it when the sent message matches the draft
+@router.post("/prefetch", status_code=202)
+async def prefetch_context(
+    body: PrefetchRequest,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    chat = db.query(Chat).filter_by(id=body.chat_id, user_id=user.id, deleted_at=None).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    organization_id = scope_organization_id(db, user, chat, body.scope)
+
+    status = prefetch.start(body.chat_id, body.draft, body.scope, chat.workspace_id, organization_id)
+    return {"status": status}
+
+# The input was cleared: drop the running prefetch and its result
+@router.delete("/prefetch/{chat_id}")
+async def cancel_prefetch(chat_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    if not db.query(Chat.id).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first():
+        raise HTTPException(status_code=404, detail="Chat not found")
+    prefetch.discard(chat_id)
+    return {"status": "cancelled"}
 
 @router.post("/upload-document")
 async def upload_document_in_chat(
@@ -130,9 +354,19 @@ async def upload_document_in_chat(
     db: Session = Depends(get_db)
 ):
     # Verify chat exists and belongs to user
-    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id).first()
+    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+
+    filename = ingestion.safe_filename(file.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid file name")
+
+    rate_limiter.check(
+        rate_limiter.subjects_for(db, user, chat.workspace_id),
+        requests=1,
+        upload_bytes=file.size or 0,
+    )
     
     try:
         # Ensure upload dir exists
@@ -140,48 +374,90 @@ async def upload_document_in_chat(
         os.makedirs(upload_dir, exist_ok=True)
 
         # Save file locally
-        file_path = os.path.join(upload_dir, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        file_path = os.path.join(upload_dir, filename)
+        with timed("upload.save"):
+            with open(file_path, "wb") as f:
+                content = await file.read()
+                f.write(content)
+            await file.seek(0)
 
         # Extract text
-        text = await extract_text_from_file(file)
+        with timed("upload.parse"):
+            text = await extract_text_from_file(file)
 
-        # Store embeddings in Qdrant
-        await embed_and_store(text, chat_id, file.filename)
+        # Store embeddings in Qdrant (encoding is CPU-bound, keep it off the event loop)
+        organization_id = chat.workspace.organization_id if chat.workspace else None
+        with timed("upload.embed"):
+            await run_in_threadpool(
+                embed_and_store, text, chat_id, filename, chat.workspace_id, organization_id
+            )
 
         # Save metadata in PostgreSQL
-        doc = Document(
-            chat_id=chat_id,
-            name=file.filename,
-            path=file_path,
-            uploaded_at=datetime.utcnow()
-        )
-        db.add(doc)
-        db.commit()
+        with timed("upload.persist"):
+            doc = Document(
+                chat_id=chat_id,
+                workspace_id=chat.workspace_id,
+                user_id=user.id,
+                name=filename,
+                path=file_path,
+                size_bytes=len(content),
+                uploaded_at=datetime.utcnow()
+            )
+            db.add(doc)
+            db.commit()
+        usage.record_upload(user.id, chat.workspace_id, organization_id, 1, len(content))
 
-        return {"status": "success", "message": f"File {file.filename} uploaded to chat and embedded."}
+        return {"status": "success", "message": f"File {filename} uploaded to chat and embedded."}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Many files (or zip archives) in one request; progress and per-file errors stream back as NDJSON
+@router.post("/upload-documents")
+async def upload_documents_in_chat(
+    chat_id: uuid.UUID,
+    files: List[UploadFile] = File(...),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    batch = await ingestion.read_uploads(files)
+    rate_limiter.check(
+        rate_limiter.subjects_for(db, user, chat.workspace_id),
+        requests=1,
+        upload_bytes=sum(len(contents) for _, contents in batch),
+    )
+    events = ingestion.ingest(
+        batch, f"uploads/chat_{chat_id}", user.id, chat_id,
+        chat.workspace_id, chat.workspace.organization_id if chat.workspace else None
+    )
+    return StreamingResponse(ingestion.ndjson(events), media_type="application/x-ndjson")
+
 @router.get("/documents/{chat_id}")
 def list_chat_documents(
     chat_id: uuid.UUID,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     user=Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     # Verify chat exists and belongs to user
-    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id).first()
+    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    docs = db.query(Document).filter_by(chat_id=chat_id).all()
-    return [
-        {"id": str(doc.id), "name": doc.name, "uploaded_at": doc.uploaded_at}
-        for doc in docs
-    ]
+    query = db.query(*DOCUMENT_COLUMNS).filter(Document.chat_id == chat_id, Document.deleted_at.is_(None))
+    docs, next_cursor = keyset_page(query, Document.uploaded_at, Document.id, cursor, limit)
+    return FastJSONResponse({
+        "items": [
+            {"id": doc.id, "name": doc.name, "uploaded_at": doc.uploaded_at}
+            for doc in docs
+        ],
+        "next_cursor": next_cursor
+    })
 
 @router.delete("/documents/{doc_id}")
 async def delete_chat_document(
@@ -189,46 +465,78 @@ async def delete_chat_document(
     user=Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    doc = db.query(Document).filter(Document.id == doc_id).first()
+    doc = db.query(Document).filter(Document.id == doc_id, Document.deleted_at.is_(None)).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Verify chat belongs to user
-    chat = db.query(Chat).filter_by(id=doc.chat_id, user_id=user.id).first()
+    chat = db.query(Chat).filter_by(id=doc.chat_id, user_id=user.id, deleted_at=None).first()
     if not chat:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    # Delete from vector store
-    delete_document_vectors(doc.chat_id, doc.name)
-
-    # Delete file
-    if os.path.exists(doc.path):
-        os.remove(doc.path)
-
-    # Delete from database
-    db.delete(doc)
+    # Hidden at once, in search too; vectors, file and row are removed by the reclaimer
+    doc.deleted_at = datetime.utcnow()
     db.commit()
+    await run_in_threadpool(reclaimer.document_deleted, doc)
     
     return {"status": "deleted", "message": f"{doc.name} removed from chat."}
 
+@router.delete("/{chat_id}")
+def delete_chat(
+    chat_id: uuid.UUID,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    # Hidden at once, in search too; messages, documents, vectors and uploads are removed by the reclaimer
+    chat.deleted_at = datetime.utcnow()
+    db.commit()
+    reclaimer.chat_deleted(chat_id)
+    return {"status": "deleted", "message": f"Chat {chat.title} removed."}
+
 @router.get("/history/{chat_id}")
 def get_chat_history(
     chat_id: uuid.UUID, 
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
     user=Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
     # Verify chat exists and belongs to user
-    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id).first()
+    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first()
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
     
-    messages = db.query(Message).filter_by(chat_id=chat_id).order_by(Message.created_at.asc()).all()
-    return [
-        {
-            "user_id": m.user_id,
-            "message": m.content,
-            "response": m.response,
-            "created_at": m.created_at
-        }
-        for m in messages
-    ]
+    query = db.query(*MESSAGE_COLUMNS).filter(Message.chat_id == chat_id)
+    messages, next_cursor = keyset_page(query, Message.created_at, Message.id, cursor, limit)
+    return FastJSONResponse({
+        "items": [serialize_message(m) for m in messages],
+        "next_cursor": next_cursor
+    })
+
+@router.get("/history/{chat_id}/export")
+def export_chat_history(
+    chat_id: uuid.UUID,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Verify chat exists and belongs to user
+    chat = db.query(Chat).filter_by(id=chat_id, user_id=user.id, deleted_at=None).first()
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    def rows():
+        # The export outlives the request-scoped session, so it opens its own
+        export_db = SessionLocal()
+        try:
+            query = export_db.query(*MESSAGE_COLUMNS).filter(Message.chat_id == chat_id).order_by(
+                Message.created_at.asc(), Message.id.asc()
+            )
+            yield from stream_ndjson(query, serialize_message)
+        finally:
+            export_db.close()
+
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
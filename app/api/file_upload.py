@@ -1,10 +1,20 @@
 from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from app.services.document_parser import extract_text_from_file
-from app.services.vector_store import embed_and_store, delete_document_vectors
+from app.services.vector_store import embed_and_store
+from app.services import ingestion, rate_limiter, reclaimer
+from app.services.usage import aggregator as usage
 from app.utils.auth_utils import get_current_user
 from app.core.db import get_db
+from app.core.metrics import timed
+from app.core.responses import FastJSONResponse
 from app.models.document import Document
+from app.models.workspace import Workspace
+from app.models.workspace_user import WorkspaceUser
+from app.utils.pagination import keyset_page, DEFAULT_PAGE_SIZE
 from sqlalchemy.orm import Session
+from typing import List, Optional
 import uuid
 import os
 from datetime import datetime
@@ -12,6 +22,15 @@ from datetime import datetime
 router = APIRouter()
 UPLOAD_DIR = "uploads"
 
+
+def get_member_workspace(db: Session, workspace_id: uuid.UUID, user) -> Workspace:
+    member = db.query(WorkspaceUser).filter_by(user_id=user.id, workspace_id=workspace_id).first()
+    if not member:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    return db.query(Workspace).filter_by(id=workspace_id).first()
+
+
+# Workspace-level documents: searchable from every chat in the workspace with scope="workspace"
 @router.post("/upload")
 async def upload_document(
     workspace_id: uuid.UUID,
@@ -19,54 +38,95 @@ async def upload_document(
     user=Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    workspace = get_member_workspace(db, workspace_id, user)
+    filename = ingestion.safe_filename(file.filename)
+    if not filename:
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    rate_limiter.check(rate_limiter.subjects_for(db, user, workspace_id), requests=1, upload_bytes=file.size or 0)
     try:
         # Ensure upload dir exists
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        upload_dir = os.path.join(UPLOAD_DIR, f"workspace_{workspace_id}")
+        os.makedirs(upload_dir, exist_ok=True)
 
         # Save file locally
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        file_path = os.path.join(upload_dir, filename)
+        with timed("upload.save"):
+            with open(file_path, "wb") as f:
+                content = await file.read()
+                f.write(content)
+            await file.seek(0)
 
         # Extract text
-        text = await extract_text_from_file(file)
+        with timed("upload.parse"):
+            text = await extract_text_from_file(file)
 
         # Store embeddings in Qdrant
-        await embed_and_store(text, workspace_id, file.filename)
+        with timed("upload.embed"):
+            await run_in_threadpool(
+                embed_and_store, text, None, filename, workspace_id, workspace.organization_id
+            )
 
         # Save metadata in PostgreSQL
-        doc = Document(
-            workspace_id=workspace_id,
-            name=file.filename,
-            path=file_path,
-            uploaded_at=datetime.utcnow()
-        )
-        db.add(doc)
-        db.commit()
+        with timed("upload.persist"):
+            doc = Document(
+                workspace_id=workspace_id,
+                user_id=user.id,
+                name=filename,
+                path=file_path,
+                size_bytes=len(content),
+                uploaded_at=datetime.utcnow()
+            )
+            db.add(doc)
+            db.commit()
+        usage.record_upload(user.id, workspace_id, workspace.organization_id, 1, len(content))
 
-        return {"status": "success", "message": f"File {file.filename} embedded & saved."}
+        return {"status": "success", "message": f"File {filename} embedded & saved."}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/documents")
-async def list_documents(
+# Batch variant of /upload: many files or zip archives, NDJSON progress per file
+@router.post("/upload-batch")
+async def upload_documents(
     workspace_id: uuid.UUID,
+    files: List[UploadFile] = File(...),
     user=Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    docs = db.query(Document).filter(Document.workspace_id == workspace_id).all()
-    return [
-        {"id": str(doc.id), "name": doc.name, "uploaded_at": doc.uploaded_at}
-        for doc in docs
-    ]
-
+    workspace = get_member_workspace(db, workspace_id, user)
+    batch = await ingestion.read_uploads(files)
+    rate_limiter.check(
+        rate_limiter.subjects_for(db, user, workspace_id),
+        requests=1,
+        upload_bytes=sum(len(contents) for _, contents in batch),
+    )
+    events = ingestion.ingest(
+        batch, os.path.join(UPLOAD_DIR, f"workspace_{workspace_id}"), user.id, None,
+        workspace_id, workspace.organization_id
+    )
+    return StreamingResponse(ingestion.ndjson(events), media_type="application/x-ndjson")
 
 @router.get("/documents/{workspace_id}")
-def list_documents(workspace_id: uuid.UUID, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    docs = db.query(Document).filter_by(workspace_id=workspace_id).all()
-    return [{"id": d.id, "name": d.name, "uploaded_at": d.uploaded_at} for d in docs]
+def list_documents(
+    workspace_id: uuid.UUID,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    get_member_workspace(db, workspace_id, user)
+    # Workspace-level documents only; chat documents are listed per chat
+    query = db.query(Document.id, Document.name, Document.uploaded_at).filter(
+        Document.workspace_id == workspace_id, Document.chat_id.is_(None), Document.deleted_at.is_(None)
+    )
+    docs, next_cursor = keyset_page(query, Document.uploaded_at, Document.id, cursor, limit)
+    return FastJSONResponse({
+        "items": [
+            {"id": doc.id, "name": doc.name, "uploaded_at": doc.uploaded_at}
+            for doc in docs
+        ],
+        "next_cursor": next_cursor
+    })
 
 
 @router.delete("/documents/{doc_id}")
@@ -75,12 +135,15 @@ async def delete_document(
     user=Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    doc = db.query(Document).filter(Document.id == doc_id).first()
+    doc = db.query(Document).filter(
+        Document.id == doc_id, Document.chat_id.is_(None), Document.deleted_at.is_(None)
+    ).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
+    get_member_workspace(db, doc.workspace_id, user)
 
-    delete_document_vectors(doc.workspace_id, doc.name)
-
-    db.delete(doc)
+    # Hidden at once, in search too; vectors, file and row are removed by the reclaimer
+    doc.deleted_at = datetime.utcnow()
     db.commit()
+    await run_in_threadpool(reclaimer.document_deleted, doc)
     return {"status": "deleted", "message": f"{doc.name} removed."}
\ No newline at end of file
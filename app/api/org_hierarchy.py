@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from uuid import UUID
 from app.core.db import get_db
+from app.core.responses import FastJSONResponse
 from app.models.organization import Organization
 from app.models.department import Department
 from app.models.team import Team
@@ -10,6 +12,7 @@ from app.models.user import User
 from app.models.user_organization import UserOrganization
 from app.models.user_department import UserDepartment
 from app.models.user_team import UserTeam
+from app.services import provisioning
 from app.utils.auth_utils import get_current_user
 from pydantic import BaseModel
 
@@ -75,8 +78,8 @@ def create_organization(payload: OrgCreate, user=Depends(get_current_user), db:
 
 @router.get("/organization/list")
 def list_organizations(user=Depends(get_current_user), db: Session = Depends(get_db)):
-    orgs = db.query(Organization).join(UserOrganization).filter(UserOrganization.user_id == user.id).all()
-    return [{"id": o.id, "name": o.name} for o in orgs]
+    orgs = db.query(Organization.id, Organization.name).join(UserOrganization).filter(UserOrganization.user_id == user.id).all()
+    return FastJSONResponse([{"id": o.id, "name": o.name} for o in orgs])
 
 @router.post("/organization/{org_id}/add-user")
 def add_user_to_org(org_id: UUID, payload: UserAdd, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_org_role("admin"))):
@@ -100,8 +103,18 @@ def change_org_role(org_id: UUID, payload: RoleChange, user=Depends(get_current_
 
 @router.get("/organization/{org_id}/members")
 def list_org_members(org_id: UUID, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_org_role("admin"))):
-    assocs = db.query(UserOrganization).filter_by(organization_id=org_id).all()
-    return [{"user_id": a.user_id, "role": a.role} for a in assocs]
+    assocs = db.query(UserOrganization.user_id, UserOrganization.role).filter(UserOrganization.organization_id == org_id).all()
+    return FastJSONResponse([{"user_id": a.user_id, "role": a.role} for a in assocs])
+
+@router.post("/organization/{org_id}/import")
+async def import_organization(org_id: UUID, request: Request, dry_run: bool = False, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_org_role("admin"))):
+    # Departments, teams and memberships in bulk, as CSV (text/csv) or NDJSON rows of department, team, email, role
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    reader = await provisioning.read_records(request.stream(), fmt)
+    plan = await run_in_threadpool(provisioning.plan, db, org_id, reader, user.id)
+    if not dry_run:
+        await run_in_threadpool(provisioning.apply, db, plan)
+    return plan.summary(dry_run)
 
 # --- Department Endpoints ---
 @router.post("/department/create")
@@ -114,8 +127,8 @@ def create_department(payload: DeptCreate, user=Depends(get_current_user), db: S
 
 @router.get("/department/list/{org_id}")
 def list_departments(org_id: UUID, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    depts = db.query(Department).filter_by(organization_id=org_id).all()
-    return [{"id": d.id, "name": d.name} for d in depts]
+    depts = db.query(Department.id, Department.name).filter(Department.organization_id == org_id).all()
+    return FastJSONResponse([{"id": d.id, "name": d.name} for d in depts])
 
 @router.post("/department/{dept_id}/add-user")
 def add_user_to_dept(dept_id: UUID, payload: UserAdd, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_dept_role("admin"))):
@@ -138,8 +151,8 @@ def change_dept_role(dept_id: UUID, payload: RoleChange, user=Depends(get_curren
 
 @router.get("/department/{dept_id}/members")
 def list_dept_members(dept_id: UUID, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_dept_role("admin"))):
-    assocs = db.query(UserDepartment).filter_by(department_id=dept_id).all()
-    return [{"user_id": a.user_id, "role": a.role} for a in assocs]
+    assocs = db.query(UserDepartment.user_id, UserDepartment.role).filter(UserDepartment.department_id == dept_id).all()
+    return FastJSONResponse([{"user_id": a.user_id, "role": a.role} for a in assocs])
 
 # --- Team Endpoints ---
 @router.post("/team/create")
@@ -152,8 +165,8 @@ def create_team(payload: TeamCreate, user=Depends(get_current_user), db: Session
 
 @router.get("/team/list/{dept_id}")
 def list_teams(dept_id: UUID, user=Depends(get_current_user), db: Session = Depends(get_db)):
-    teams = db.query(Team).filter_by(department_id=dept_id).all()
-    return [{"id": t.id, "name": t.name} for t in teams]
+    teams = db.query(Team.id, Team.name).filter(Team.department_id == dept_id).all()
+    return FastJSONResponse([{"id": t.id, "name": t.name} for t in teams])
 
 @router.post("/team/{team_id}/add-user")
 def add_user_to_team(team_id: UUID, payload: UserAdd, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_team_role("admin"))):
@@ -176,5 +189,5 @@ def change_team_role(team_id: UUID, payload: RoleChange, user=Depends(get_curren
 
 @router.get("/team/{team_id}/members")
 def list_team_members(team_id: UUID, user=Depends(get_current_user), db: Session = Depends(get_db), perm=Depends(require_team_role("admin"))):
-    assocs = db.query(UserTeam).filter_by(team_id=team_id).all()
-    return [{"user_id": a.user_id, "role": a.role} for a in assocs] 
\ No newline at end of file
+    assocs = db.query(UserTeam.user_id, UserTeam.role).filter(UserTeam.team_id == team_id).all()
+    return FastJSONResponse([{"user_id": a.user_id, "role": a.role} for a in assocs]) 
\ No newline at end of file
@@ -1,6 +1,17 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.core.lifecycle import state
 router = APIRouter()
 
 @router.get("/")
 def root():
-    return {"status": "ok", "message": "Vrozart Chatbot API is running"}
\ No newline at end of file
+    return {"status": "ok", "message": "Vrozart Chatbot API is running"}
+
+@router.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+@router.get("/health/ready")
+def readiness():
+    snapshot = state.snapshot()
+    return JSONResponse(status_code=200 if snapshot["ready"] else 503, content=snapshot)
@@ -5,6 +5,7 @@ from app.core.db import get_db
 from app.models.workspace import Workspace
 from app.models.user import User
 from app.models.workspace_user import WorkspaceUser
+from app.models.user_organization import UserOrganization
 from app.schemas.workspace import WorkspaceCreate, WorkspaceOut
 from app.utils.auth_utils import get_current_user
 
@@ -16,8 +17,15 @@ def create_workspace(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    if payload.organization_id is not None:
+        member = db.query(UserOrganization).filter_by(
+            user_id=current_user.id, organization_id=payload.organization_id
+        ).first()
+        if not member:
+            raise HTTPException(status_code=403, detail="Not a member of this organization")
+
     # Just create the workspace
-    workspace = Workspace(name=payload.name)
+    workspace = Workspace(name=payload.name, organization_id=payload.organization_id)
     db.add(workspace)
     db.commit()
     db.refresh(workspace)
@@ -0,0 +1,103 @@
+import asyncio
+import json
+from typing import Callable, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import ADMISSION_IN_FLIGHT, ADMISSION_SHED
+
+# Expensive request classes; everything else is "cheap" (history, listings, auth)
+ROUTE_CLASSES = {
+    ("POST", "/chat/chat"): "generation",
+    ("POST", "/chat/upload-document"): "upload",
+    ("POST", "/chat/upload-documents"): "upload",
+    ("POST", "/files/upload"): "upload",
+    ("POST", "/files/upload-batch"): "upload",
+}
+EXEMPT_PREFIXES = ("/health", "/metrics")
+POLL_SECONDS = 0.05
+
+
+def classify(method: str, path: str) -> str:
+    return ROUTE_CLASSES.get((method, path.rstrip("/") or "/"), "cheap")
+
+
+class AdmissionControl:
+    """ASGI middleware that sheds load before the worker falls over.
+
+    Each request class has its own in-flight cap and queueing budget. Generations and uploads are also
+    refused while the DB pool or the embedding queue is under pressure, so history and listings keep
+    being served when new work is being turned away. Rejections are a fast 503 with Retry-After.
+    """
+
+    def __init__(self, app, pool_usage: Callable[[], Tuple[int, int]], embedding_queue_depth: Callable[[], int]):
+        self.app = app
+        self.pool_usage = pool_usage
+        self.embedding_queue_depth = embedding_queue_depth
+        self.in_flight = {"generation": 0, "upload": 0, "cheap": 0}
+        self._released: Optional[asyncio.Event] = None
+
+    def _refusal(self, request_class: str) -> Optional[str]:
+        if self.in_flight[request_class] >= settings.ADMISSION_MAX_IN_FLIGHT.get(request_class, 1 << 30):
+            return "in_flight"
+        checked_out, capacity = self.pool_usage()
+        if capacity and checked_out / capacity >= settings.ADMISSION_DB_POOL_SATURATION.get(request_class, 1.0):
+            return "db_pool"
+        if request_class != "cheap" and self.embedding_queue_depth() >= settings.ADMISSION_MAX_EMBEDDING_QUEUE:
+            return "embedding_queue"
+        return None
+
+    async def _admit(self, request_class: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.ADMISSION_MAX_WAIT_MS.get(request_class, 0) / 1000
+        while True:
+            reason = self._refusal(request_class)
+            if reason is None:
+                self.in_flight[request_class] += 1
+                ADMISSION_IN_FLIGHT.labels(request_class).set(self.in_flight[request_class])
+                return None
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return reason
+            # Woken early by a release; pool and embedding pressure have no events, so poll them too
+            if self._released is None:
+                self._released = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._released.wait(), min(remaining, POLL_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+
+    def _release(self, request_class: str):
+        self.in_flight[request_class] -= 1
+        ADMISSION_IN_FLIGHT.labels(request_class).set(self.in_flight[request_class])
+        if self._released is not None:
+            self._released.set()
+            self._released = None
+
+    async def _reject(self, send, reason: str):
+        body = json.dumps({"detail": f"Server busy ({reason}), retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(settings.ADMISSION_RETRY_AFTER_SECONDS).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.ADMISSION_ENABLED or scope["path"].startswith(EXEMPT_PREFIXES):
+            return await self.app(scope, receive, send)
+
+        request_class = classify(scope["method"], scope["path"])
+        reason = await self._admit(request_class)
+        if reason is not None:
+            ADMISSION_SHED.labels(request_class, reason).inc()
+            return await self._reject(send, reason)
+
+        # Streaming responses stay in flight until their last chunk is sent
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._release(request_class)
@@ -1,3 +1,4 @@
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 
@@ -13,6 +14,139 @@ class Settings(BaseSettings):
     VECTOR_DB_URL: str
     VECTOR_DB_COLLECTION: str
     VECTOR_DB_API_KEY: str
+    # Add workspace_id to chat-scoped searches; enable after app.services.tenant_migration has run
+    VECTOR_DB_TENANT_FILTER: bool = False
+
+    # Upstream endpoints; overridable to point at local stand-ins (see benchmarks/)
+    OPENAI_BASE_URL: str = ""
+    ANTHROPIC_BASE_URL: str = "https://api.anthropic.com"
+
+    # LLM routing: timeouts, concurrency limits (per worker), circuit breakers, fallback and hedging
+    LLM_MAX_TOKENS: int = 1024
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    LLM_READ_TIMEOUT_SECONDS: float = 60.0
+    LLM_PROVIDER_CONCURRENCY: Dict[str, int] = {"openai": 64, "anthropic": 64}
+    LLM_MODEL_CONCURRENCY: Dict[str, int] = {}
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    LLM_FALLBACKS: Dict[str, str] = {}
+    LLM_HEDGE_AFTER_MS: float = 0
+    LLM_SINGLE_FLIGHT: bool = False
+    LLM_SINGLE_FLIGHT_REPLAY_CHUNKS: int = 4096
+
+    # Response cache in Redis: exact (model + normalized prompt) and semantic (similar question, same context)
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_EXACT_TTL_SECONDS: int = 86400
+    LLM_CACHE_EXACT_MAX_ENTRIES: int = 10000
+    LLM_CACHE_SEMANTIC: bool = False
+    LLM_CACHE_SEMANTIC_THRESHOLD: float = 0.92
+    LLM_CACHE_SEMANTIC_TTL_SECONDS: int = 3600
+    LLM_CACHE_SEMANTIC_MAX_ENTRIES: int = 5000
+    LLM_CACHE_REPLAY_CHUNK_CHARS: int = 16
+
+    # Rate limits in Redis token buckets: level -> dimension -> [capacity, seconds to refill from empty]
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMITS: Dict[str, Dict[str, List[float]]] = {
+        "user": {
+            "requests": [60, 60],
+            "prompt_tokens": [200_000, 3600],
+            "completion_tokens": [100_000, 3600],
+            "upload_bytes": [200 * 1024 * 1024, 3600],
+        },
+        "workspace": {
+            "requests": [600, 60],
+            "prompt_tokens": [2_000_000, 3600],
+            "completion_tokens": [1_000_000, 3600],
+            "upload_bytes": [2 * 1024 * 1024 * 1024, 3600],
+        },
+        "organization": {
+            "requests": [3000, 60],
+            "prompt_tokens": [10_000_000, 3600],
+            "completion_tokens": [5_000_000, 3600],
+            "upload_bytes": [10 * 1024 * 1024 * 1024, 3600],
+        },
+    }
+
+    # Admission control (per worker): in-flight caps per request class, pressure thresholds, bounded queueing
+    ADMISSION_ENABLED: bool = False
+    ADMISSION_MAX_IN_FLIGHT: Dict[str, int] = {"generation": 128, "upload": 8, "cheap": 512}
+    ADMISSION_MAX_WAIT_MS: Dict[str, float] = {"generation": 250, "upload": 250, "cheap": 2000}
+    ADMISSION_MAX_EMBEDDING_QUEUE: int = 32
+    ADMISSION_DB_POOL_SATURATION: Dict[str, float] = {"generation": 0.8, "upload": 0.8, "cheap": 1.0}
+    ADMISSION_RETRY_AFTER_SECONDS: int = 2
+    CHAT_STREAM_TIMEOUT_SECONDS: float = 180.0
+
+    # Write-behind persistence of chat turns: batched inserts, optional local spool replayed on restart
+    MESSAGE_WRITE_BEHIND: bool = False
+    MESSAGE_WRITER_BATCH_SIZE: int = 200
+    MESSAGE_WRITER_FLUSH_MS: float = 100.0
+    MESSAGE_WRITER_MAX_PENDING: int = 10000
+    MESSAGE_WRITER_SPOOL_DIR: str = ""
+    MESSAGE_WRITER_FSYNC: bool = False
+    # Connection-level failures are retried with backoff this many times before the batch is written row by row
+    MESSAGE_WRITER_MAX_RETRIES: int = 8
+
+    # Background reclamation of logically deleted chats/documents, plus a periodic orphan sweep (0 = off)
+    RECLAIM_ENABLED: bool = True
+    RECLAIM_INTERVAL_SECONDS: float = 30.0
+    RECLAIM_BATCH_SIZE: int = 100
+    RECLAIM_SWEEP_INTERVAL_SECONDS: float = 0
+    RECLAIM_GRACE_SECONDS: float = 3600.0
+    RECLAIM_LOCK_TTL_SECONDS: float = 600.0
+
+    # Batch ingestion: files or a zip per request, parsed in parallel, chunks embedded in shared batches
+    INGEST_MAX_FILES: int = 500
+    INGEST_MAX_BYTES: int = 512 * 1024 * 1024
+    INGEST_PARSE_WORKERS: int = 4
+    INGEST_EMBED_BATCH_SIZE: int = 256
+    INGEST_UPSERT_BATCH_SIZE: int = 512
+
+    # Bulk organization provisioning: input size cap and rows per transaction
+    PROVISION_MAX_ROWS: int = 200_000
+    PROVISION_BATCH_SIZE: int = 1000
+
+    # Usage rollups (hourly/daily per user, workspace, organization), flushed from memory in batches
+    USAGE_ROLLUPS_ENABLED: bool = True
+    USAGE_FLUSH_SECONDS: float = 10.0
+
+    # JSON list responses: gzip when accepted and at least this large (0 = never), and the level used
+    RESPONSE_GZIP_MIN_BYTES: int = 1024
+    RESPONSE_GZIP_LEVEL: int = 5
+
+    # Speculative retrieval from the draft being typed (/chat/prefetch), reused when the sent message matches
+    PREFETCH_ENABLED: bool = False
+    PREFETCH_TTL_SECONDS: int = 30
+    PREFETCH_MIN_CHARS: int = 12
+    PREFETCH_MIN_INTERVAL_MS: int = 250
+    PREFETCH_MATCH_RATIO: float = 0.9
+
+    # Password hashing: bcrypt cost, dedicated process pool (0 = request threadpool) and its queue bound
+    PASSWORD_BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Startup: heavy clients are created lazily unless warmed up by the lifespan hook
+    WARMUP_ON_STARTUP: bool = True
+    WARMUP_BLOCKING: bool = False
+    WARMUP_COMPONENTS: str = "schema,redis,qdrant,encoder,llm"
+    WARMUP_MAX_WORKERS: int = 4
+    # Failed components (a dependency not up yet at boot) are retried in the background, backing off
+    # from WARMUP_RETRY_SECONDS up to WARMUP_RETRY_MAX_SECONDS; readiness stays false until they pass
+    WARMUP_RETRY_SECONDS: float = 1.0
+    WARMUP_RETRY_MAX_SECONDS: float = 30.0
+
+    # Embedding: inference backend, thread cap and optional per-host sidecar (Unix socket) owning the model
+    EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # torch | onnx | onnx-int8
+    EMBEDDING_ONNX_DIR: str = "models/onnx"
+    EMBEDDING_NUM_THREADS: int = 0
+    EMBEDDING_SIDECAR_SOCKET: str = ""
+    EMBEDDING_SIDECAR_MAX_BATCH: int = 64
+    EMBEDDING_SIDECAR_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_SIDECAR_TIMEOUT_SECONDS: float = 30.0
+    # How long a worker trusts its copy of the collection registry (blue/green re-embedding)
+    EMBEDDING_REGISTRY_TTL_SECONDS: float = 5.0
 
     class Config:
         env_file = ".env"
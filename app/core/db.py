@@ -8,6 +8,14 @@ SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
 
+def pool_usage():
+    # (checked out, capacity); pools without a fixed size (e.g. SQLite's) report no capacity
+    pool = engine.pool
+    if not hasattr(pool, "checkedout"):
+        return 0, 0
+    return pool.checkedout(), pool.size() + max(pool._max_overflow, 0)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -15,3 +23,8 @@ def get_db():
 
     finally:
         db.close()
+
+
+def init_schema():
+    import app.models  # noqa: F401 - registers every model on Base.metadata
+    Base.metadata.create_all(bind=engine)
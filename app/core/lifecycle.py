@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Captured as early as possible: main.py imports this module before anything heavy
+BOOT_STARTED = time.perf_counter()
+
+
+def _warm_schema():
+    from app.core.db import init_schema
+    init_schema()
+
+
+def _warm_redis():
+    from app.services.redis_cache import get_redis
+    get_redis().ping()
+
+
+def _warm_qdrant():
+    from app.services.vector_store import get_qdrant
+    get_qdrant().get_collections()
+
+
+def _warm_encoder():
+    from app.services.vector_store import get_encoder
+    get_encoder().encode("warmup")
+
+
+def _warm_llm():
+    from app.services.llm_router import get_openai_client
+    get_openai_client()
+
+
+WARMUP_TASKS = {
+    "schema": _warm_schema,
+    "redis": _warm_redis,
+    "qdrant": _warm_qdrant,
+    "encoder": _warm_encoder,
+    "llm": _warm_llm,
+}
+
+
+class LifecycleState:
+    def __init__(self):
+        self.components = {}
+        self.warmup_done = False
+        self.startup_ms = None
+        self.first_request_ms = None
+
+    def ready(self) -> bool:
+        return self.warmup_done and all(c["status"] == "ok" for c in self.components.values())
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready(),
+            "warmup_done": self.warmup_done,
+            "components": self.components,
+            "startup_ms": self.startup_ms,
+            "first_request_ms": self.first_request_ms,
+        }
+
+
+state = LifecycleState()
+
+
+def _run_component(name: str):
+    started = time.perf_counter()
+    try:
+        WARMUP_TASKS[name]()
+        state.components[name] = {"status": "ok", "ms": round((time.perf_counter() - started) * 1000, 1)}
+    except Exception as e:
+        logger.exception("Warmup of %s failed", name)
+        state.components[name] = {"status": "error", "error": str(e)}
+
+
+def warmup_components() -> list:
+    names = [n.strip() for n in settings.WARMUP_COMPONENTS.split(",") if n.strip()]
+    unknown = [n for n in names if n not in WARMUP_TASKS]
+    if unknown:
+        raise ValueError(f"Unknown warmup components: {', '.join(unknown)}")
+    return names
+
+
+async def warmup(names: list):
+    for name in names:
+        state.components[name] = {"status": "pending"}
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=settings.WARMUP_MAX_WORKERS, thread_name_prefix="warmup") as pool:
+        await asyncio.gather(*(loop.run_in_executor(pool, _run_component, name) for name in names))
+
+    state.warmup_done = True
+    logger.info("Warmup finished in %.0f ms: %s", (time.perf_counter() - BOOT_STARTED) * 1000, state.components)
+
+
+async def retry_failed():
+    """Retry failed components with backoff until all pass; readiness recovers without a restart."""
+    delay = settings.WARMUP_RETRY_SECONDS
+    loop = asyncio.get_running_loop()
+    while True:
+        failed = [name for name, c in state.components.items() if c["status"] == "error"]
+        if not failed:
+            return
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.WARMUP_RETRY_MAX_SECONDS)
+        # One at a time in the default executor: a handful of cheap probes, not the startup burst
+        for name in failed:
+            await loop.run_in_executor(None, _run_component, name)
+            if state.components[name]["status"] == "ok":
+                logger.info("Warmup of %s succeeded on retry", name)
+
+
+async def _warm_in_background(names: list):
+    await warmup(names)
+    await retry_failed()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        # Validated here, not in the background task: a typo fails startup instead of being lost
+        names = warmup_components()
+        if settings.WARMUP_BLOCKING:
+            await warmup(names)
+            warmup_task = asyncio.create_task(retry_failed())
+        else:
+            if "schema" in names:
+                # Tables must exist before the first request, whether or not readiness gates traffic
+                names.remove("schema")
+                await asyncio.get_running_loop().run_in_executor(None, _run_component, "schema")
+            # Serve liveness immediately; readiness flips once warmup completes
+            warmup_task = asyncio.create_task(_warm_in_background(names))
+    else:
+        state.warmup_done = True
+
+    if settings.MESSAGE_WRITE_BEHIND:
+        from app.services.message_writer import writer
+        writer.start()
+
+    reclaimer_task = None
+    if settings.RECLAIM_ENABLED:
+        from app.services import reclaimer
+        reclaimer_task = asyncio.create_task(reclaimer.run_forever())
+
+    usage_task = None
+    if settings.USAGE_ROLLUPS_ENABLED:
+        from app.services.usage import aggregator
+        usage_task = asyncio.create_task(aggregator.run_forever())
+
+    state.startup_ms = round((time.perf_counter() - BOOT_STARTED) * 1000, 1)
+    logger.info("Application startup took %.0f ms", state.startup_ms)
+
+    yield
+
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if reclaimer_task:
+        reclaimer_task.cancel()
+    from app.services import ingestion, password_hashing
+    ingestion.shutdown()
+    password_hashing.shutdown()
+    if usage_task:
+        # Cancelling runs its final flush; wait for it
+        usage_task.cancel()
+        await asyncio.gather(usage_task, return_exceptions=True)
+    if settings.MESSAGE_WRITE_BEHIND:
+        # Flush what is queued before the worker exits; anything left is still in the spool
+        await asyncio.get_running_loop().run_in_executor(None, writer.stop)
+
+
+class FirstRequestTimer:
+    """ASGI middleware that records the time from boot to the first served response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or state.first_request_ms is not None:
+            return await self.app(scope, receive, send)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.first_request_ms is None:
+                state.first_request_ms = round((time.perf_counter() - BOOT_STARTED) * 1000, 1)
+                logger.info("First request served %.0f ms after boot", state.first_request_ms)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,185 @@
+import contextvars
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+logger = logging.getLogger(__name__)
+
+# Carried through every log line and timing of a request so one chat turn can be followed end to end
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HTTP_LATENCY = Histogram(
+    "vrozart_http_request_seconds", "HTTP request latency until the response completes",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+STAGE_LATENCY = Histogram(
+    "vrozart_stage_seconds", "Latency of named request stages (chat.*, upload.*, embedding.*)",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+STAGE_ERRORS = Counter("vrozart_stage_errors_total", "Exceptions raised inside a stage", ["stage"])
+DEPENDENCY_LATENCY = Histogram(
+    "vrozart_dependency_seconds", "Latency of calls to Redis, Qdrant and other backing services",
+    ["dependency", "operation"], buckets=LATENCY_BUCKETS,
+)
+DEPENDENCY_ERRORS = Counter("vrozart_dependency_errors_total", "Failed backing service calls", ["dependency", "operation"])
+
+LLM_REQUESTS = Counter("vrozart_llm_requests_total", "Upstream LLM requests by outcome", ["provider", "model", "outcome"])
+LLM_TTFT = Histogram(
+    "vrozart_llm_time_to_first_token_seconds", "Upstream time to first streamed token",
+    ["provider", "model"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter("vrozart_llm_completion_chunks_total", "Streamed completion chunks (~tokens)", ["provider", "model"])
+LLM_TOKENS_PER_SECOND = Histogram(
+    "vrozart_llm_tokens_per_second", "Streaming rate after the first token",
+    ["provider", "model"], buckets=(1, 5, 10, 20, 40, 60, 80, 120, 160, 240, 320),
+)
+LLM_FALLBACKS = Counter("vrozart_llm_fallbacks_total", "Requests moved to a fallback model", ["from_model", "to_model"])
+LLM_HEDGES = Counter("vrozart_llm_hedges_total", "Hedged (duplicate) upstream requests started", ["model"])
+LLM_QUEUE_REJECTIONS = Counter("vrozart_llm_queue_rejections_total", "Requests that hit the concurrency queue deadline", ["scope"])
+LLM_SINGLE_FLIGHT = Counter(
+    "vrozart_llm_single_flight_total",
+    "Single-flight outcomes: leader opened the upstream, follower was coalesced onto it, bypass could not join",
+    ["role"],
+)
+LLM_CANCELLED_TOKENS = Counter(
+    "vrozart_llm_cancelled_tokens_total",
+    "Completion tokens not generated because the stream was cancelled (max_tokens minus streamed; an upper bound)",
+    ["provider", "model"],
+)
+CHAT_CANCELLED = Counter("vrozart_chat_cancelled_total", "Chat streams abandoned by the client before completion")
+LLM_CACHE = Counter("vrozart_llm_cache_total", "Response cache lookups by result", ["result"])
+LLM_BREAKER_OPEN = Counter("vrozart_llm_breaker_open_total", "Circuit breaker trips", ["model"])
+RATE_LIMITED = Counter("vrozart_rate_limited_total", "Requests rejected by a rate limit bucket", ["level", "dimension"])
+ADMISSION_IN_FLIGHT = Gauge("vrozart_admission_in_flight", "Admitted requests in flight by class", ["request_class"])
+ADMISSION_SHED = Counter(
+    "vrozart_admission_shed_total", "Requests rejected or cut short by admission control", ["request_class", "reason"]
+)
+PASSWORD_HASH_PENDING = Gauge("vrozart_password_hash_pending", "Password hashes and verifies running or queued")
+PASSWORD_HASH_REJECTED = Counter("vrozart_password_hash_rejected_total", "Sign-ins refused because the hash pool was full")
+PREFETCH_REQUESTS = Counter("vrozart_prefetch_requests_total", "Speculative retrievals by outcome", ["outcome"])
+PREFETCH_LOOKUPS = Counter("vrozart_prefetch_lookups_total", "Chat turns by prefetched retrieval result", ["result"])
+PREFETCH_SAVED = Histogram(
+    "vrozart_prefetch_saved_seconds", "Retrieval time taken off the critical path by a prefetch hit", buckets=LATENCY_BUCKETS
+)
+MESSAGE_FLUSH_LATENCY = Histogram(
+    "vrozart_message_flush_seconds", "Write-behind flush duration (insert + memory push)", buckets=LATENCY_BUCKETS
+)
+MESSAGE_FLUSH_BATCH = Histogram(
+    "vrozart_message_flush_batch_size", "Chat turns per write-behind flush", buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+MESSAGE_FLUSH_ERRORS = Counter("vrozart_message_flush_errors_total", "Failed write-behind flushes (retried)")
+MESSAGE_DEAD_LETTERED = Counter(
+    "vrozart_message_dead_lettered_total", "Chat turns the write-behind writer gave up on (dead-letter file or dropped)"
+)
+MESSAGE_WRITER_PENDING = Gauge("vrozart_message_writer_pending", "Chat turns waiting in the write-behind queue")
+RECLAIMED_POINTS = Counter("vrozart_reclaimed_points_total", "Vector points removed by the reclaimer", ["source"])
+RECLAIMED_BYTES = Counter("vrozart_reclaimed_bytes_total", "Upload bytes removed by the reclaimer", ["source"])
+
+DB_POOL_CHECKED_OUT = Gauge("vrozart_db_pool_checked_out", "Database connections currently checked out")
+DB_POOL_CAPACITY = Gauge("vrozart_db_pool_capacity", "Pool size plus allowed overflow")
+
+
+def _log_timing(kind: str, name: str, seconds: float):
+    logger.debug("request_id=%s %s=%s ms=%.1f", request_id_var.get(), kind, name, seconds * 1000)
+
+
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_LATENCY.labels(stage).observe(elapsed)
+        _log_timing("stage", stage, elapsed)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    _log_timing("stage", stage, seconds)
+
+
+@contextmanager
+def timed_dependency(dependency: str, operation: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        DEPENDENCY_ERRORS.labels(dependency, operation).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        DEPENDENCY_LATENCY.labels(dependency, operation).observe(elapsed)
+        _log_timing("dependency", f"{dependency}.{operation}", elapsed)
+
+
+def bind_db_pool(pool_usage):
+    # Read at scrape time (in-process registry; multiprocess mode does not collect callback gauges)
+    DB_POOL_CHECKED_OUT.set_function(lambda: pool_usage()[0])
+    DB_POOL_CAPACITY.set_function(lambda: pool_usage()[1])
+
+
+def render_metrics():
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,128}")
+
+
+class RequestContextMiddleware:
+    """Assigns a request id (or honours X-Request-ID), echoes it back and records request latency."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("utf-8", errors="replace")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            # Missing, or not safe to copy into logs and the response header
+            request_id = uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_LATENCY.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status)
+            ).observe(time.perf_counter() - started)
+            request_id_var.reset(token)
@@ -0,0 +1,55 @@
+import gzip
+
+import orjson
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from app.core.config import settings
+
+
+def _accepts_gzip(scope) -> bool:
+    # Accept-Encoding is a list of codings with optional q-values; q=0 refuses a coding, and "*"
+    # covers gzip only when gzip is not listed itself
+    qualities = {}
+    for name, value in scope.get("headers", ()):
+        if name != b"accept-encoding":
+            continue
+        for item in value.decode("latin-1").split(","):
+            coding, *params = [part.strip() for part in item.split(";")]
+            q = 1.0
+            for param in params:
+                key, _, number = param.partition("=")
+                if key.strip().lower() == "q":
+                    try:
+                        q = float(number)
+                    except ValueError:
+                        q = 0.0
+            if coding:
+                qualities[coding.lower()] = q
+    q = qualities.get("gzip", qualities.get("*", 0.0))
+    return q > 0
+
+
+class FastJSONResponse(Response):
+    """JSON encoded by orjson (UUIDs and datetimes natively), gzipped when the client accepts it and the
+    body is at least RESPONSE_GZIP_MIN_BYTES.
+
+    Returned directly from an endpoint it also skips FastAPI's jsonable_encoder and response model
+    validation, so it is meant for output built from our own rows.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+    async def __call__(self, scope, receive, send):
+        # Small bodies are not worth the CPU or the extra header
+        if settings.RESPONSE_GZIP_MIN_BYTES and len(self.body) >= settings.RESPONSE_GZIP_MIN_BYTES:
+            self.headers.add_vary_header("Accept-Encoding")
+            if _accepts_gzip(scope):
+                # A page of history compresses in milliseconds: off the event loop (zlib releases the GIL)
+                self.body = await run_in_threadpool(gzip.compress, self.body, settings.RESPONSE_GZIP_LEVEL)
+                self.headers["Content-Encoding"] = "gzip"
+                self.headers["Content-Length"] = str(len(self.body))
+        await super().__call__(scope, receive, send)
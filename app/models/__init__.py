@@ -1,4 +1,14 @@
 from .user import User
 from .workspace import Workspace
 from .workspace_user import WorkspaceUser
-from .message import Message
\ No newline at end of file
+from .message import Message
+from .chat import Chat
+from .document import Document
+from .organization import Organization
+from .department import Department
+from .team import Team
+from .user_organization import UserOrganization
+from .user_department import UserDepartment
+from .user_team import UserTeam
+from .embedding_collection import EmbeddingCollection
+from .usage_rollup import UsageRollup
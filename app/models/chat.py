@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, ForeignKey, DateTime
+from sqlalchemy import Column, String, ForeignKey, DateTime, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from app.core.db import Base
@@ -14,8 +14,15 @@ class Chat(Base):
     model = Column(String)
     title = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Logical delete: set by the API, the row is reclaimed in the background (app.services.reclaimer)
+    deleted_at = Column(DateTime, nullable=True, index=True)
 
     user = relationship("User")
     workspace = relationship("Workspace", back_populates="chats")
     messages = relationship("Message", back_populates="chat", cascade="all, delete")
     documents = relationship("Document", back_populates="chat", cascade="all, delete")
+
+    __table_args__ = (
+        # Chat listing: WHERE workspace_id = ? AND user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_chats_workspace_user_created", "workspace_id", "user_id", "created_at", "id"),
+    )
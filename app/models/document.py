@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, BigInteger
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -10,8 +10,20 @@ class Document(Base):
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id"))
+    # Set for every document; chat_id is empty for workspace-level documents
+    workspace_id = Column(UUID(as_uuid=True), ForeignKey("workspaces.id"))
     name = Column(String, nullable=False)
     path = Column(String, nullable=False)
+    # Usage capture: who uploaded it and how large it was
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
+    # Logical delete: set by the API, the row is reclaimed in the background (app.services.reclaimer)
+    deleted_at = Column(DateTime, nullable=True, index=True)
 
     chat = relationship("Chat", back_populates="documents")
+
+    __table_args__ = (
+        Index("ix_documents_chat_id_uploaded", "chat_id", "uploaded_at", "id"),
+        Index("ix_documents_workspace_uploaded", "workspace_id", "uploaded_at", "id"),
+    )
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, Integer, Boolean, DateTime
+from datetime import datetime
+from app.core.db import Base
+
+class EmbeddingCollection(Base):
+    """A Qdrant collection and the embedding model its vectors come from (see app.services.reembedding)."""
+    __tablename__ = "embedding_collections"
+
+    name = Column(String, primary_key=True)
+    model = Column(String, nullable=False)
+    dimension = Column(Integer, nullable=False)
+    # building -> active -> previous -> retired; writes go to every collection that is not retired,
+    # searches only to the active one
+    status = Column(String, nullable=False, index=True)
+    # Resumable backfill from the active collection: next point id to copy and points copied so far
+    backfill_offset = Column(String, nullable=True)
+    backfill_done = Column(Boolean, default=False)
+    copied = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    activated_at = Column(DateTime, nullable=True)
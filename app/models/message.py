@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Index, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -13,7 +13,18 @@ class Message(Base):
     chat_id = Column(UUID(as_uuid=True), ForeignKey("chats.id"))  
     content = Column(Text)
     response = Column(Text)
+    # "complete"; "cancelled" (client left) or "timeout" (stream deadline) keep only a partial response
+    status = Column(String, nullable=False, default="complete", server_default="complete")
+    # Usage capture (estimated tokens); both are 0 for answers served from the response cache
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="messages")
     chat = relationship("Chat", back_populates="messages") 
+
+    __table_args__ = (
+        # Keyset pagination / export of a chat's history: WHERE chat_id = ? ORDER BY created_at, id
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at", "id"),
+    )
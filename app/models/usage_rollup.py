@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, DateTime, BigInteger
+from sqlalchemy.dialects.postgresql import UUID
+from app.core.db import Base
+
+class UsageRollup(Base):
+    """Usage of one user, workspace or organization in one hour or day, maintained by app.services.usage."""
+    __tablename__ = "usage_rollups"
+
+    # Key order serves the analytics query: one subject's buckets of one granularity over a time range
+    level = Column(String, primary_key=True)  # user | workspace | organization
+    subject_id = Column(UUID(as_uuid=True), primary_key=True)
+    granularity = Column(String, primary_key=True)  # hour | day
+    bucket_start = Column(DateTime, primary_key=True)
+    turns = Column(BigInteger, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    documents = Column(BigInteger, nullable=False, default=0)
+    bytes_ingested = Column(BigInteger, nullable=False, default=0)
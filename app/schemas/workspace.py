@@ -1,12 +1,15 @@
 from pydantic import BaseModel
 from uuid import UUID
+from typing import Optional
 
 class WorkspaceCreate(BaseModel):
     name: str
+    organization_id: Optional[UUID] = None
 
 class WorkspaceOut(BaseModel):
     id: UUID
     name: str
+    organization_id: Optional[UUID] = None
 
     class Config:
         from_attributes = True
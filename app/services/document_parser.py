@@ -3,31 +3,37 @@ from docx import Document as DocxDocument  # python-docx for DOCX
 from fastapi import UploadFile
 import io
 
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
 async def extract_text_from_file(file: UploadFile) -> str:
-    filename = file.filename.lower()
-
-    if filename.endswith(".pdf"):
-        return await extract_pdf(file)
-    elif filename.endswith(".docx"):
-        return await extract_docx(file)
-    elif filename.endswith(".txt"):
-        return await extract_txt(file)
+    contents = await file.read()
+    return extract_text_from_bytes(file.filename, contents)
+
+
+# Synchronous so batch uploads can parse many files in a worker pool
+def extract_text_from_bytes(filename: str, contents: bytes) -> str:
+    name = filename.lower()
+
+    if name.endswith(".pdf"):
+        return extract_pdf(contents)
+    elif name.endswith(".docx"):
+        return extract_docx(contents)
+    elif name.endswith(".txt"):
+        return extract_txt(contents)
     else:
         raise ValueError("Unsupported file format. Only PDF, DOCX, and TXT supported.")
 
-async def extract_pdf(file: UploadFile) -> str:
-    contents = await file.read()
+def extract_pdf(contents: bytes) -> str:
     doc = fitz.open(stream=contents, filetype="pdf")
     text = ""
     for page in doc:
         text += page.get_text()
     return text.strip()
 
-async def extract_docx(file: UploadFile) -> str:
-    contents = await file.read()
+def extract_docx(contents: bytes) -> str:
     docx = DocxDocument(io.BytesIO(contents))
     return "\n".join([para.text for para in docx.paragraphs]).strip()
 
-async def extract_txt(file: UploadFile) -> str:
-    contents = await file.read()
+def extract_txt(contents: bytes) -> str:
     return contents.decode("utf-8").strip()
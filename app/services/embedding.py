@@ -0,0 +1,40 @@
+import os
+from app.core.config import settings
+
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# Model of a fresh install; once re-embedded, the active collection in the registry decides
+EMBEDDING_MODEL = settings.EMBEDDING_MODEL
+
+
+def apply_thread_limits():
+    # Several workers per host each defaulting to one torch thread per core oversubscribe the CPU
+    if settings.EMBEDDING_NUM_THREADS > 0:
+        import torch
+        torch.set_num_threads(settings.EMBEDDING_NUM_THREADS)
+
+
+def load_local_encoder(model_name: str):
+    backend = settings.EMBEDDING_BACKEND
+    if backend in ("onnx", "onnx-int8"):
+        from app.services.onnx_encoder import load_onnx_encoder
+        return load_onnx_encoder(
+            model_name,
+            settings.EMBEDDING_ONNX_DIR,
+            quantized=backend == "onnx-int8",
+            num_threads=settings.EMBEDDING_NUM_THREADS,
+        )
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND: {backend}")
+
+    from sentence_transformers import SentenceTransformer
+    apply_thread_limits()
+    return SentenceTransformer(model_name)
+
+
+def load_encoder(model_name: str):
+    # The sidecar serves the configured model; another one (a re-embedding target) is loaded in-process
+    if settings.EMBEDDING_SIDECAR_SOCKET and model_name == settings.EMBEDDING_MODEL:
+        from app.services.embedding_client import SidecarEncoder
+        return SidecarEncoder(settings.EMBEDDING_SIDECAR_SOCKET)
+    return load_local_encoder(model_name)
@@ -0,0 +1,89 @@
+import socket
+import struct
+import threading
+from typing import List, Union
+
+import numpy as np
+import orjson
+
+# Wire format (both directions): 4-byte big-endian length + payload.
+# Request payload: JSON list of strings.
+# Response payload: rows (uint32) + dim (uint32) + rows*dim float32, or rows == ERROR_ROWS + utf-8 message.
+HEADER = struct.Struct(">I")
+SHAPE = struct.Struct(">II")
+ERROR_ROWS = 0xFFFFFFFF
+
+
+class SidecarError(RuntimeError):
+    pass
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding sidecar closed the connection")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def encode_response(vectors: np.ndarray) -> bytes:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    payload = SHAPE.pack(*vectors.shape) + vectors.tobytes()
+    return HEADER.pack(len(payload)) + payload
+
+
+def encode_error(message: str) -> bytes:
+    payload = SHAPE.pack(ERROR_ROWS, 0) + message.encode()
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode_response(payload: bytes) -> np.ndarray:
+    rows, dim = SHAPE.unpack_from(payload)
+    if rows == ERROR_ROWS:
+        raise SidecarError(payload[SHAPE.size:].decode())
+    return np.frombuffer(payload, dtype=np.float32, offset=SHAPE.size).reshape(rows, dim)
+
+
+class SidecarEncoder:
+    """Drop-in for SentenceTransformer.encode that delegates to the per-host embedding sidecar."""
+
+    def __init__(self, socket_path: str, timeout: float = None):
+        from app.core.config import settings
+        self.socket_path = socket_path
+        self.timeout = timeout if timeout is not None else settings.EMBEDDING_SIDECAR_TIMEOUT_SECONDS
+        # Endpoints run in a threadpool, so each thread keeps its own connection
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        sock = getattr(self._local, "sock", None) or self._connect()
+        payload = orjson.dumps(texts)
+        sock.sendall(HEADER.pack(len(payload)) + payload)
+        (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+        return decode_response(_recv_exact(sock, size))
+
+    def encode(self, sentences: Union[str, List[str]], **kwargs) -> np.ndarray:
+        # Batch sizing happens in the sidecar, across all connected workers
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        try:
+            vectors = self._request(texts)
+        except (ConnectionError, OSError):
+            # Sidecar restarted or idle connection dropped: reconnect once
+            self._close()
+            vectors = self._request(texts)
+        return vectors[0] if single else vectors
@@ -0,0 +1,123 @@
+"""Per-host embedding sidecar.
+
+Owns the single copy of the embedding model on a host and serves encode requests from the
+API workers over a Unix socket, merging concurrent requests into shared batches.
+
+    python -m app.services.embedding_server --socket /run/vrozart/embed.sock
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import orjson
+
+from app.core.config import settings
+from app.services.embedding import EMBEDDING_MODEL, load_local_encoder
+from app.services.embedding_client import HEADER, encode_error, encode_response
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingServer:
+    def __init__(self, encoder, max_batch: int, max_wait_ms: float):
+        self.encoder = encoder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # One inference thread: parallelism comes from torch's intra-op threads
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                (size,) = HEADER.unpack(header)
+                texts = orjson.loads(await reader.readexactly(size))
+
+                future = asyncio.get_running_loop().create_future()
+                await self.queue.put((texts, future))
+                try:
+                    writer.write(encode_response(await future))
+                except Exception as e:
+                    writer.write(encode_error(str(e)))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            writer.close()
+
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            total = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+
+            # Keep collecting requests until the batch is full or the wait window closes
+            while total < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                total += len(item[0])
+
+            texts = [t for item_texts, _ in pending for t in item_texts]
+            started = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(
+                    self.executor,
+                    lambda: self.encoder.encode(texts, batch_size=self.max_batch, convert_to_numpy=True),
+                )
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            logger.debug("Encoded %d texts from %d requests in %.1f ms",
+                         len(texts), len(pending), (time.perf_counter() - started) * 1000)
+            offset = 0
+            for item_texts, future in pending:
+                if not future.done():
+                    future.set_result(np.asarray(vectors[offset:offset + len(item_texts)]))
+                offset += len(item_texts)
+
+
+async def serve(socket_path: str, model_name: str):
+    encoder = load_local_encoder(model_name)
+    server = EmbeddingServer(encoder, settings.EMBEDDING_SIDECAR_MAX_BATCH, settings.EMBEDDING_SIDECAR_MAX_WAIT_MS)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    unix_server = await asyncio.start_unix_server(server.handle, path=socket_path)
+    os.chmod(socket_path, 0o660)
+    logger.info("Embedding sidecar serving %s on %s", model_name, socket_path)
+
+    batcher = asyncio.create_task(server.batcher())
+    try:
+        async with unix_server:
+            await unix_server.serve_forever()
+    finally:
+        batcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the embedding model to local API workers")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SIDECAR_SOCKET or "/tmp/vrozart-embed.sock")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(args.socket, args.model))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.metrics import timed
+from app.models.document import Document
+from app.services import vector_store
+from app.services.document_parser import SUPPORTED_EXTENSIONS, extract_text_from_bytes
+from app.services.usage import aggregator as usage
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    # Parsing PDFs and DOCX is CPU-bound Python: processes, not threads. Spawned, so the workers do not
+    # inherit the server's threads, clients or model
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.INGEST_PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def read_uploads(files: List[UploadFile]) -> List[Tuple[str, bytes]]:
+    """Read a batch into memory, refusing it up front (413) when it is over the batch limits."""
+    if len(files) > settings.INGEST_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.INGEST_MAX_FILES} files per batch")
+    if sum(file.size or 0 for file in files) > settings.INGEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch larger than {settings.INGEST_MAX_BYTES} bytes")
+    return [(file.filename, await file.read()) for file in files]
+
+
+def safe_filename(name: Optional[str]) -> str:
+    # Upload and member names become paths under the upload dir: keep only the last component
+    # (clients and zip tools use either separator); "" when nothing usable is left
+    name = os.path.basename((name or "").replace("\\", "/"))
+    return "" if name in (".", "..") else name
+
+
+def _expand(batch: List[Tuple[str, bytes]]):
+    """Unpack zip archives into their supported members. Returns (files, errors)."""
+    files, errors = [], []
+    total = 0
+    for name, contents in batch:
+        safe = safe_filename(name)
+        if not safe:
+            errors.append((name or "", "Invalid file name"))
+            continue
+        name = safe
+        if not name.lower().endswith(".zip"):
+            files.append((name, contents))
+            total += len(contents)
+            continue
+        try:
+            with zipfile.ZipFile(io.BytesIO(contents)) as archive:
+                for info in archive.infolist():
+                    member = safe_filename(info.filename)
+                    if info.is_dir() or not member or info.filename.startswith("__MACOSX/"):
+                        continue
+                    if not member.lower().endswith(SUPPORTED_EXTENSIONS):
+                        errors.append((member, "Unsupported file format. Only PDF, DOCX, and TXT supported."))
+                        continue
+                    # Declared sizes are checked before inflating anything
+                    if total + info.file_size > settings.INGEST_MAX_BYTES:
+                        errors.append((member, f"Batch larger than {settings.INGEST_MAX_BYTES} bytes"))
+                        continue
+                    try:
+                        data = archive.read(info)
+                    except NotImplementedError as e:
+                        # Before RuntimeError, its base class
+                        errors.append((member, f"Unsupported compression: {e}"))
+                        continue
+                    except RuntimeError as e:
+                        # Encrypted member: zipfile needs a password
+                        errors.append((member, f"Cannot read archive member: {e}"))
+                        continue
+                    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                        errors.append((member, f"Corrupt archive member: {e}"))
+                        continue
+                    total += info.file_size
+                    files.append((member, data))
+        except zipfile.BadZipFile as e:
+            errors.append((name, f"Invalid zip archive: {e}"))
+
+    if len(files) > settings.INGEST_MAX_FILES:
+        errors.extend((name, f"At most {settings.INGEST_MAX_FILES} files per batch") for name, _ in files[settings.INGEST_MAX_FILES:])
+        files = files[:settings.INGEST_MAX_FILES]
+
+    # Later files with a name already in the batch would overwrite the earlier ones on disk
+    unique, seen = [], set()
+    for name, contents in files:
+        if name in seen:
+            errors.append((name, "Duplicate file name in batch"))
+        else:
+            seen.add(name)
+            unique.append((name, contents))
+    return unique, errors
+
+
+def _save(path: str, contents: bytes):
+    with open(path, "wb") as f:
+        f.write(contents)
+
+
+async def _parse(loop, pool, name: str, contents: bytes):
+    try:
+        return name, contents, await loop.run_in_executor(pool, extract_text_from_bytes, name, contents), None
+    except Exception as e:
+        return name, contents, None, str(e)
+
+
+async def ingest(
+    batch: List[Tuple[str, bytes]], upload_dir: str, user_id, chat_id, workspace_id, organization_id
+) -> AsyncIterator[dict]:
+    """Parse, store and embed a batch of files, yielding a progress event per file and step.
+
+    A file that fails to parse or save is reported and skipped; the rest of the batch carries on.
+    Embedding is shared by the whole batch, and every Document row is inserted in one transaction.
+    """
+    # Inflating archives is up to INGEST_MAX_BYTES of CPU work: keep it off the event loop
+    files, errors = await run_in_threadpool(_expand, batch)
+    for name, error in errors:
+        yield {"file": name, "status": "error", "error": error}
+
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    parsing = [asyncio.ensure_future(_parse(loop, pool, name, contents)) for name, contents in files]
+    os.makedirs(upload_dir, exist_ok=True)
+
+    parsed = []
+    try:
+        with timed("upload.parse"):
+            for future in asyncio.as_completed(parsing):
+                name, contents, text, error = await future
+                if error is None and not text:
+                    error = "No extractable text"
+                if error is None:
+                    path = os.path.join(upload_dir, name)
+                    try:
+                        await run_in_threadpool(_save, path, contents)
+                    except OSError as e:
+                        error = str(e)
+                if error is not None:
+                    yield {"file": name, "status": "error", "error": error}
+                    continue
+                parsed.append((name, path, text, len(contents)))
+                yield {"file": name, "status": "parsed"}
+    finally:
+        # The client went away mid-batch
+        for future in parsing:
+            future.cancel()
+
+    stored = []
+    if parsed:
+        try:
+            with timed("upload.embed"):
+                point_ids = await run_in_threadpool(
+                    vector_store.embed_and_store_many,
+                    [(text, chat_id, name, workspace_id, organization_id) for name, _, text, _ in parsed],
+                )
+            stored = await run_in_threadpool(_persist, parsed, point_ids, user_id, chat_id, workspace_id)
+            usage.record_upload(user_id, workspace_id, organization_id, len(parsed), sum(p[3] for p in parsed))
+        except Exception as e:
+            logger.exception("Batch ingestion of %d files failed", len(parsed))
+            for name, *_ in parsed:
+                yield {"file": name, "status": "error", "error": str(e)}
+
+    for name, chunks in stored:
+        yield {"file": name, "status": "stored", "chunks": chunks}
+    yield {
+        "status": "done",
+        "stored": len(stored),
+        "failed": len(errors) + len(files) - len(stored),
+    }
+
+
+def _persist(parsed, point_ids, user_id, chat_id, workspace_id):
+    db = SessionLocal()
+    try:
+        with timed("upload.persist"):
+            now = datetime.utcnow()
+            db.add_all([
+                Document(
+                    chat_id=chat_id, workspace_id=workspace_id, user_id=user_id, name=name, path=path,
+                    size_bytes=size_bytes, uploaded_at=now,
+                )
+                for name, path, _, size_bytes in parsed
+            ])
+            db.commit()
+    except Exception:
+        db.rollback()
+        # Without their rows the vectors would only be found by the reclaimer's sweep
+        vector_store.delete_points([i for ids in point_ids for i in ids])
+        raise
+    finally:
+        db.close()
+    return [(name, len(ids)) for (name, *_), ids in zip(parsed, point_ids)]
+
+
+async def ndjson(events: AsyncIterator[dict]):
+    async for event in events:
+        yield orjson.dumps(event) + b"\n"
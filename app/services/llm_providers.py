@@ -0,0 +1,130 @@
+import json
+import os
+from typing import AsyncGenerator
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+
+CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
+OPENAI_PREFIXES = ("gpt", "chatgpt", "o1", "o3", "o4")
+ANTHROPIC_PREFIXES = ("claude",)
+
+
+class LLMError(Exception):
+    pass
+
+
+class UnknownModelError(LLMError, ValueError):
+    pass
+
+
+class ProviderUnavailable(LLMError):
+    """Transient failure (rate limit, 5xx, timeout, open breaker, full queue): another model may serve the request."""
+
+
+def provider_for(model: str) -> str:
+    if model.startswith(OPENAI_PREFIXES):
+        return "openai"
+    if model.startswith(ANTHROPIC_PREFIXES):
+        return "anthropic"
+    raise UnknownModelError(f"Unknown model: {model}")
+
+
+def _timeout() -> httpx.Timeout:
+    # read is the longest allowed gap between two streamed chunks, not the whole generation
+    return httpx.Timeout(
+        connect=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+        read=settings.LLM_READ_TIMEOUT_SECONDS,
+        write=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+        pool=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+    )
+
+
+_openai_client = None
+_anthropic_client = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    global _openai_client
+    if _openai_client is None:
+        # Retries are the router's job (fallback / hedging), not the SDK's
+        _openai_client = AsyncOpenAI(
+            api_key=os.getenv("CHATGPT_API_KEY"),
+            base_url=settings.OPENAI_BASE_URL or None,
+            timeout=_timeout(),
+            max_retries=0,
+        )
+    return _openai_client
+
+
+def get_anthropic_client() -> httpx.AsyncClient:
+    global _anthropic_client
+    if _anthropic_client is None:
+        _anthropic_client = httpx.AsyncClient(base_url=settings.ANTHROPIC_BASE_URL, timeout=_timeout())
+    return _anthropic_client
+
+
+async def stream_openai(model: str, prompt: str) -> AsyncGenerator[str, None]:
+    try:
+        stream = await get_openai_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=settings.LLM_MAX_TOKENS,
+            stream=True,
+        )
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+    except (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError) as e:
+        raise ProviderUnavailable(f"{model}: {e}") from e
+    except openai.APIStatusError as e:
+        raise LLMError(f"{model}: {e}") from e
+
+
+async def stream_anthropic(model: str, prompt: str) -> AsyncGenerator[str, None]:
+    headers = {
+        "x-api-key": CLAUDE_API_KEY,
+        "anthropic-version": "2023-06-01",
+        "content-type": "application/json"
+    }
+    body = {
+        "model": model,
+        "max_tokens": settings.LLM_MAX_TOKENS,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": True
+    }
+
+    try:
+        async with get_anthropic_client().stream("POST", "/v1/messages", headers=headers, json=body) as r:
+            if r.status_code == 429 or r.status_code >= 500:
+                raise ProviderUnavailable(f"{model}: HTTP {r.status_code}")
+            if r.status_code >= 400:
+                detail = (await r.aread()).decode(errors="replace")
+                raise LLMError(f"{model}: HTTP {r.status_code}: {detail}")
+
+            async for line in r.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event.get("type") == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                    yield event["delta"]["text"]
+                elif event.get("type") == "error":
+                    error = event.get("error", {})
+                    if error.get("type") in ("overloaded_error", "rate_limit_error", "api_error"):
+                        raise ProviderUnavailable(f"{model}: {error.get('message')}")
+                    raise LLMError(f"{model}: {error.get('message')}")
+    except (httpx.TimeoutException, httpx.TransportError) as e:
+        raise ProviderUnavailable(f"{model}: {e!r}") from e
+
+
+PROVIDERS = {
+    "openai": stream_openai,
+    "anthropic": stream_anthropic,
+}
@@ -1,68 +1,269 @@
-import openai
-import httpx
-import os
-from typing import AsyncGenerator
-from openai import OpenAI
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import aclosing, asynccontextmanager, suppress
+from typing import AsyncGenerator, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import (
+    LLM_BREAKER_OPEN,
+    LLM_CANCELLED_TOKENS,
+    LLM_FALLBACKS,
+    LLM_HEDGES,
+    LLM_QUEUE_REJECTIONS,
+    LLM_REQUESTS,
+    LLM_TOKENS,
+    LLM_TOKENS_PER_SECOND,
+    LLM_TTFT,
+)
+from app.services.llm_providers import (
+    PROVIDERS,
+    LLMError,
+    ProviderUnavailable,
+    UnknownModelError,
+    get_openai_client,
+    provider_for,
+)
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyLimit:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            LLM_QUEUE_REJECTIONS.labels(self.name).inc()
+            raise ProviderUnavailable(f"{self.name}: no free slot within {timeout:.0f}s")
+
+    def release(self):
+        self._semaphore.release()
+
+    @property
+    def in_use(self) -> int:
+        return self.limit - self._semaphore._value
+
+
+class CircuitBreaker:
+    """Opens after N consecutive transient failures; while open, lets one probe through per reset period."""
+
+    def __init__(self, model: str, failures: int, reset_seconds: float):
+        self.model = model
+        self.threshold = failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.opened_at is None:
+                LLM_BREAKER_OPEN.labels(self.model).inc()
+                logger.warning("Circuit breaker open for %s after %d failures", self.model, self.failures)
+            self.opened_at = time.monotonic()
+
+
+_limits: Dict[str, ConcurrencyLimit] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _limit(scope: str, limit: int) -> ConcurrencyLimit:
+    if scope not in _limits:
+        _limits[scope] = ConcurrencyLimit(scope, limit)
+    return _limits[scope]
+
+
+def _breaker(model: str) -> CircuitBreaker:
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(model, settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS)
+    return _breakers[model]
+
+
+@asynccontextmanager
+async def _slot(provider: str, model: str):
+    # Provider slot first, then model slot; both are released when the stream is closed
+    limits = [_limit(f"provider:{provider}", settings.LLM_PROVIDER_CONCURRENCY.get(provider, 64))]
+    if model in settings.LLM_MODEL_CONCURRENCY:
+        limits.append(_limit(f"model:{model}", settings.LLM_MODEL_CONCURRENCY[model]))
+
+    deadline = time.monotonic() + settings.LLM_QUEUE_TIMEOUT_SECONDS
+    acquired = []
+    try:
+        for limit in limits:
+            await limit.acquire(max(deadline - time.monotonic(), 0.001))
+            acquired.append(limit)
+        yield
+    finally:
+        for limit in reversed(acquired):
+            limit.release()
+
+
+async def _attempt(model: str, prompt: str) -> AsyncGenerator[str, None]:
+    provider = provider_for(model)
+    breaker = _breaker(model)
+    if not breaker.allow():
+        raise ProviderUnavailable(f"{model}: circuit open")
+
+    async with _slot(provider, model):
+        healthy = False
+        try:
+            async for chunk in PROVIDERS[provider](model, prompt):
+                if not healthy:
+                    healthy = True
+                    breaker.record_success()
+                yield chunk
+        except ProviderUnavailable:
+            breaker.record_failure()
+            raise
+
+
+class _Attempt:
+    def __init__(self, model: str, prompt: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self.stream = _attempt(model, prompt)
+        self.first = asyncio.ensure_future(self.stream.__anext__())
+
+    async def cancel(self):
+        self.first.cancel()
+        with suppress(BaseException):
+            await self.first
+        await self.stream.aclose()
+
+
+def _candidates(model: str) -> List[str]:
+    chain = [model]
+    while chain[-1] in settings.LLM_FALLBACKS and len(chain) < 4:
+        fallback = settings.LLM_FALLBACKS[chain[-1]]
+        if fallback in chain:
+            break
+        provider_for(fallback)
+        chain.append(fallback)
+    return chain
+
+
+async def _open(model: str, prompt: str):
+    """Start upstream attempts until one produces its first chunk.
+
+    Falls back along LLM_FALLBACKS on transient errors. With LLM_HEDGE_AFTER_MS set, a second attempt
+    (next fallback, or the same model) starts when the first is slow to answer; the loser is cancelled.
+    """
+    queue = _candidates(model)
+    running = [_Attempt(queue.pop(0), prompt)]
+    hedge_after = settings.LLM_HEDGE_AFTER_MS / 1000
+    hedged = False
+    last_error: Optional[BaseException] = None
+
+    try:
+        while running:
+            timeout = hedge_after if hedge_after > 0 and not hedged else None
+            done, _ = await asyncio.wait({a.first for a in running}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                hedge_model = queue.pop(0) if queue else running[0].model
+                LLM_HEDGES.labels(hedge_model).inc()
+                running.append(_Attempt(hedge_model, prompt))
+                continue
+
+            for attempt in [a for a in running if a.first in done]:
+                running.remove(attempt)
+                error = attempt.first.exception()
+                if error is None or isinstance(error, StopAsyncIteration):
+                    first_chunk = None if error else attempt.first.result()
+                    return attempt, first_chunk
+                if not isinstance(error, ProviderUnavailable):
+                    raise error
+                logger.warning("LLM attempt on %s failed: %s", attempt.model, error)
+                last_error = error
+
+            if not running and queue:
+                LLM_FALLBACKS.labels(model, queue[0]).inc()
+                running.append(_Attempt(queue.pop(0), prompt))
+    finally:
+        for attempt in running:
+            await attempt.cancel()
+
+    raise last_error or ProviderUnavailable(f"{model}: no provider available")
+
+
+_single_flight = SingleFlight(settings.LLM_SINGLE_FLIGHT_REPLAY_CHUNKS)
 
-# Initialize OpenAI client
-openai_client = OpenAI(api_key=os.getenv("CHATGPT_API_KEY"))
-CLAUDE_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
 async def stream_chat_response(model: str, prompt: str) -> AsyncGenerator[str, None]:
-    if model.startswith("gpt"):
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            stream=True
-        )
-        for chunk in response:
-            content = chunk.choices[0].delta.content
-            if content:
-                yield content
-
-    elif model.startswith("claude"):
-        headers = {
-            "x-api-key": CLAUDE_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        body = {
-            "model": model,
-            "max_tokens": 1024,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": True
-        }
-
-        async with httpx.AsyncClient(timeout=None) as http_client:
-            async with http_client.stream("POST", url="https://api.anthropic.com/v1/messages", headers=headers, json=body) as r:
-                async for line in r.aiter_lines():
-                    if line.startswith("data: "):
-                        yield line.replace("data: ", "")
+    provider_for(model)
+    # aclosing: a client that stops reading closes the upstream stream now, not whenever it is collected
+    if not settings.LLM_SINGLE_FLIGHT:
+        async with aclosing(_stream_routed(model, prompt)) as stream:
+            async for chunk in stream:
+                yield chunk
+        return
+
+    # Identical (model, prompt) requests in flight on this worker share one upstream stream
+    key = hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+    async with aclosing(_single_flight.stream(key, lambda: _stream_routed(model, prompt))) as stream:
+        async for chunk in stream:
+            yield chunk
+
+
+async def _stream_routed(model: str, prompt: str) -> AsyncGenerator[str, None]:
+    provider = provider_for(model)
+    served_model = model
+    first_token_at = None
+    chunks = 0
+    outcome = "error"
+    attempt = None
+    try:
+        attempt, first_chunk = await _open(model, prompt)
+        served_model = attempt.model
+        provider = provider_for(served_model)
+        if first_chunk is not None:
+            first_token_at = time.perf_counter()
+            LLM_TTFT.labels(provider, served_model).observe(first_token_at - attempt.started)
+            chunks += 1
+            yield first_chunk
+
+        async for chunk in attempt.stream:
+            chunks += 1
+            yield chunk
+        outcome = "ok" if chunks else "empty"
+    except (GeneratorExit, asyncio.CancelledError):
+        outcome = "cancelled"
+        raise
+    finally:
+        # Closing the attempt closes the upstream HTTP stream and hands its concurrency slot back
+        if attempt is not None:
+            await attempt.stream.aclose()
+        LLM_REQUESTS.labels(provider, served_model, outcome).inc()
+        if outcome == "cancelled":
+            LLM_CANCELLED_TOKENS.labels(provider, served_model).inc(max(settings.LLM_MAX_TOKENS - chunks, 0))
+        if chunks:
+            LLM_TOKENS.labels(provider, served_model).inc(chunks)
+            streaming = time.perf_counter() - first_token_at
+            if chunks > 1 and streaming > 0:
+                LLM_TOKENS_PER_SECOND.labels(provider, served_model).observe((chunks - 1) / streaming)
 
 
 # 2️⃣ NON-STREAMING Function
 async def get_full_chat_response(model: str, prompt: str) -> str:
-    if model.startswith("gpt"):
-        response = openai_client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message.content
-
-    elif model.startswith("claude"):
-        headers = {
-            "x-api-key": CLAUDE_API_KEY,
-            "anthropic-version": "2023-06-01",
-            "content-type": "application/json"
-        }
-        body = {
-            "model": model,
-            "max_tokens": 1024,
-            "messages": [{"role": "user", "content": prompt}],
-            "stream": False
-        }
-
-        async with httpx.AsyncClient() as http_client:
-            r = await http_client.post("https://api.anthropic.com/v1/messages", headers=headers, json=body)
-            res = r.json()
-            return res["content"][0]["text"]
\ No newline at end of file
+    # Same routing, limits and fallback as streaming
+    return "".join([chunk async for chunk in stream_chat_response(model, prompt)])
@@ -0,0 +1,282 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.metrics import (
+    MESSAGE_DEAD_LETTERED, MESSAGE_FLUSH_BATCH, MESSAGE_FLUSH_ERRORS, MESSAGE_FLUSH_LATENCY, MESSAGE_WRITER_PENDING,
+)
+from app.models.chat import Chat
+from app.models.message import Message
+from app.services.redis_cache import store_chat_memory_many
+from app.utils.bulk import upsert
+
+logger = logging.getLogger(__name__)
+
+RETRY_SECONDS = 1.0
+MAX_RETRY_SECONDS = 30.0
+DEAD_LETTER_FILE = "dead-letter.ndjson"
+_STOP = object()
+
+
+def _row(turn: dict) -> dict:
+    return {
+        "id": uuid.UUID(turn["id"]),
+        "user_id": uuid.UUID(turn["user_id"]),
+        "chat_id": uuid.UUID(turn["chat_id"]),
+        "content": turn["content"],
+        "response": turn["response"],
+        "status": turn["status"],
+        "model": turn.get("model"),
+        "prompt_tokens": turn.get("prompt_tokens"),
+        "completion_tokens": turn.get("completion_tokens"),
+        "created_at": datetime.fromisoformat(turn["created_at"]),
+    }
+
+
+def write_turns(turns: List[dict]):
+    """One multi-row insert for the batch, then one Redis pipeline for the chat memory of finished turns.
+
+    Turns of chats deleted since they were queued are dropped: the reclaimer removes (or has removed)
+    the chat's messages, and would otherwise race the insert.
+    """
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        chat_ids = {uuid.UUID(t["chat_id"]) for t in turns}
+        live = set(conn.execute(
+            select(Chat.id).where(Chat.id.in_(chat_ids), Chat.deleted_at.is_(None))
+        ).scalars())
+        dropped = [t for t in turns if uuid.UUID(t["chat_id"]) not in live]
+        if dropped:
+            logger.info("Dropping %d turns of deleted chats", len(dropped))
+            turns = [t for t in turns if uuid.UUID(t["chat_id"]) in live]
+        if turns:
+            # Spooled turns may be replayed after they were already committed: ignore duplicate ids
+            conn.execute(upsert(Message, [_row(t) for t in turns], ["id"]))
+    try:
+        store_chat_memory_many([(t["chat_id"], t["content"], t["response"]) for t in turns if t["status"] == "complete"])
+    except redis.RedisError as e:
+        # Memory is a cache of recent turns; a retry would only re-insert rows that are already committed
+        logger.warning("Chat memory push for %d turns failed: %s", len(turns), e)
+    MESSAGE_FLUSH_LATENCY.observe(time.perf_counter() - started)
+    MESSAGE_FLUSH_BATCH.observe(len(turns))
+
+
+class MessageWriter:
+    """Write-behind queue for finished chat turns, flushed by a background thread.
+
+    A batch is written when MESSAGE_WRITER_BATCH_SIZE turns are waiting or MESSAGE_WRITER_FLUSH_MS has
+    passed. With MESSAGE_WRITER_SPOOL_DIR set, every turn is first appended to a per-process spool file
+    (flock'd while the process lives). At start the writer replays spools no live process holds.
+    """
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.MESSAGE_WRITER_MAX_PENDING)
+        self._thread: Optional[threading.Thread] = None
+        self._spool = None
+        self._spool_path = None
+        self._spool_lock = threading.Lock()
+        self._submitted = 0
+        self._written = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if settings.MESSAGE_WRITER_SPOOL_DIR:
+            os.makedirs(settings.MESSAGE_WRITER_SPOOL_DIR, exist_ok=True)
+            orphans = self._claim_orphaned_spools()
+            name = f"messages-{os.getpid()}-{uuid.uuid4().hex[:8]}.ndjson"
+            path = os.path.join(settings.MESSAGE_WRITER_SPOOL_DIR, name)
+            # Created and locked under a name the orphan glob does not match, then renamed: another
+            # starting worker must never see this spool unlocked and replay it as an orphan
+            self._spool = open(os.path.join(settings.MESSAGE_WRITER_SPOOL_DIR, f".{name}.tmp"), "a")
+            fcntl.flock(self._spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(self._spool.name, path)
+            self._spool_path = path
+        else:
+            orphans = []
+        self._thread = threading.Thread(target=self._run, args=(orphans,), name="message-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+        if self._spool is not None:
+            with self._spool_lock:
+                if self._written == self._submitted:
+                    # Clean shutdown: nothing left to replay
+                    os.remove(self._spool_path)
+                self._spool.close()
+                self._spool = None
+
+    def submit(self, user_id, chat_id, content: str, response: str, status: str, model: str = None,
+               prompt_tokens: int = None, completion_tokens: int = None):
+        turn = {
+            "id": str(uuid.uuid4()),
+            "user_id": str(user_id),
+            "chat_id": str(chat_id),
+            "content": content,
+            "response": response,
+            "status": status,
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        if self._thread is None:
+            write_turns([turn])
+            return
+
+        with self._spool_lock:
+            if self._spool is not None:
+                self._spool.write(json.dumps(turn) + "\n")
+                self._spool.flush()
+                if settings.MESSAGE_WRITER_FSYNC:
+                    os.fsync(self._spool.fileno())
+            self._submitted += 1
+        try:
+            self._queue.put_nowait(turn)
+        except queue.Full:
+            # Backlog cap reached (database down or too slow): write it outside the queue, but never on
+            # the event loop the chat endpoints submit from
+            logger.warning("Message writer backlog full; writing turn in the threadpool")
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._write_overflow(turn)
+            else:
+                loop.run_in_executor(None, self._write_overflow, turn)
+        MESSAGE_WRITER_PENDING.set(self._queue.qsize())
+
+    def _write_overflow(self, turn: dict):
+        self._write_with_retry([turn])
+        self._mark_written(1)
+
+    def _mark_written(self, count: int):
+        with self._spool_lock:
+            self._written += count
+            # Everything submitted so far is committed: the spool can start over
+            if self._spool is not None and self._written == self._submitted:
+                self._spool.truncate(0)
+                self._spool.seek(0)
+
+    def _claim_orphaned_spools(self) -> list:
+        # Locks stay held until the replay is done, so two starting workers never replay the same file
+        claimed = []
+        for path in glob.glob(os.path.join(settings.MESSAGE_WRITER_SPOOL_DIR, "messages-*.ndjson")):
+            handle = open(path, "r")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()  # a live worker owns it
+                continue
+            claimed.append((path, handle))
+        return claimed
+
+    def _replay(self, path: str, handle):
+        turns = []
+        with handle:
+            for line in handle:
+                try:
+                    turns.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append
+                    logger.warning("Skipping unreadable line in %s", path)
+            for i in range(0, len(turns), settings.MESSAGE_WRITER_BATCH_SIZE):
+                self._write_with_retry(turns[i:i + settings.MESSAGE_WRITER_BATCH_SIZE])
+            os.remove(path)
+        logger.info("Replayed %d spooled turns from %s", len(turns), path)
+
+    def _write_with_retry(self, batch: List[dict]):
+        """Write a batch, never blocking the writer for good.
+
+        Lost connections and an unreachable database are retried with backoff, a bounded number of
+        times. Anything else (a constraint or data error) is not going to succeed on retry: the batch
+        is written row by row so that only the offending turns are dead-lettered.
+        """
+        for attempt in range(settings.MESSAGE_WRITER_MAX_RETRIES + 1):
+            try:
+                write_turns(batch)
+                return
+            except (OperationalError, DisconnectionError):
+                MESSAGE_FLUSH_ERRORS.inc()
+                if attempt == settings.MESSAGE_WRITER_MAX_RETRIES:
+                    break
+                logger.exception("Message flush of %d turns failed; retrying", len(batch))
+                time.sleep(min(RETRY_SECONDS * 2 ** attempt, MAX_RETRY_SECONDS))
+            except Exception:
+                MESSAGE_FLUSH_ERRORS.inc()
+                logger.exception("Message flush of %d turns failed; writing them one by one", len(batch))
+                break
+        for turn in batch:
+            try:
+                write_turns([turn])
+            except Exception as e:
+                self._dead_letter(turn, e)
+
+    def _dead_letter(self, turn: dict, error: Exception):
+        MESSAGE_DEAD_LETTERED.inc()
+        if not settings.MESSAGE_WRITER_SPOOL_DIR:
+            logger.error("Dropping chat turn %s for chat %s: %s", turn["id"], turn["chat_id"], error)
+            return
+        # Kept next to the spools for inspection or a manual replay; never replayed automatically
+        path = os.path.join(settings.MESSAGE_WRITER_SPOOL_DIR, DEAD_LETTER_FILE)
+        with open(path, "a") as f:
+            f.write(json.dumps({**turn, "error": str(error)}) + "\n")
+        logger.error("Dead-lettered chat turn %s for chat %s to %s: %s", turn["id"], turn["chat_id"], path, error)
+
+    def _run(self, orphans: list):
+        for path, handle in orphans:
+            self._replay(path, handle)
+
+        interval = settings.MESSAGE_WRITER_FLUSH_MS / 1000
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < settings.MESSAGE_WRITER_BATCH_SIZE:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if deadline is None:
+                    # The interval starts with the oldest waiting turn
+                    deadline = time.monotonic() + interval
+
+            # Drain whatever is left on shutdown
+            if stopping:
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            for i in range(0, len(batch), settings.MESSAGE_WRITER_BATCH_SIZE):
+                chunk = batch[i:i + settings.MESSAGE_WRITER_BATCH_SIZE]
+                self._write_with_retry(chunk)
+                self._mark_written(len(chunk))
+            MESSAGE_WRITER_PENDING.set(self._queue.qsize())
+
+
+writer = MessageWriter()
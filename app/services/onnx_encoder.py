@@ -0,0 +1,201 @@
+"""ONNX Runtime backend for the sentence embedding model.
+
+Export (done automatically on first use when the files are missing):
+
+    python -m app.services.onnx_encoder --model all-MiniLM-L6-v2
+
+An export is written to a temporary directory and moved into place under a file lock, so workers
+starting together export once and never load a half-written model.
+"""
+import argparse
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+PIPELINE_FILE = "pipeline.json"
+
+# Vectors from this backend must stay within this cosine distance of the torch backend's,
+# so they can be searched against (and mixed into) the existing collection.
+COSINE_TOLERANCE = 0.01
+
+
+def model_dir(base_dir: str, model_name: str) -> str:
+    return os.path.join(base_dir, model_name.replace("/", "__"))
+
+
+@contextmanager
+def _export_lock(out_dir: str):
+    out_dir = os.path.abspath(out_dir)
+    os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+    with open(out_dir + ".lock", "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
+
+
+def export(model_name: str, out_dir: str, if_missing: bool = False):
+    """Export into out_dir, replacing what is there; with if_missing, only when there is no export yet."""
+    with _export_lock(out_dir):
+        if if_missing and os.path.exists(os.path.join(out_dir, PIPELINE_FILE)):
+            # Another worker exported it while this one waited for the lock
+            return
+        tmp_dir = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(os.path.abspath(out_dir)))
+        try:
+            os.chmod(tmp_dir, 0o755)
+            _export(model_name, tmp_dir)
+            if os.path.exists(out_dir):
+                shutil.rmtree(out_dir)
+            os.replace(tmp_dir, out_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    logger.info("Exported %s to %s", model_name, out_dir)
+
+
+def _export(model_name: str, out_dir: str):
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+    class HiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            HiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+    # Dynamic int8: weights quantized offline, activations quantized per batch at runtime
+    quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, PIPELINE_FILE), "w") as f:
+        json.dump({
+            "model": model_name,
+            "inputs": input_names,
+            "pooling": st[1].get_pooling_mode_str(),
+            "normalize": any(isinstance(module, Normalize) for module in st),
+            "max_seq_length": st.max_seq_length,
+            "dimension": st.get_sentence_embedding_dimension(),
+        }, f, indent=2)
+
+
+class OnnxEncoder:
+    """SentenceTransformer.encode-compatible encoder running an exported graph on ONNX Runtime."""
+
+    def __init__(self, path: str, quantized: bool = True, num_threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(path, PIPELINE_FILE)) as f:
+            self.pipeline = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            os.path.join(path, INT8_FILE if quantized else FP32_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.pipeline["dimension"]
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        mode = self.pipeline["pooling"]
+        if mode == "cls":
+            return hidden[:, 0]
+        if mode == "max":
+            return np.where(mask[..., None] > 0, hidden, -1e9).max(axis=1)
+        mask = mask[..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        max_length = self.pipeline["max_seq_length"]
+        encoded = self.tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+
+        # Padding-aware batching: similar lengths share a batch, so little compute goes to pad tokens
+        order = np.argsort([len(ids) for ids in encoded], kind="stable")
+        output = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            batch = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+                return_tensors="np",
+            )
+            feed = {name: batch[name].astype(np.int64) for name in self.pipeline["inputs"]}
+            hidden = self.session.run(None, feed)[0]
+            output[idx] = self._pool(hidden, batch["attention_mask"])
+
+        if self.pipeline["normalize"]:
+            output /= np.clip(np.linalg.norm(output, axis=1, keepdims=True), 1e-12, None)
+        return output[0] if single else output
+
+
+def load_onnx_encoder(model_name: str, base_dir: str, quantized: bool, num_threads: int = 0) -> OnnxEncoder:
+    path = model_dir(base_dir, model_name)
+    if not os.path.exists(os.path.join(path, PIPELINE_FILE)):
+        logger.info("No ONNX export of %s in %s, exporting now", model_name, path)
+        export(model_name, path, if_missing=True)
+    return OnnxEncoder(path, quantized=quantized, num_threads=num_threads)
+
+
+def main():
+    from app.core.config import settings
+    from app.services.embedding import EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (fp32 + dynamic int8)")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--out", default=settings.EMBEDDING_ONNX_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export(args.model, model_dir(args.out, args.model))
+
+
+if __name__ == "__main__":
+    main()
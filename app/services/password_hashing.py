@@ -0,0 +1,100 @@
+"""Password hashing off the request path: bcrypt in a dedicated, bounded process pool.
+
+Each hash or verify is a few hundred milliseconds of CPU. In the shared request threadpool a login
+burst would hold every thread the sync endpoints need; here it only queues behind its own workers.
+At most PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE calls are pending per API worker; beyond
+that the request is refused with a 503 and Retry-After. Hashes made with other parameters than
+PASSWORD_BCRYPT_ROUNDS are rehashed on the next successful login.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+from app.core.config import settings
+from app.core.metrics import PASSWORD_HASH_PENDING, PASSWORD_HASH_REJECTED, timed
+
+_contexts: Dict[int, CryptContext] = {}
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = 0
+
+
+def _context(rounds: int) -> CryptContext:
+    # Pinning min and max to the configured rounds makes needs_update flag any other cost, up or down
+    context = _contexts.get(rounds)
+    if context is None:
+        context = _contexts[rounds] = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+    return context
+
+
+def hash_password_sync(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def verify_and_update_sync(password: str, hashed: str, rounds: int) -> Tuple[bool, Optional[str]]:
+    """(matches, new hash or None); a new hash is only returned for a match with outdated parameters."""
+    return _context(rounds).verify_and_update(password, hashed)
+
+
+def get_hash_pool() -> Optional[ProcessPoolExecutor]:
+    # Spawned like the parse pool, so the workers do not inherit the server's threads and clients.
+    # PASSWORD_HASH_WORKERS=0 hashes in the request threadpool instead
+    global _pool
+    if _pool is None and settings.PASSWORD_HASH_WORKERS > 0:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _run(fn, *args):
+    global _pending
+    capacity = max(settings.PASSWORD_HASH_WORKERS, 1) + settings.PASSWORD_HASH_MAX_QUEUE
+    if _pending >= capacity:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Too many sign-ins in progress, retry later",
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+        )
+    _pending += 1
+    PASSWORD_HASH_PENDING.set(_pending)
+    try:
+        with timed("auth.password_hash"):
+            pool = get_hash_pool()
+            if pool is None:
+                return await run_in_threadpool(fn, *args)
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    finally:
+        _pending -= 1
+        PASSWORD_HASH_PENDING.set(_pending)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_password_sync, password, settings.PASSWORD_BCRYPT_ROUNDS)
+
+
+async def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return await _run(verify_and_update_sync, password, hashed, settings.PASSWORD_BCRYPT_ROUNDS)
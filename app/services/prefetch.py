@@ -0,0 +1,205 @@
+"""Speculative retrieval: embed and search the draft while the user is still typing.
+
+The frontend posts the draft to /chat/prefetch (debounced); the result lands in a short-lived slot
+per chat in Redis. When the message is sent, chat_stream takes the slot and skips its own embedding
+and Qdrant search if the final text is close enough to the draft. A newer draft for the same chat
+supersedes the older one: its task is cancelled in this worker, and a sequence number keeps a late
+result from any worker from overwriting the newer slot.
+"""
+import asyncio
+import difflib
+import json
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import redis
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import PREFETCH_LOOKUPS, PREFETCH_REQUESTS, PREFETCH_SAVED, timed_dependency
+from app.services.redis_cache import get_redis
+from app.services.response_cache import normalize_prompt
+from app.services.vector_store import (
+    Collection, active_collection, embed_query, embedding_queue_depth, search_context,
+)
+
+logger = logging.getLogger(__name__)
+
+SLOT_PREFIX = "prefetch:slot:"
+SEQ_PREFIX = "prefetch:seq:"
+THROTTLE_PREFIX = "prefetch:throttle:"
+
+# Store the slot only if no newer draft has been started since (KEYS: seq, slot; ARGV: seq, slot, ttl ms)
+_STORE_IF_LATEST = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+_script = None
+# chat id -> (normalized draft, task) for the prefetches running in this worker
+_inflight: Dict[str, Tuple[str, asyncio.Task]] = {}
+
+
+class Prefetched(NamedTuple):
+    vector: list
+    context: str
+    exact: bool  # same text as sent: the vector is the question's own
+
+
+def _store_script():
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(_STORE_IF_LATEST)
+    return _script
+
+
+def _matches(draft: str, message: str) -> bool:
+    if draft == message:
+        return True
+    matcher = difflib.SequenceMatcher(None, draft, message, autojunk=False)
+    # The cheap upper bounds rule most mismatches out before the quadratic ratio
+    return (
+        matcher.real_quick_ratio() >= settings.PREFETCH_MATCH_RATIO
+        and matcher.quick_ratio() >= settings.PREFETCH_MATCH_RATIO
+        and matcher.ratio() >= settings.PREFETCH_MATCH_RATIO
+    )
+
+
+def start(chat_id, draft: str, scope: str, workspace_id, organization_id) -> str:
+    """Start prefetching for a draft; returns what happened. Raises 429 when called too often for the chat."""
+    if not settings.PREFETCH_ENABLED:
+        return "disabled"
+    normalized = normalize_prompt(draft)
+    if len(normalized) < settings.PREFETCH_MIN_CHARS:
+        PREFETCH_REQUESTS.labels("too_short").inc()
+        return "too_short"
+    # Speculative work comes last: never while real questions and uploads are waiting for the encoder
+    if embedding_queue_depth() >= settings.ADMISSION_MAX_EMBEDDING_QUEUE:
+        PREFETCH_REQUESTS.labels("busy").inc()
+        return "busy"
+
+    key = str(chat_id)
+    client = get_redis()
+    try:
+        with timed_dependency("redis", "prefetch_start"):
+            allowed = client.set(THROTTLE_PREFIX + key, 1, nx=True, px=settings.PREFETCH_MIN_INTERVAL_MS)
+            if allowed:
+                pipe = client.pipeline()
+                pipe.incr(SEQ_PREFIX + key)
+                pipe.pexpire(SEQ_PREFIX + key, settings.PREFETCH_TTL_SECONDS * 1000)
+                seq = pipe.execute()[0]
+    except redis.RedisError as e:
+        logger.warning("Prefetch unavailable: %s", e)
+        PREFETCH_REQUESTS.labels("failed").inc()
+        return "failed"
+    if not allowed:
+        PREFETCH_REQUESTS.labels("rate_limited").inc()
+        raise HTTPException(status_code=429, detail="Prefetching too often for this chat", headers={"Retry-After": "1"})
+
+    cancel(chat_id)
+    task = asyncio.create_task(_run(chat_id, seq, draft, normalized, scope, workspace_id, organization_id))
+    _inflight[key] = (normalized, task)
+
+    def forget(done: asyncio.Task):
+        if key in _inflight and _inflight[key][1] is done:
+            del _inflight[key]
+
+    task.add_done_callback(forget)
+    PREFETCH_REQUESTS.labels("started").inc()
+    return "started"
+
+
+def cancel(chat_id) -> bool:
+    """Cancel this worker's running prefetch for the chat, if any."""
+    previous = _inflight.pop(str(chat_id), None)
+    if previous is None or previous[1].done():
+        return False
+    previous[1].cancel()
+    PREFETCH_REQUESTS.labels("superseded").inc()
+    return True
+
+
+def discard(chat_id):
+    cancel(chat_id)
+    try:
+        get_redis().delete(SLOT_PREFIX + str(chat_id))
+    except redis.RedisError as e:
+        logger.warning("Prefetch slot delete failed: %s", e)
+
+
+async def _run(chat_id, seq: int, draft: str, normalized: str, scope: str, workspace_id, organization_id):
+    key = str(chat_id)
+    try:
+        started = time.perf_counter()
+        collection = active_collection()
+        vector = await run_in_threadpool(embed_query, draft, collection)
+        # A cancellation while embedding stops here, before the search
+        context = await run_in_threadpool(
+            search_context, draft, chat_id, vector,
+            scope=scope, workspace_id=workspace_id, organization_id=organization_id, collection=collection,
+        )
+        entry = {
+            "draft": normalized,
+            "scope": scope,
+            "collection": collection.name,
+            "vector": vector,
+            "context": context,
+            "seconds": time.perf_counter() - started,
+        }
+        stored = await run_in_threadpool(
+            _store_script(),
+            keys=[SEQ_PREFIX + key, SLOT_PREFIX + key],
+            args=[seq, json.dumps(entry), settings.PREFETCH_TTL_SECONDS * 1000],
+        )
+        PREFETCH_REQUESTS.labels("stored" if stored else "superseded").inc()
+    except Exception as e:
+        logger.warning("Prefetch for chat %s failed: %s", key, e)
+        PREFETCH_REQUESTS.labels("failed").inc()
+
+
+async def take(chat_id, message: str, scope: str, collection: Collection) -> Optional[Prefetched]:
+    """Claim the chat's prefetched retrieval if it was made for (nearly) this message, else None.
+
+    A matching prefetch still running in this worker is waited for: it is further along than a
+    fresh retrieval would be. The slot is single-use; Redis trouble is a miss.
+    """
+    if not settings.PREFETCH_ENABLED:
+        return None
+    key = str(chat_id)
+    normalized = normalize_prompt(message)
+    waited = 0.0
+    running = _inflight.get(key)
+    if running is not None and _matches(running[0], normalized):
+        started = time.perf_counter()
+        try:
+            await asyncio.shield(running[1])
+        except asyncio.CancelledError:
+            if not running[1].cancelled():
+                raise
+        waited = time.perf_counter() - started
+    elif running is not None:
+        # Made for a draft that was not sent
+        cancel(chat_id)
+    try:
+        with timed_dependency("redis", "prefetch_take"):
+            raw = get_redis().getdel(SLOT_PREFIX + key)
+    except redis.RedisError as e:
+        logger.warning("Prefetch lookup failed: %s", e)
+        raw = None
+    if raw is None:
+        PREFETCH_LOOKUPS.labels("miss").inc()
+        return None
+
+    entry = json.loads(raw)
+    # Another scope or embedding model searched something else; a different draft asked something else
+    if entry["scope"] != scope or entry["collection"] != collection.name or not _matches(entry["draft"], normalized):
+        PREFETCH_LOOKUPS.labels("mismatch").inc()
+        return None
+    PREFETCH_LOOKUPS.labels("hit").inc()
+    PREFETCH_SAVED.observe(max(entry["seconds"] - waited, 0.0))
+    return Prefetched(entry["vector"], entry["context"], entry["draft"] == normalized)
@@ -0,0 +1,255 @@
+import codecs
+import csv
+import json
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.department import Department
+from app.models.team import Team
+from app.models.user import User
+from app.models.user_department import UserDepartment
+from app.models.user_organization import UserOrganization
+from app.models.user_team import UserTeam
+from app.utils.bulk import upsert
+
+MAX_REPORTED_ERRORS = 100
+FIELDS = ("department", "team", "email", "role")
+LEVELS = ("organization", "department", "team")
+# Membership table and its unit column per level; (user_id, unit column) is the primary key
+MEMBERSHIPS = {
+    "organization": (UserOrganization, "organization_id"),
+    "department": (UserDepartment, "department_id"),
+    "team": (UserTeam, "team_id"),
+}
+
+
+class Record:
+    __slots__ = ("line", "department", "team", "email", "role")
+
+    def __init__(self, line: int, department: Optional[str], team: Optional[str], email: Optional[str], role: str):
+        self.line = line
+        self.department = department
+        self.team = team
+        self.email = email
+        self.role = role
+
+
+class RecordReader:
+    """Incremental CSV/NDJSON parser: fed the body chunk by chunk, never holding more than one line of it.
+
+    One row per line with department, team, email and role fields (all optional, role defaults to
+    member). A row without email only creates the department/team; CSV needs a header line and
+    quoted fields must not span lines.
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = fmt
+        self.records: List[Record] = []
+        self.errors: List[Tuple[int, str]] = []
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._pending = ""
+        self._line = 0
+        self._header = None
+
+    def feed(self, chunk: bytes, final: bool = False):
+        lines = (self._pending + self._decoder.decode(chunk, final=final)).split("\n")
+        self._pending = "" if final else lines.pop()
+        for line in lines:
+            self._line += 1
+            line = line.rstrip("\r")
+            if line.strip():
+                self._parse(line)
+
+    def _parse(self, line: str):
+        try:
+            if self.fmt == "csv":
+                values = next(csv.reader([line]))
+                if self._header is None:
+                    self._header = [name.strip().lower() for name in values]
+                    return
+                fields = dict(zip(self._header, values))
+            else:
+                fields = json.loads(line)
+                if not isinstance(fields, dict):
+                    raise ValueError("Expected a JSON object")
+        except (ValueError, csv.Error) as e:
+            self.errors.append((self._line, f"Unreadable row: {e}"))
+            return
+
+        # NDJSON values can be numbers, lists or objects; CSV values are always strings
+        invalid = [name for name in FIELDS if fields.get(name) is not None and not isinstance(fields[name], str)]
+        if invalid:
+            self.errors.append((self._line, f"Not a string: {', '.join(invalid)}"))
+            return
+
+        department = (fields.get("department") or "").strip() or None
+        team = (fields.get("team") or "").strip() or None
+        email = (fields.get("email") or "").strip() or None
+        role = (fields.get("role") or "").strip() or "member"
+        if team and not department:
+            self.errors.append((self._line, "A team needs its department"))
+        elif not (department or email):
+            self.errors.append((self._line, "Row names neither a department nor a user"))
+        elif len(self.records) >= settings.PROVISION_MAX_ROWS:
+            raise HTTPException(status_code=413, detail=f"At most {settings.PROVISION_MAX_ROWS} rows per import")
+        else:
+            self.records.append(Record(self._line, department, team, email, role))
+
+
+async def read_records(chunks: AsyncIterator[bytes], fmt: str) -> RecordReader:
+    reader = RecordReader(fmt)
+    async for chunk in chunks:
+        reader.feed(chunk)
+    reader.feed(b"", final=True)
+    return reader
+
+
+class Plan:
+    """What an import changes, computed with a fixed number of set-based queries whatever its size."""
+
+    def __init__(self, org_id):
+        self.org_id = org_id
+        self.rows = 0
+        self.errors: List[Tuple[int, str]] = []
+        self.new_departments: List[dict] = []
+        self.new_teams: List[dict] = []
+        self.existing_departments = 0
+        self.existing_teams = 0
+        self.writes: Dict[str, List[dict]] = {level: [] for level in LEVELS}
+        self.counts = {level: {"added": 0, "role_changed": 0, "unchanged": 0} for level in LEVELS}
+
+    def summary(self, dry_run: bool) -> dict:
+        return {
+            "dry_run": dry_run,
+            "rows": self.rows,
+            "departments": {"created": len(self.new_departments), "existing": self.existing_departments},
+            "teams": {"created": len(self.new_teams), "existing": self.existing_teams},
+            "memberships": self.counts,
+            "error_count": len(self.errors),
+            "errors": [{"line": line, "error": error} for line, error in sorted(self.errors)[:MAX_REPORTED_ERRORS]],
+        }
+
+
+def _in_chunks(values, size: int = 1000):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def plan(db: Session, org_id, reader: RecordReader, actor_id=None) -> Plan:
+    result = Plan(org_id)
+    result.rows = len(reader.records) + len(reader.errors)
+    result.errors.extend(reader.errors)
+    records = reader.records
+
+    # Hierarchy: existing units by name, new ones get their ids now so memberships can reference them
+    departments = {}
+    for dept_id, name in db.query(Department.id, Department.name).filter(
+        Department.organization_id == org_id
+    ).order_by(Department.created_at):
+        departments.setdefault(name, dept_id)
+    teams = {}
+    for team_id, name, dept_name in db.query(Team.id, Team.name, Department.name).join(
+        Department, Team.department_id == Department.id
+    ).filter(Department.organization_id == org_id).order_by(Team.created_at):
+        teams.setdefault((dept_name, name), team_id)
+
+    wanted_departments = {r.department for r in records if r.department}
+    wanted_teams = {(r.department, r.team) for r in records if r.team}
+    result.existing_departments = len(wanted_departments & departments.keys())
+    result.existing_teams = len(wanted_teams & teams.keys())
+    for name in sorted(wanted_departments - departments.keys()):
+        departments[name] = uuid.uuid4()
+        result.new_departments.append({"id": departments[name], "name": name, "organization_id": org_id})
+    for dept_name, name in sorted(wanted_teams - teams.keys()):
+        teams[(dept_name, name)] = uuid.uuid4()
+        result.new_teams.append({"id": teams[(dept_name, name)], "name": name, "department_id": departments[dept_name]})
+
+    users = {}
+    for emails in _in_chunks({r.email for r in records if r.email}):
+        users.update(db.query(User.email, User.id).filter(User.email.in_(emails)).all())
+
+    existing = {
+        "organization": {
+            (user_id, org_id): role
+            for user_id, role in db.query(UserOrganization.user_id, UserOrganization.role).filter(
+                UserOrganization.organization_id == org_id
+            )
+        },
+        "department": {
+            (user_id, dept_id): role
+            for user_id, dept_id, role in db.query(
+                UserDepartment.user_id, UserDepartment.department_id, UserDepartment.role
+            ).join(Department, UserDepartment.department_id == Department.id).filter(Department.organization_id == org_id)
+        },
+        "team": {
+            (user_id, team_id): role
+            for user_id, team_id, role in db.query(UserTeam.user_id, UserTeam.team_id, UserTeam.role)
+            .join(Team, UserTeam.team_id == Team.id)
+            .join(Department, Team.department_id == Department.id)
+            .filter(Department.organization_id == org_id)
+        },
+    }
+
+    # The role applies at the deepest level a row names; parent units get a member role if missing
+    explicit = {}
+    implied = set()
+    for record in records:
+        if not record.email:
+            continue
+        user_id = users.get(record.email)
+        if user_id is None:
+            result.errors.append((record.line, f"Unknown user {record.email}"))
+            continue
+        path = [("organization", org_id)]
+        if record.department:
+            path.append(("department", departments[record.department]))
+        if record.team:
+            path.append(("team", teams[(record.department, record.team)]))
+        level, unit_id = path[-1]
+        key = (level, user_id, unit_id)
+        if level == "organization" and user_id == actor_id and record.role != "admin":
+            # An import must not lock out the admin running it
+            result.errors.append((record.line, "Cannot change your own organization role"))
+            continue
+        if key in explicit and explicit[key] != record.role:
+            result.errors.append((record.line, f"Conflicting role for {record.email} in this {level}"))
+            continue
+        explicit[key] = record.role
+        implied.update((parent_level, user_id, parent_id) for parent_level, parent_id in path[:-1])
+
+    for (level, user_id, unit_id), role in explicit.items():
+        current = existing[level].get((user_id, unit_id))
+        if current == role:
+            result.counts[level]["unchanged"] += 1
+            continue
+        result.counts[level]["added" if current is None else "role_changed"] += 1
+        result.writes[level].append({"user_id": user_id, MEMBERSHIPS[level][1]: unit_id, "role": role})
+    for level, user_id, unit_id in implied - explicit.keys():
+        if (user_id, unit_id) not in existing[level]:
+            result.counts[level]["added"] += 1
+            result.writes[level].append({"user_id": user_id, MEMBERSHIPS[level][1]: unit_id, "role": "member"})
+    return result
+
+
+def apply(db: Session, result: Plan):
+    """Write a plan in transactions of at most PROVISION_BATCH_SIZE rows.
+
+    An import that fails part-way leaves the committed batches in place; every write is an upsert,
+    so running the same import again completes it.
+    """
+    size = settings.PROVISION_BATCH_SIZE
+    for model, rows in ((Department, result.new_departments), (Team, result.new_teams)):
+        for chunk in _in_chunks(rows, size):
+            db.execute(insert(model).values(chunk))
+            db.commit()
+    for level in LEVELS:
+        model, unit_column = MEMBERSHIPS[level]
+        for chunk in _in_chunks(result.writes[level], size):
+            db.execute(upsert(model, chunk, ["user_id", unit_column], ["role"]))
+            db.commit()
@@ -0,0 +1,152 @@
+import logging
+import math
+from typing import Dict, List, Optional, Tuple
+
+import redis
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import RATE_LIMITED, timed_dependency
+from app.models.user_organization import UserOrganization
+from app.services.redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("requests", "prompt_tokens", "completion_tokens", "upload_bytes")
+
+# Token buckets, all-or-nothing across every key in one round trip.
+# ARGV[1] is the mode: "check" debits only if every bucket can pay, "debit" always debits (buckets may go
+# negative, which blocks later checks until they refill), "peek" only reads.
+# ARGV then holds capacity, refill per ms and cost for each key.
+# Returns {allowed, retry_after_ms, level_1, ..., level_n}.
+_TOKEN_BUCKET = """
+local mode = ARGV[1]
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local bucket = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - ts, 0) * rate)
+    levels[i] = tokens
+    -- A cost larger than the whole bucket is let through once the bucket is full
+    local needed = math.min(cost, capacity)
+    if mode == 'check' and tokens < needed then
+        wait = math.max(wait, math.ceil((needed - tokens) / rate))
+    end
+end
+if wait > 0 or mode == 'peek' then
+    local result = {wait > 0 and 0 or 1, wait}
+    for i = 1, #KEYS do result[i + 2] = math.floor(levels[i]) end
+    return result
+end
+local result = {1, 0}
+for i = 1, #KEYS do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local tokens = levels[i] - tonumber(ARGV[i * 3 + 1])
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[i], math.ceil((capacity - tokens) / rate) + 1000)
+    result[i + 2] = math.floor(tokens)
+end
+return result
+"""
+
+_script = None
+
+
+def _bucket_script():
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(_TOKEN_BUCKET)
+    return _script
+
+
+def subjects_for(db: Session, user, workspace_id=None) -> List[Tuple[str, str]]:
+    """The (level, id) pairs a request is charged to: the user, the workspace and each of the user's organizations."""
+    subjects = [("user", str(user.id))]
+    if workspace_id is not None:
+        subjects.append(("workspace", str(workspace_id)))
+    org_ids = db.query(UserOrganization.organization_id).filter_by(user_id=user.id).all()
+    subjects.extend(("organization", str(org_id)) for (org_id,) in org_ids)
+    return subjects
+
+
+def _buckets(subjects, costs: Dict[str, float]):
+    buckets = []
+    for level, ident in subjects:
+        limits = settings.RATE_LIMITS.get(level, {})
+        for dimension, cost in costs.items():
+            if dimension not in limits:
+                continue
+            capacity, period = limits[dimension]
+            buckets.append((level, ident, dimension, capacity, capacity / (period * 1000), cost))
+    return buckets
+
+
+def _run(mode: str, buckets) -> Optional[list]:
+    if not buckets:
+        return None
+    keys = [f"ratelimit:{level}:{ident}:{dimension}" for level, ident, dimension, *_ in buckets]
+    args = [mode]
+    for *_, capacity, rate, cost in buckets:
+        args.extend([capacity, repr(rate), cost])
+    try:
+        with timed_dependency("redis", f"ratelimit_{mode}"):
+            return _bucket_script()(keys=keys, args=args)
+    except redis.RedisError as e:
+        # Fail open: an unavailable limiter must not take chat down with it
+        logger.warning("Rate limiter unavailable: %s", e)
+        return None
+
+
+def check(subjects, **costs: float):
+    """Debit every bucket or none; raises 429 with Retry-After naming the tightest exhausted bucket.
+
+    A zero cost still rejects while a bucket is in debt, which is how completion tokens (only known
+    afterwards, see debit) hold back the next request.
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    buckets = _buckets(subjects, costs)
+    result = _run("check", buckets)
+    if result is None or result[0] == 1:
+        return
+
+    # Report the bucket that is furthest from paying its cost
+    level, _, dimension, *_ = min(zip(buckets, result[2:]), key=lambda pair: pair[1] - pair[0][5])[0]
+    RATE_LIMITED.labels(level, dimension).inc()
+    retry_after = max(1, math.ceil(result[1] / 1000))
+    raise HTTPException(
+        status_code=429,
+        detail=f"Rate limit exceeded for {level} {dimension}",
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def debit(subjects, **costs: float):
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    _run("debit", _buckets(subjects, {d: c for d, c in costs.items() if c}))
+
+
+def usage(subjects) -> List[dict]:
+    buckets = _buckets(subjects, {dimension: 0 for dimension in DIMENSIONS})
+    result = _run("peek", buckets) if settings.RATE_LIMIT_ENABLED else None
+    items = []
+    for i, (level, ident, dimension, capacity, rate, _) in enumerate(buckets):
+        items.append({
+            "level": level,
+            "id": ident,
+            "dimension": dimension,
+            "limit": capacity,
+            "window_seconds": capacity / rate / 1000,
+            "remaining": result[i + 2] if result else capacity,
+        })
+    return items
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.config import settings
+from app.core.db import SessionLocal
+from app.core.metrics import RECLAIMED_BYTES, RECLAIMED_POINTS
+from app.models.chat import Chat
+from app.models.document import Document
+from app.models.message import Message
+from app.models.workspace import Workspace
+from app.services import vector_store
+from app.services.redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploads"
+LOCK_KEY = "reclaimer:lock"
+# Release only our own lock: it may have expired and been taken by another worker
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+# Extend our own lock while a long sweep is still going
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_wake: Optional[asyncio.Event] = None
+
+
+def wake():
+    """Ask this worker's reclaimer to run now instead of at the next interval (callable from any thread)."""
+    if _loop is not None and _wake is not None:
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+class LockLost(Exception):
+    """The reclaimer lock expired and may be held by another worker: stop before both work at once."""
+
+
+def _timestamp(deleted_at: datetime) -> float:
+    # deleted_at is naive UTC, indexed_at is a Unix timestamp
+    return deleted_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+def document_deleted(doc: Document):
+    """After a document's logical delete is committed: hide its vectors from search and wake the reclaimer."""
+    try:
+        vector_store.hide_document_vectors(doc.chat_id, doc.workspace_id, doc.name, _timestamp(doc.deleted_at))
+    except Exception as e:
+        # The reclaimer still deletes the points; until then they can show up in search
+        logger.warning("Hiding vectors of deleted document %s failed: %s", doc.id, e)
+    wake()
+
+
+def chat_deleted(chat_id):
+    try:
+        vector_store.hide_chat_vectors(chat_id)
+    except Exception as e:
+        logger.warning("Hiding vectors of deleted chat %s failed: %s", chat_id, e)
+    wake()
+
+
+def _remove_path(path: str) -> int:
+    if os.path.isdir(path):
+        size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+        shutil.rmtree(path, ignore_errors=True)
+        return size
+    if os.path.exists(path):
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    return 0
+
+
+def reclaim_deleted(renew=None) -> dict:
+    """One batch of logically deleted documents and chats: vectors by filter, files, then the rows.
+
+    A file uploaded again under a deleted document's name shares its filename and path: only points
+    indexed before the delete are removed, and a path a live document still uses is kept.
+    """
+    stats = {"documents": 0, "chats": 0, "points": 0, "bytes": 0}
+    db = SessionLocal()
+    try:
+        docs = db.query(Document).filter(Document.deleted_at.is_not(None)).limit(settings.RECLAIM_BATCH_SIZE).all()
+        if docs:
+            stats["points"] += vector_store.delete_documents_vectors(
+                [(doc.chat_id, doc.workspace_id, doc.name, _timestamp(doc.deleted_at)) for doc in docs]
+            )
+            paths = {doc.path for doc in docs}
+            in_use = {path for (path,) in db.query(Document.path).filter(
+                Document.path.in_(paths), Document.deleted_at.is_(None)
+            )}
+            stats["bytes"] += sum(_remove_path(path) for path in paths - in_use)
+            db.query(Document).filter(Document.id.in_([doc.id for doc in docs])).delete(synchronize_session=False)
+            db.commit()
+            stats["documents"] = len(docs)
+            if renew is not None:
+                renew()
+
+        chat_ids = [chat_id for (chat_id,) in db.query(Chat.id).filter(Chat.deleted_at.is_not(None))
+                    .limit(settings.RECLAIM_BATCH_SIZE)]
+        if chat_ids:
+            stats["points"] += vector_store.delete_chats_vectors(chat_ids)
+            stats["bytes"] += sum(_remove_path(os.path.join(UPLOAD_DIR, f"chat_{chat_id}")) for chat_id in chat_ids)
+            # Set-based deletes instead of the ORM cascade, which would load every message first.
+            # Turns still queued in a message writer for these chats are dropped there (write_turns)
+            for model in (Message, Document):
+                db.query(model).filter(model.chat_id.in_(chat_ids)).delete(synchronize_session=False)
+            db.query(Chat).filter(Chat.id.in_(chat_ids)).delete(synchronize_session=False)
+            db.commit()
+            stats["chats"] = len(chat_ids)
+    finally:
+        db.close()
+
+    RECLAIMED_POINTS.labels("deleted").inc(stats["points"])
+    RECLAIMED_BYTES.labels("deleted").inc(stats["bytes"])
+    return stats
+
+
+def sweep(renew=None) -> dict:
+    """Reconcile Qdrant points and upload files against Postgres.
+
+    Removes vectors and files whose chat, workspace or document row no longer exists (SQL cascades,
+    failed uploads, deletes from before logical deletion). Anything younger than RECLAIM_GRACE_SECONDS
+    is left alone, since its row may simply not be committed yet. renew() is called per page of
+    points, so the reclaimer lock outlives a sweep of a large collection.
+    """
+    cutoff = time.time() - settings.RECLAIM_GRACE_SECONDS
+    db = SessionLocal()
+    try:
+        live_chats = {str(i) for (i,) in db.query(Chat.id).filter(Chat.deleted_at.is_(None))}
+        live_workspaces = {str(i) for (i,) in db.query(Workspace.id)}
+        live_docs = set()
+        live_paths = set()
+        for chat_id, workspace_id, name, path in db.query(
+            Document.chat_id, Document.workspace_id, Document.name, Document.path
+        ).filter(Document.deleted_at.is_(None)):
+            live_docs.add((str(chat_id) if chat_id else None, None if chat_id else str(workspace_id), name))
+            live_paths.add(os.path.normpath(path))
+    finally:
+        db.close()
+
+    orphans = []
+    points = 0
+    for n, point in enumerate(vector_store.scroll_points(1000, ["chat_id", "workspace_id", "filename", "indexed_at"])):
+        if renew is not None and n % 1000 == 0:
+            renew()
+        payload = point.payload or {}
+        if payload.get("indexed_at", 0) > cutoff:
+            continue
+        chat_id, workspace_id = payload.get("chat_id"), payload.get("workspace_id")
+        if chat_id is not None and chat_id not in live_chats and chat_id not in live_workspaces:
+            orphans.append(point.id)  # chat_id == a workspace id: un-migrated workspace upload, kept
+        elif chat_id is None and workspace_id not in live_workspaces:
+            orphans.append(point.id)
+        elif chat_id in live_chats and (chat_id, None, payload.get("filename")) not in live_docs:
+            orphans.append(point.id)
+        elif chat_id is None and (None, workspace_id, payload.get("filename")) not in live_docs:
+            orphans.append(point.id)
+        if len(orphans) >= 1000:
+            points += vector_store.delete_points(orphans)
+            orphans = []
+    if orphans:
+        points += vector_store.delete_points(orphans)
+
+    reclaimed_bytes = 0
+    if os.path.isdir(UPLOAD_DIR):
+        for root, dirs, files in os.walk(UPLOAD_DIR, topdown=False):
+            for name in files:
+                path = os.path.normpath(os.path.join(root, name))
+                if path not in live_paths and os.path.getmtime(path) < cutoff:
+                    reclaimed_bytes += _remove_path(path)
+            if root != UPLOAD_DIR and not os.listdir(root) and os.path.getmtime(root) < cutoff:
+                os.rmdir(root)
+
+    RECLAIMED_POINTS.labels("sweep").inc(points)
+    RECLAIMED_BYTES.labels("sweep").inc(reclaimed_bytes)
+    return {"points": points, "bytes": reclaimed_bytes}
+
+
+def _locked(job):
+    # One reclaimer at a time across all workers and hosts
+    token = uuid.uuid4().hex
+    client = get_redis()
+    ttl_ms = int(settings.RECLAIM_LOCK_TTL_SECONDS * 1000)
+    if not client.set(LOCK_KEY, token, nx=True, px=ttl_ms):
+        return None
+
+    def renew():
+        if not client.eval(_RENEW, 1, LOCK_KEY, token, ttl_ms):
+            raise LockLost(f"Reclaimer lock expired after {settings.RECLAIM_LOCK_TTL_SECONDS}s")
+
+    try:
+        return job(renew)
+    finally:
+        client.eval(_RELEASE, 1, LOCK_KEY, token)
+
+
+async def run_forever():
+    global _loop, _wake
+    _loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+    next_sweep = time.monotonic() + settings.RECLAIM_SWEEP_INTERVAL_SECONDS
+
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), settings.RECLAIM_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+        try:
+            while True:
+                stats = await _loop.run_in_executor(None, _locked, reclaim_deleted)
+                if stats is None or not (stats["documents"] or stats["chats"]):
+                    break
+                logger.info("Reclaimed %s", stats)
+
+            if settings.RECLAIM_SWEEP_INTERVAL_SECONDS > 0 and time.monotonic() >= next_sweep:
+                stats = await _loop.run_in_executor(None, _locked, sweep)
+                if stats is not None:
+                    next_sweep = time.monotonic() + settings.RECLAIM_SWEEP_INTERVAL_SECONDS
+                    logger.info("Sweep reclaimed %s", stats)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Reclaimer cycle failed")
@@ -1,16 +1,40 @@
 import redis
 import os
 import json
+from app.core.metrics import timed_dependency
 
-redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
+_redis_client = None
+
+
+def get_redis() -> redis.Redis:
+    # from_url does not connect; the pool opens connections on first command
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(os.getenv("REDIS_URL"), decode_responses=True)
+    return _redis_client
 
 def get_chat_memory(chat_id):
     key = f"chat_memory:{chat_id}"
-    memory = redis_client.lrange(key, 0, -1)
+    with timed_dependency("redis", "lrange"):
+        memory = get_redis().lrange(key, 0, -1)
     return [json.loads(msg) for msg in memory]
 
 def store_chat_memory(chat_id, msg, res):
     key = f"chat_memory:{chat_id}"
     entry = json.dumps({"msg": msg, "res": res})
-    redis_client.rpush(key, entry)
-    redis_client.ltrim(key, -20, -1)  
+    with timed_dependency("redis", "rpush_ltrim"):
+        redis_client = get_redis()
+        redis_client.rpush(key, entry)
+        redis_client.ltrim(key, -20, -1)
+
+def store_chat_memory_many(entries):
+    # entries: (chat_id, msg, res) in turn order; one round trip for the whole batch
+    if not entries:
+        return
+    with timed_dependency("redis", "rpush_ltrim_batch"):
+        pipe = get_redis().pipeline(transaction=False)
+        for chat_id, msg, res in entries:
+            key = f"chat_memory:{chat_id}"
+            pipe.rpush(key, json.dumps({"msg": msg, "res": res}))
+            pipe.ltrim(key, -20, -1)
+        pipe.execute()
@@ -0,0 +1,243 @@
+"""Blue/green re-embedding: move every vector to a new embedding model without retrieval downtime.
+
+A shadow collection is registered next to the active one. From then on every worker writes new
+chunks and deletes to both (each with its own model). The backfill copies the active collection's
+stored chunk text into the shadow collection with the same point ids, so no upload is re-parsed.
+The switch reconciles the two collections and flips the registry in one transaction; workers pick
+it up within EMBEDDING_REGISTRY_TTL_SECONDS. The previous collection keeps receiving writes until it
+is retired, so a rollback is a registry flip too.
+
+    python -m app.services.reembedding start --model BAAI/bge-small-en-v1.5
+    python -m app.services.reembedding backfill --batch-size 256 --pause 0.2   # resumes after a crash
+    python -m app.services.reembedding switch
+    python -m app.services.reembedding rollback
+    python -m app.services.reembedding retire
+    python -m app.services.reembedding status
+"""
+import argparse
+import logging
+import re
+import sys
+import time
+from datetime import datetime
+
+from app.core.config import settings
+from app.core.db import SessionLocal, init_schema
+from app.models.embedding_collection import EmbeddingCollection
+from app.services import vector_store
+from app.services.vector_store import COLLECTION, encode_batched, get_qdrant, upsert_points
+
+logger = logging.getLogger(__name__)
+
+
+class ReembeddingError(RuntimeError):
+    pass
+
+
+def _registered(db):
+    """Registry rows; the configured collection is recorded as active the first time this runs."""
+    rows = db.query(EmbeddingCollection).filter(EmbeddingCollection.status != "retired").all()
+    if rows:
+        return rows
+    info = get_qdrant().get_collection(COLLECTION)
+    row = EmbeddingCollection(
+        name=COLLECTION,
+        model=settings.EMBEDDING_MODEL,
+        dimension=info.config.params.vectors.size,
+        status="active",
+        activated_at=datetime.utcnow(),
+    )
+    db.add(row)
+    db.commit()
+    return [row]
+
+
+def _one(rows, status: str):
+    return next((row for row in rows if row.status == status), None)
+
+
+def _wait_for_workers(since: datetime):
+    # Workers may act on a cached registry for up to the TTL
+    remaining = settings.EMBEDDING_REGISTRY_TTL_SECONDS - (datetime.utcnow() - since).total_seconds()
+    if remaining > 0:
+        logger.info("Waiting %.1fs for every worker to reload the collection registry", remaining)
+        time.sleep(remaining)
+
+
+def start(db, model: str, name: str = None) -> EmbeddingCollection:
+    rows = _registered(db)
+    if _one(rows, "building"):
+        raise ReembeddingError(f"A re-embedding into {_one(rows, 'building').name} is already in progress")
+    if _one(rows, "previous"):
+        raise ReembeddingError(f"Retire {_one(rows, 'previous').name} first")
+
+    name = name or f"{COLLECTION}_{re.sub(r'[^a-z0-9]+', '_', model.lower()).strip('_')}"
+    dimension = len(vector_store.get_encoder(model).encode(["dimension probe"])[0])
+    vector_store.ensure_collection_and_indexes(dimension, name)
+    row = EmbeddingCollection(name=name, model=model, dimension=dimension, status="building")
+    db.add(row)
+    db.commit()
+    logger.info("Registered shadow collection %s (%s, %d dimensions)", name, model, dimension)
+    return row
+
+
+def _copy(points, target: EmbeddingCollection):
+    points = [point for point in points if (point.payload or {}).get("text")]
+    if not points:
+        return 0
+    vectors = encode_batched([point.payload["text"] for point in points], target.model)
+    upsert_points(target.name, [point.id for point in points], vectors, [point.payload for point in points])
+    return len(points)
+
+
+def backfill(db, batch_size: int, pause: float):
+    """Copy the active collection into the shadow one, committing the scroll offset after every batch."""
+    rows = _registered(db)
+    source, target = _one(rows, "active"), _one(rows, "building")
+    if target is None:
+        raise ReembeddingError("No re-embedding in progress; run start first")
+    if target.backfill_done:
+        logger.info("Backfill of %s already finished", target.name)
+        return
+    # Points written before every worker dual-writes are not guaranteed to be seen by the scroll;
+    # waiting first leaves only the ones the switch's reconcile catches
+    _wait_for_workers(target.created_at)
+
+    qdrant = get_qdrant()
+    offset = target.backfill_offset
+    while True:
+        points, next_offset = qdrant.scroll(
+            collection_name=source.name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        copied = _copy(points, target)
+        # Upserts by id are idempotent: a batch redone after a crash is harmless
+        target.copied = (target.copied or 0) + copied
+        target.backfill_offset = None if next_offset is None else str(next_offset)
+        target.backfill_done = next_offset is None
+        db.commit()
+        logger.info("Copied %d points into %s; next offset %s", target.copied, target.name, next_offset)
+        if next_offset is None:
+            return
+        offset = next_offset
+        if pause:
+            # Leave encoder and Qdrant capacity for live traffic
+            time.sleep(pause)
+
+
+def reconcile(source: EmbeddingCollection, target: EmbeddingCollection, batch_size: int = 256):
+    """Make target hold exactly source's point ids: copy the missing ones, drop the extra ones.
+
+    Catches what the backfill raced with: points deleted while their batch was in flight, and
+    points written in between the backfill's scroll position and the workers' dual writes.
+    """
+    qdrant = get_qdrant()
+    added = removed = 0
+    for this, other, missing_in_other in ((source, target, "copy"), (target, source, "delete")):
+        offset = None
+        while True:
+            points, offset = qdrant.scroll(
+                collection_name=this.name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=missing_in_other == "copy",
+                with_vectors=False,
+            )
+            present = {point.id for point in qdrant.retrieve(
+                collection_name=other.name, ids=[point.id for point in points], with_payload=False
+            )}
+            missing = [point for point in points if point.id not in present]
+            if missing and missing_in_other == "copy":
+                added += _copy(missing, target)
+            elif missing:
+                removed += vector_store.delete_points([point.id for point in missing])
+            if offset is None:
+                break
+    return added, removed
+
+
+def switch(db):
+    rows = _registered(db)
+    source, target = _one(rows, "active"), _one(rows, "building")
+    if target is None or not target.backfill_done:
+        raise ReembeddingError("The shadow collection is not backfilled yet")
+    if _one(rows, "previous"):
+        raise ReembeddingError(f"Retire {_one(rows, 'previous').name} first")
+
+    added, removed = reconcile(source, target)
+    logger.info("Reconciled %s: %d points added, %d removed", target.name, added, removed)
+    # One transaction: a worker reloading the registry sees either the old or the new active collection
+    source.status = "previous"
+    target.status = "active"
+    target.activated_at = datetime.utcnow()
+    db.commit()
+    logger.info("Switched searches from %s to %s", source.name, target.name)
+
+
+def rollback(db):
+    rows = _registered(db)
+    current, previous = _one(rows, "active"), _one(rows, "previous")
+    if previous is None:
+        raise ReembeddingError("Nothing to roll back to")
+    # The rolled-back collection stays dual-written, ready to be switched to again
+    current.status = "building"
+    previous.status = "active"
+    previous.activated_at = datetime.utcnow()
+    db.commit()
+    logger.info("Rolled searches back from %s to %s", current.name, previous.name)
+
+
+def retire(db):
+    rows = _registered(db)
+    active, previous = _one(rows, "active"), _one(rows, "previous")
+    if previous is None:
+        raise ReembeddingError("No previous collection to retire")
+    # A worker may still be searching it with a cached registry
+    _wait_for_workers(active.activated_at)
+    previous.status = "retired"
+    db.commit()
+    _wait_for_workers(datetime.utcnow())
+    get_qdrant().delete_collection(previous.name)
+    logger.info("Retired and dropped %s", previous.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed every vector with a new embedding model (blue/green)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    start_parser = commands.add_parser("start", help="Register and create the shadow collection")
+    start_parser.add_argument("--model", required=True)
+    start_parser.add_argument("--collection", default=None)
+    backfill_parser = commands.add_parser("backfill", help="Copy stored chunks into the shadow collection")
+    backfill_parser.add_argument("--batch-size", type=int, default=256)
+    backfill_parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    for command in ("switch", "rollback", "retire", "status"):
+        commands.add_parser(command)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_schema()
+    db = SessionLocal()
+    try:
+        if args.command == "start":
+            start(db, args.model, args.collection)
+        elif args.command == "backfill":
+            backfill(db, args.batch_size, args.pause)
+        elif args.command == "switch":
+            switch(db)
+        elif args.command == "rollback":
+            rollback(db)
+        elif args.command == "retire":
+            retire(db)
+        for row in _registered(db):
+            print(f"{row.name}\t{row.model}\t{row.dimension}\t{row.status}\tcopied={row.copied or 0}")
+    except ReembeddingError as e:
+        sys.exit(str(e))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
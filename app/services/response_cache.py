@@ -0,0 +1,188 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import time
+import uuid
+from typing import AsyncGenerator, Optional
+
+import numpy as np
+import redis
+
+from app.core.config import settings
+from app.core.metrics import LLM_CACHE, timed_dependency
+from app.services.redis_cache import get_redis
+
+logger = logging.getLogger(__name__)
+
+EXACT_PREFIX = "llm_cache:exact:"
+EXACT_INDEX = "llm_cache:exact:index"
+SEMANTIC_PREFIX = "llm_cache:semantic:"
+SEMANTIC_INDEX = "llm_cache:semantic:index"
+VECTORS_SUFFIX = ":vectors"
+RESPONSES_SUFFIX = ":responses"
+
+
+class CacheHit:
+    def __init__(self, tier: str, response: str, similarity: float = 1.0):
+        self.tier = tier
+        self.response = response
+        self.similarity = similarity
+
+    def headers(self) -> dict:
+        return {"X-Cache": self.tier, "X-Cache-Similarity": f"{self.similarity:.4f}"}
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def corpus_version(context_text: str, embedding_model: str = "") -> str:
+    # The retrieved context is exactly what the answer was grounded on: any upload or delete
+    # that changes it changes the version, so semantic hits never cross document changes.
+    # The embedding model is part of it too: question vectors of different models are not comparable
+    return _digest(embedding_model, context_text)[:16]
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def _evict(client: redis.Redis, index: str, max_entries: int, ttl: int, remove):
+    # Entries past their TTL first, then the least recently used ones over the size cap
+    client.zremrangebyscore(index, "-inf", time.time() - ttl)
+    excess = client.zcard(index) - max_entries
+    if excess > 0:
+        for member, _ in client.zpopmin(index, excess):
+            remove(member)
+
+
+def lookup_exact(model: str, prompt: str) -> Optional[CacheHit]:
+    key = _digest(model, normalize_prompt(prompt))
+    client = get_redis()
+    with timed_dependency("redis", "cache_get"):
+        cached = client.get(EXACT_PREFIX + key)
+        if cached is None:
+            return None
+        client.zadd(EXACT_INDEX, {key: time.time()}, xx=True)
+    return CacheHit("exact", json.loads(cached)["response"])
+
+
+def _semantic_bucket(model: str, tenant: str, version: str) -> str:
+    # Per tenant: a question close to another workspace's must never be answered from its documents
+    return SEMANTIC_PREFIX + _digest(model, tenant, version)
+
+
+def lookup_semantic(model: str, tenant: str, version: str, question_vector) -> Optional[CacheHit]:
+    # Vectors and responses live in two hashes: the scan reads only the vectors, the winner's
+    # response is fetched on its own
+    bucket = _semantic_bucket(model, tenant, version)
+    client = get_redis()
+    with timed_dependency("redis", "cache_scan"):
+        entries = client.hgetall(bucket + VECTORS_SUFFIX)
+    if not entries:
+        return None
+
+    cutoff = time.time() - settings.LLM_CACHE_SEMANTIC_TTL_SECONDS
+    live, stale = [], []
+    for entry_id, raw in entries.items():
+        at, vector = raw.split("|", 1)
+        (live if float(at) >= cutoff else stale).append((entry_id, vector))
+    if stale:
+        _remove_semantic(client, bucket, [entry_id for entry_id, _ in stale])
+    if not live:
+        return None
+
+    matrix = np.stack([np.frombuffer(base64.b64decode(vector), dtype=np.float32) for _, vector in live])
+    query = np.asarray(question_vector, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+    scores = matrix @ query
+    best = int(np.argmax(scores))
+    if scores[best] < settings.LLM_CACHE_SEMANTIC_THRESHOLD:
+        return None
+
+    entry_id = live[best][0]
+    with timed_dependency("redis", "cache_get"):
+        response = client.hget(bucket + RESPONSES_SUFFIX, entry_id)
+    if response is None:
+        return None
+    client.zadd(SEMANTIC_INDEX, {f"{bucket}|{entry_id}": time.time()}, xx=True)
+    return CacheHit("semantic", response, float(scores[best]))
+
+
+def _remove_semantic(client: redis.Redis, bucket: str, entry_ids):
+    pipe = client.pipeline()
+    pipe.hdel(bucket + VECTORS_SUFFIX, *entry_ids)
+    pipe.hdel(bucket + RESPONSES_SUFFIX, *entry_ids)
+    pipe.execute()
+
+
+def lookup(model: str, prompt: str, version: Optional[str] = None, question_vector=None,
+           tenant: Optional[str] = None) -> Optional[CacheHit]:
+    """Exact tier first; the semantic tier only when the caller passes a corpus version, question vector and tenant.
+
+    Redis trouble is a miss, never a failed chat turn.
+    """
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    try:
+        hit = lookup_exact(model, prompt)
+        if (hit is None and settings.LLM_CACHE_SEMANTIC and version is not None and question_vector is not None
+                and tenant is not None):
+            hit = lookup_semantic(model, tenant, version, question_vector)
+    except redis.RedisError as e:
+        logger.warning("Response cache lookup failed: %s", e)
+        hit = None
+    LLM_CACHE.labels(hit.tier if hit else "miss").inc()
+    return hit
+
+
+def store(model: str, prompt: str, response: str, version: Optional[str] = None, question_vector=None,
+          tenant: Optional[str] = None):
+    if not settings.LLM_CACHE_ENABLED or not response:
+        return
+    client = get_redis()
+    now = time.time()
+    try:
+        key = _digest(model, normalize_prompt(prompt))
+        with timed_dependency("redis", "cache_set"):
+            pipe = client.pipeline()
+            pipe.set(EXACT_PREFIX + key, json.dumps({"response": response}), ex=settings.LLM_CACHE_EXACT_TTL_SECONDS)
+            pipe.zadd(EXACT_INDEX, {key: now})
+            pipe.execute()
+            _evict(client, EXACT_INDEX, settings.LLM_CACHE_EXACT_MAX_ENTRIES, settings.LLM_CACHE_EXACT_TTL_SECONDS,
+                   lambda member: client.delete(EXACT_PREFIX + member))
+
+        if not settings.LLM_CACHE_SEMANTIC or version is None or question_vector is None or tenant is None:
+            return
+        bucket = _semantic_bucket(model, tenant, version)
+        entry_id = uuid.uuid4().hex
+        vector = base64.b64encode(np.asarray(question_vector, dtype=np.float32).tobytes()).decode()
+        with timed_dependency("redis", "cache_set"):
+            pipe = client.pipeline()
+            pipe.hset(bucket + VECTORS_SUFFIX, entry_id, f"{now}|{vector}")
+            pipe.hset(bucket + RESPONSES_SUFFIX, entry_id, response)
+            pipe.expire(bucket + VECTORS_SUFFIX, settings.LLM_CACHE_SEMANTIC_TTL_SECONDS)
+            pipe.expire(bucket + RESPONSES_SUFFIX, settings.LLM_CACHE_SEMANTIC_TTL_SECONDS)
+            pipe.zadd(SEMANTIC_INDEX, {f"{bucket}|{entry_id}": now})
+            pipe.execute()
+
+            def remove(member):
+                member_bucket, member_id = member.rsplit("|", 1)
+                _remove_semantic(client, member_bucket, [member_id])
+
+            _evict(client, SEMANTIC_INDEX, settings.LLM_CACHE_SEMANTIC_MAX_ENTRIES,
+                   settings.LLM_CACHE_SEMANTIC_TTL_SECONDS, remove)
+    except redis.RedisError as e:
+        logger.warning("Response cache store failed: %s", e)
+
+
+async def replay(response: str) -> AsyncGenerator[str, None]:
+    # Simulated stream so clients see the same chunked body as a live generation
+    size = max(settings.LLM_CACHE_REPLAY_CHUNK_CHARS, 1)
+    for i in range(0, len(response), size):
+        yield response[i:i + size]
+        await asyncio.sleep(0)
@@ -0,0 +1,79 @@
+"""Add the columns and indexes the models have gained to tables that already exist.
+
+init_schema (create_all) only creates missing tables; a database created before a model gained a
+column (chats.deleted_at, documents.deleted_at / size_bytes / user_id / workspace_id,
+workspaces.organization_id, messages.status / model / *_tokens, ...) needs them added before the
+API queries them. Idempotent: existing columns and indexes are skipped, so it is safe to rerun.
+
+    python -m app.services.schema_migration --dry-run
+    python -m app.services.schema_migration
+"""
+import argparse
+import logging
+from typing import List
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+from app.core.db import Base, engine, init_schema
+
+logger = logging.getLogger(__name__)
+
+
+def missing_columns(conn) -> List[str]:
+    """ALTER TABLE statements for model columns the existing tables lack."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    # Only PostgreSQL has IF NOT EXISTS here; it keeps two concurrent runs from failing
+    if_not_exists = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+    statements = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # created whole by init_schema
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            if column.primary_key:
+                raise RuntimeError(f"{table.name}.{column.name} is a new primary key column; migrate it by hand")
+            # Foreign keys are not added: the application does not rely on them for new columns
+            spec = CreateColumn(column).compile(dialect=conn.dialect)
+            statements.append(f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{spec}")
+    return statements
+
+
+def upgrade_schema(dry_run: bool = False) -> List[str]:
+    """Create missing tables, then add missing columns and indexes. Returns what was (or would be) run."""
+    import app.models  # noqa: F401 - registers every model on Base.metadata
+
+    with engine.connect() as conn:
+        statements = missing_columns(conn)
+    if dry_run:
+        return statements
+
+    init_schema()
+    with engine.begin() as conn:
+        for statement in statements:
+            logger.info("%s", statement)
+            conn.execute(text(statement))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add new model columns and indexes to existing tables")
+    parser.add_argument("--dry-run", action="store_true", help="Print the ALTER TABLE statements only")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    statements = upgrade_schema(args.dry_run)
+    if args.dry_run:
+        print("\n".join(statements) or "Nothing to add")
+    else:
+        logger.info("Schema up to date (%d columns added)", len(statements))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, Optional, Set
+
+from app.core.metrics import LLM_SINGLE_FLIGHT
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class _Flight:
+    def __init__(self, replay_size: int):
+        self.replay: deque = deque(maxlen=replay_size)
+        self.emitted = 0
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.done = False
+        self.task: Optional[asyncio.Task] = None
+
+    def replay_complete(self) -> bool:
+        # A late joiner can only be served if nothing has fallen out of the ring buffer yet
+        return self.emitted <= self.replay.maxlen
+
+
+class SingleFlight:
+    """Coalesces identical concurrent streams: one upstream generator fanned out to every subscriber.
+
+    Subscribers that join late get the chunks emitted so far replayed from a bounded ring buffer.
+    The upstream is cancelled only when its last subscriber leaves.
+    """
+
+    def __init__(self, replay_size: int):
+        self.replay_size = replay_size
+        self._flights: Dict[str, _Flight] = {}
+
+    async def _pump(self, key: str, flight: _Flight, factory: Callable[[], AsyncGenerator[str, None]]):
+        end = _END
+        try:
+            async with aclosing(factory()) as upstream:
+                async for chunk in upstream:
+                    flight.replay.append(chunk)
+                    flight.emitted += 1
+                    for queue in flight.subscribers:
+                        queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            end = _Failure(e)
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        for queue in flight.subscribers:
+            queue.put_nowait(end)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncGenerator[str, None]]) -> AsyncGenerator[str, None]:
+        flight = self._flights.get(key)
+        if flight is not None and not flight.replay_complete():
+            # Too far along to replay: serve this request on its own upstream
+            LLM_SINGLE_FLIGHT.labels("bypass").inc()
+            async with aclosing(factory()) as upstream:
+                async for chunk in upstream:
+                    yield chunk
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        if flight is None:
+            LLM_SINGLE_FLIGHT.labels("leader").inc()
+            flight = _Flight(self.replay_size)
+            self._flights[key] = flight
+            flight.subscribers.add(queue)
+            flight.task = asyncio.create_task(self._pump(key, flight, factory))
+        else:
+            LLM_SINGLE_FLIGHT.labels("follower").inc()
+            for chunk in flight.replay:
+                queue.put_nowait(chunk)
+            flight.subscribers.add(queue)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            flight.subscribers.discard(queue)
+            if not flight.subscribers and not flight.done:
+                # Last subscriber gone: stop paying for the upstream generation
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def in_flight(self) -> int:
+        return len(self._flights)
@@ -0,0 +1,140 @@
+"""Backfill tenant fields (workspace_id, organization_id) on existing vectors and documents.
+
+Runs against the live collection: set_payload only adds fields, and chat-scoped searches keep
+filtering on chat_id alone until VECTOR_DB_TENANT_FILTER is switched on after the migration.
+The columns it fills (documents.workspace_id, workspaces.organization_id) are added first if missing
+(app.services.schema_migration).
+
+    python -m app.services.tenant_migration --batch-size 512 --pause 0.1
+    python -m app.services.tenant_migration --offset <point id printed by an interrupted run>
+"""
+import argparse
+import logging
+import time
+import uuid
+from collections import defaultdict
+
+from qdrant_client.models import Filter, IsEmptyCondition, PayloadField
+from sqlalchemy import select, update
+
+from app.core.db import SessionLocal
+from app.models.chat import Chat
+from app.models.document import Document
+from app.models.workspace import Workspace
+from app.services.schema_migration import upgrade_schema
+from app.services.vector_store import active_collection, get_qdrant, tenant_payload, write_collections
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_documents(db) -> int:
+    # Chat documents inherit the chat's workspace
+    result = db.execute(
+        update(Document)
+        .where(Document.workspace_id.is_(None), Document.chat_id.is_not(None))
+        .values(workspace_id=select(Chat.workspace_id).where(Chat.id == Document.chat_id).scalar_subquery())
+    )
+    db.commit()
+    return result.rowcount
+
+
+def _as_uuid(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _resolve(db, keys):
+    """chat_id payload value -> (chat_id or None, workspace_id, organization_id)."""
+    ids = {key: _as_uuid(key) for key in keys}
+    valid = [i for i in ids.values() if i is not None]
+    chats = {
+        str(chat_id): (chat_id, workspace_id, organization_id)
+        for chat_id, workspace_id, organization_id in db.query(Chat.id, Chat.workspace_id, Workspace.organization_id)
+        .outerjoin(Workspace, Workspace.id == Chat.workspace_id)
+        .filter(Chat.id.in_(valid))
+    }
+    # Workspace uploads used to be stored with chat_id set to the workspace id
+    workspaces = {
+        str(workspace_id): (None, workspace_id, organization_id)
+        for workspace_id, organization_id in db.query(Workspace.id, Workspace.organization_id)
+        .filter(Workspace.id.in_([i for i in valid if str(i) not in chats]))
+    }
+    return {**chats, **workspaces}
+
+
+def migrate_points(batch_size: int, pause: float, offset=None, dry_run: bool = False):
+    qdrant = get_qdrant()
+    source = active_collection().name
+    pending = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="workspace_id"))])
+    migrated = orphaned = 0
+
+    while True:
+        points, next_offset = qdrant.scroll(
+            collection_name=source,
+            scroll_filter=pending,
+            limit=batch_size,
+            offset=offset,
+            with_payload=["chat_id"],
+            with_vectors=False,
+        )
+        groups = defaultdict(list)
+        for point in points:
+            groups[point.payload.get("chat_id")].append(point.id)
+
+        db = SessionLocal()
+        try:
+            tenants = _resolve(db, [key for key in groups if key is not None])
+        finally:
+            db.close()
+
+        for key, point_ids in groups.items():
+            if key not in tenants:
+                # Vectors of deleted chats: left alone for the reclaimer
+                orphaned += len(point_ids)
+                continue
+            chat_id, workspace_id, organization_id = tenants[key]
+            if not dry_run:
+                # A re-embedding in progress shares point ids, so its collection is patched the same way
+                for collection in write_collections():
+                    qdrant.set_payload(
+                        collection_name=collection.name,
+                        payload=tenant_payload(chat_id, workspace_id, organization_id),
+                        points=point_ids,
+                    )
+                    if chat_id is None:
+                        qdrant.delete_payload(collection_name=collection.name, keys=["chat_id"], points=point_ids)
+            migrated += len(point_ids)
+
+        logger.info("Migrated %d points (%d orphaned); resume with --offset %s", migrated, orphaned, next_offset)
+        if next_offset is None:
+            return migrated, orphaned
+        offset = next_offset
+        if pause:
+            # Leave search capacity for live traffic
+            time.sleep(pause)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill workspace/organization tenant fields on vectors")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+    parser.add_argument("--offset", default=None, help="Point id to resume from")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.dry_run:
+        upgrade_schema()
+        db = SessionLocal()
+        try:
+            logger.info("Backfilled workspace_id on %d documents", backfill_documents(db))
+        finally:
+            db.close()
+    migrated, orphaned = migrate_points(args.batch_size, args.pause, args.offset, args.dry_run)
+    logger.info("Done: %d points migrated, %d orphaned", migrated, orphaned)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Usage rollups: turns, tokens, documents and bytes per user, workspace and organization per hour and day.
+
+Chat turns and uploads are recorded in memory by each worker and flushed every USAGE_FLUSH_SECONDS as
+one batch of additive upserts, so the request path never touches the rollup tables. A worker that
+dies loses at most its unflushed interval. Closed periods, including history from before usage
+capture, can be recomputed from messages and documents:
+
+    python -m app.services.usage rebuild --since 2026-01-01
+"""
+import argparse
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.db import SessionLocal, engine
+from app.models.chat import Chat
+from app.models.document import Document
+from app.models.message import Message
+from app.models.usage_rollup import UsageRollup
+from app.models.workspace import Workspace
+from app.utils.bulk import upsert
+from app.utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("turns", "prompt_tokens", "completion_tokens", "documents", "bytes_ingested")
+GRANULARITIES = ("hour", "day")
+FLUSH_CHUNK = 1000
+
+Key = Tuple[str, str, str, datetime]  # level, subject_id, granularity, bucket_start
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add(totals: Dict[Key, list], at: datetime, subjects, values):
+    for level, subject_id in subjects:
+        if subject_id is None:
+            continue
+        for granularity in GRANULARITIES:
+            row = totals[(level, subject_id, granularity, bucket_start(at, granularity))]
+            for i, value in enumerate(values):
+                row[i] += value
+
+
+def _rows(totals: Dict[Key, list]):
+    return [
+        {"level": level, "subject_id": subject_id, "granularity": granularity, "bucket_start": start,
+         **dict(zip(METRICS, values))}
+        for (level, subject_id, granularity, start), values in totals.items()
+    ]
+
+
+class UsageAggregator:
+    """Per-worker in-memory totals, keyed by rollup row, flushed in batches by run_forever."""
+
+    def __init__(self):
+        self._totals: Dict[Key, list] = defaultdict(lambda: [0] * len(METRICS))
+        self._lock = threading.Lock()
+
+    def _record(self, user_id, workspace_id, organization_id, values, at: Optional[datetime] = None):
+        if not settings.USAGE_ROLLUPS_ENABLED:
+            return
+        subjects = (("user", user_id), ("workspace", workspace_id), ("organization", organization_id))
+        with self._lock:
+            _add(self._totals, at or datetime.utcnow(), subjects, values)
+
+    def record_turn(self, user_id, workspace_id, organization_id, prompt_tokens: int, completion_tokens: int):
+        self._record(user_id, workspace_id, organization_id, (1, prompt_tokens, completion_tokens, 0, 0))
+
+    def record_upload(self, user_id, workspace_id, organization_id, documents: int, size_bytes: int):
+        self._record(user_id, workspace_id, organization_id, (0, 0, 0, documents, size_bytes))
+
+    def flush(self) -> int:
+        with self._lock:
+            totals, self._totals = self._totals, defaultdict(lambda: [0] * len(METRICS))
+        if not totals:
+            return 0
+        rows = _rows(totals)
+        try:
+            with engine.begin() as conn:
+                for i in range(0, len(rows), FLUSH_CHUNK):
+                    conn.execute(upsert(
+                        UsageRollup, rows[i:i + FLUSH_CHUNK],
+                        ["level", "subject_id", "granularity", "bucket_start"], increment_columns=METRICS,
+                    ))
+        except Exception:
+            # Nothing was committed: fold the totals back in for the next flush
+            with self._lock:
+                for key, values in totals.items():
+                    pending = self._totals[key]
+                    for i, value in enumerate(values):
+                        pending[i] += value
+            raise
+        return len(rows)
+
+    async def run_forever(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                await asyncio.sleep(settings.USAGE_FLUSH_SECONDS)
+                try:
+                    await loop.run_in_executor(None, self.flush)
+                except Exception:
+                    logger.exception("Usage rollup flush failed; retrying next interval")
+        finally:
+            # Shutdown: what is left goes out with the last flush
+            await loop.run_in_executor(None, self.flush)
+
+
+aggregator = UsageAggregator()
+
+
+def rebuild(db, since: datetime, until: datetime) -> int:
+    """Recompute every rollup bucket in [since, until) from messages and documents, in one transaction.
+
+    Meant for closed periods: turns recorded by live workers for the same buckets while it runs
+    would be counted twice or lost.
+    """
+    since = bucket_start(since, "day")
+    until = bucket_start(until, "hour")
+    totals: Dict[Key, list] = defaultdict(lambda: [0] * len(METRICS))
+
+    turns = db.query(
+        Message.created_at, Message.user_id, Chat.workspace_id, Workspace.organization_id,
+        Message.prompt_tokens, Message.completion_tokens, Message.content, Message.response,
+    ).join(Chat, Message.chat_id == Chat.id).outerjoin(Workspace, Chat.workspace_id == Workspace.id).filter(
+        Message.created_at >= since, Message.created_at < until
+    )
+    for at, user_id, workspace_id, organization_id, prompt_tokens, completion_tokens, content, response in turns.yield_per(1000):
+        # Turns from before usage capture: estimate from the stored text
+        if prompt_tokens is None:
+            prompt_tokens = estimate_tokens(content)
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(response)
+        _add(totals, at, (("user", user_id), ("workspace", workspace_id), ("organization", organization_id)),
+             (1, prompt_tokens, completion_tokens, 0, 0))
+
+    # Documents from before usage capture have no uploader: they count for the chat's owner
+    documents = db.query(
+        Document.uploaded_at, func.coalesce(Document.user_id, Chat.user_id), Document.workspace_id,
+        Workspace.organization_id, Document.size_bytes,
+    ).outerjoin(Chat, Document.chat_id == Chat.id).outerjoin(Workspace, Document.workspace_id == Workspace.id).filter(
+        Document.uploaded_at >= since, Document.uploaded_at < until
+    )
+    for at, user_id, workspace_id, organization_id, size_bytes in documents.yield_per(1000):
+        _add(totals, at, (("user", user_id), ("workspace", workspace_id), ("organization", organization_id)),
+             (0, 0, 0, 1, size_bytes or 0))
+
+    # Day buckets are only rebuilt whole
+    day_until = bucket_start(until, "day")
+    for key in [k for k in totals if k[2] == "day" and k[3] >= day_until]:
+        del totals[key]
+    db.query(UsageRollup).filter(
+        UsageRollup.granularity == "hour", UsageRollup.bucket_start >= since, UsageRollup.bucket_start < until
+    ).delete(synchronize_session=False)
+    db.query(UsageRollup).filter(
+        UsageRollup.granularity == "day", UsageRollup.bucket_start >= since, UsageRollup.bucket_start < day_until
+    ).delete(synchronize_session=False)
+    rows = _rows(totals)
+    for i in range(0, len(rows), FLUSH_CHUNK):
+        db.execute(upsert(UsageRollup, rows[i:i + FLUSH_CHUNK], ["level", "subject_id", "granularity", "bucket_start"]))
+    db.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute usage rollups from messages and documents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild")
+    rebuild_parser.add_argument("--since", type=datetime.fromisoformat, required=True, help="UTC date, e.g. 2026-01-01")
+    rebuild_parser.add_argument(
+        "--until", type=datetime.fromisoformat, default=None, help="UTC; default: the start of the current hour"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    until = args.until or datetime.utcnow()
+    db = SessionLocal()
+    try:
+        logger.info("Rebuilt %d rollup rows", rebuild(db, args.since, until))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,134 +1,402 @@
+import logging
+import time
 import uuid
+import threading
+from typing import List, NamedTuple
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import (
     Filter,
     FieldCondition,
+    MatchAny,
     MatchValue,
+    PointIdsList,
     PointStruct,
+    Range,
     VectorParams,
     Distance,
 )
-from qdrant_client.models import PayloadSchemaType
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import (
+    IsEmptyCondition,
+    KeywordIndexParams,
+    KeywordIndexType,
+    PayloadField,
+    PayloadSchemaType,
+)
 from app.core.config import settings
+from app.core.db import SessionLocal
+from app.services.embedding import EMBEDDING_MODEL, load_encoder
+from app.core.metrics import timed, timed_dependency
+from app.models.embedding_collection import EmbeddingCollection
+
+logger = logging.getLogger(__name__)
 
 # Load ENV
 QDRANT_URL = settings.VECTOR_DB_URL
 QDRANT_API_KEY = settings.VECTOR_DB_API_KEY
 COLLECTION = settings.VECTOR_DB_COLLECTION
 
-# Initialize Qdrant Client
-qdrant = QdrantClient(
-    url=QDRANT_URL,
-    api_key=QDRANT_API_KEY,
-)
+_qdrant = None
+_encoders = {}
+_init_lock = threading.Lock()
+_ensured = set()
+_encoding = 0
+_encoding_lock = threading.Lock()
+
+
+# Qdrant client and embedding model are created on first use (or by the startup warmup)
+def get_qdrant() -> QdrantClient:
+    global _qdrant
+    if _qdrant is None:
+        with _init_lock:
+            if _qdrant is None:
+                if QDRANT_URL == ":memory:":
+                    # Process-local store for tests and benchmarks
+                    _qdrant = QdrantClient(location=":memory:")
+                else:
+                    _qdrant = QdrantClient(
+                        url=QDRANT_URL,
+                        api_key=QDRANT_API_KEY,
+                    )
+    return _qdrant
+
+
+class Collection(NamedTuple):
+    name: str
+    model: str
+    status: str
+
+
+# Before the first re-embedding the registry is empty and the configured collection is the active one
+_DEFAULT_REGISTRY = [Collection(COLLECTION, EMBEDDING_MODEL, "active")]
+_registry: List[Collection] = []
+_registry_expires = 0.0
+
+
+def registry() -> List[Collection]:
+    """Live collections, cached for EMBEDDING_REGISTRY_TTL_SECONDS so a switch reaches every worker quickly."""
+    global _registry, _registry_expires
+    if time.monotonic() < _registry_expires:
+        return _registry
+    db = SessionLocal()
+    try:
+        rows = db.query(EmbeddingCollection.name, EmbeddingCollection.model, EmbeddingCollection.status).filter(
+            EmbeddingCollection.status != "retired"
+        ).all()
+        _registry = [Collection(*row) for row in rows] or _DEFAULT_REGISTRY
+    except Exception as e:
+        # Keep serving from the last known registry while the database is unavailable
+        logger.warning("Collection registry unavailable: %s", e)
+        _registry = _registry or _DEFAULT_REGISTRY
+    finally:
+        db.close()
+    _registry_expires = time.monotonic() + settings.EMBEDDING_REGISTRY_TTL_SECONDS
+    return _registry
+
+
+def invalidate_registry():
+    global _registry_expires
+    _registry_expires = 0.0
+
+
+def active_collection() -> Collection:
+    return next(c for c in registry() if c.status == "active")
+
 
-# Load embedding model
-encoder = SentenceTransformer("all-MiniLM-L6-v2")
+def write_collections() -> List[Collection]:
+    # During a re-embedding new vectors go to the shadow (building) collection too, and after the
+    # switch to the previous one, so a rollback finds it complete
+    return registry()
 
 
-def ensure_collection_and_indexes(vector_size: int):
+def get_encoder(model: str = None):
+    model = model or active_collection().model
+    if model not in _encoders:
+        with _init_lock:
+            if model not in _encoders:
+                _encoders[model] = load_encoder(model)
+    return _encoders[model]
+
+
+def embedding_queue_depth() -> int:
+    # Encode calls running or waiting for the model (or sidecar) in this worker; read by admission control
+    return _encoding
+
+
+def _encode(texts, model: str = None):
+    global _encoding
+    with _encoding_lock:
+        _encoding += 1
+    try:
+        return get_encoder(model).encode(texts)
+    finally:
+        with _encoding_lock:
+            _encoding -= 1
+
+
+def ensure_collection_and_indexes(vector_size: int, collection: str = COLLECTION):
+    # Checked once per process; afterwards this is a set lookup instead of three Qdrant calls per request
+    if collection in _ensured:
+        return
+    qdrant = get_qdrant()
     collections = qdrant.get_collections().collections
-    collection_exists = COLLECTION in [c.name for c in collections]
+    collection_exists = collection in [c.name for c in collections]
     
     if not collection_exists:
         # Create collection
         qdrant.recreate_collection(
-            collection_name=COLLECTION,
+            collection_name=collection,
             vectors_config=VectorParams(
                 size=vector_size,
                 distance=Distance.COSINE,
             ),
         )
     
-    # Always try to create indexes (they will be ignored if they already exist)
-    try:
-        qdrant.create_payload_index(
-            collection_name=COLLECTION,
-            field_name="chat_id",
-            field_schema=PayloadSchemaType.KEYWORD,
-        )
-    except Exception:
-        # Index might already exist, ignore the error
-        pass
-    
-    try:
-        qdrant.create_payload_index(
-            collection_name=COLLECTION,
-            field_name="filename",
-            field_schema=PayloadSchemaType.KEYWORD,
-        )
-    except Exception:
-        # Index might already exist, ignore the error
-        pass
+    # Always try to create indexes (they will be ignored if they already exist).
+    # workspace_id is the tenant key: Qdrant co-locates each tenant's points and builds per-tenant
+    # HNSW graphs, so filtered searches only touch that workspace's part of the collection.
+    indexes = {
+        "workspace_id": KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+        "organization_id": PayloadSchemaType.KEYWORD,
+        "chat_id": PayloadSchemaType.KEYWORD,
+        "filename": PayloadSchemaType.KEYWORD,
+        "deleted": PayloadSchemaType.BOOL,
+    }
+    for field_name, field_schema in indexes.items():
+        try:
+            qdrant.create_payload_index(
+                collection_name=collection,
+                field_name=field_name,
+                field_schema=field_schema,
+            )
+        except Exception:
+            # Index might already exist, ignore the error
+            pass
+    _ensured.add(collection)
+
 
+def tenant_filter(scope: str, chat_id=None, workspace_id=None, organization_id=None) -> Filter:
+    """Search filter for a retrieval scope: one chat, a whole workspace, or every workspace of an organization."""
+    if scope == "chat":
+        must = [FieldCondition(key="chat_id", match=MatchValue(value=str(chat_id)))]
+        if settings.VECTOR_DB_TENANT_FILTER and workspace_id is not None:
+            # Only once every point carries workspace_id (see app.services.tenant_migration)
+            must.append(FieldCondition(key="workspace_id", match=MatchValue(value=str(workspace_id))))
+    elif scope == "workspace":
+        must = [FieldCondition(key="workspace_id", match=MatchValue(value=str(workspace_id)))]
+    elif scope == "organization":
+        must = [FieldCondition(key="organization_id", match=MatchValue(value=str(organization_id)))]
+    else:
+        raise ValueError(f"Unknown search scope: {scope}")
+    # Points of logically deleted documents and chats are hidden until the reclaimer removes them
+    return Filter(must=must, must_not=[FieldCondition(key="deleted", match=MatchValue(value=True))])
 
-# Search similar chunks by chat
-def search_context(query: str, chat_id):
-    query_vector = encoder.encode(query).tolist()
+
+def embed_query(query: str, collection: Collection = None):
+    collection = collection or active_collection()
+    with timed("embedding.query"):
+        return _encode(query, collection.model).tolist()
+
+
+# Search similar chunks in a chat (default), its workspace or its organization.
+# A query_vector must come from the same collection's model: pass the collection used for embed_query.
+def search_context(query: str, chat_id, query_vector=None, scope: str = "chat", workspace_id=None,
+                   organization_id=None, collection: Collection = None):
+    collection = collection or active_collection()
+    if query_vector is None:
+        query_vector = embed_query(query, collection)
 
     # Ensure collection and index exist
-    ensure_collection_and_indexes(vector_size=len(query_vector))
+    ensure_collection_and_indexes(len(query_vector), collection.name)
 
     # Perform search
-    results = qdrant.search(
-        collection_name=COLLECTION,
-        query_vector=query_vector,
-        limit=5,
-        query_filter=Filter(
-            must=[
-                FieldCondition(
-                    key="chat_id",
-                    match=MatchValue(value=str(chat_id)),
-                )
-            ]
-        ),
-    )
+    with timed_dependency("qdrant", "search"):
+        results = get_qdrant().search(
+            collection_name=collection.name,
+            query_vector=query_vector,
+            limit=5,
+            query_filter=tenant_filter(scope, chat_id, workspace_id, organization_id),
+        )
 
     contexts = [hit.payload.get("text", "") for hit in results]
     return "\n".join(contexts)
 
 
+def tenant_payload(chat_id, workspace_id, organization_id) -> dict:
+    # Workspace-level documents have no chat_id
+    payload = {}
+    if workspace_id is not None:
+        payload["workspace_id"] = str(workspace_id)
+    if chat_id is not None:
+        payload["chat_id"] = str(chat_id)
+    if organization_id is not None:
+        payload["organization_id"] = str(organization_id)
+    return payload
+
+
 # Store embeddings in Qdrant
-def embed_and_store(text: str, chat_id, filename: str):
-    chunks = [text[i:i + 1000] for i in range(0, len(text), 1000)]
-    vectors = encoder.encode(chunks)
+def chunk_text(text: str, size: int = 1000):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def embed_and_store(text: str, chat_id, filename: str, workspace_id=None, organization_id=None):
+    embed_and_store_many([(text, chat_id, filename, workspace_id, organization_id)])
+
+
+def embed_and_store_many(documents) -> list:
+    """Embed and upsert many (text, chat_id, filename, workspace_id, organization_id) documents.
+
+    Chunks from all documents share encode batches of INGEST_EMBED_BATCH_SIZE and are upserted
+    INGEST_UPSERT_BATCH_SIZE points at a time, into every live collection with that collection's model.
+    Returns the ids of the points stored per document.
+    """
+    chunks, owners = [], []
+    for index, (text, *_) in enumerate(documents):
+        document_chunks = chunk_text(text)
+        chunks.extend(document_chunks)
+        owners.extend([index] * len(document_chunks))
+    if not chunks:
+        return [[] for _ in documents]
+
+    # Lets the reclaimer's sweep skip points whose document row is not committed yet, and keeps a
+    # delete from reaching a re-upload under the same name
+    indexed_at = time.time()
+    payloads = []
+    for chunk, owner in zip(chunks, owners):
+        _, chat_id, filename, workspace_id, organization_id = documents[owner]
+        payloads.append({
+            "text": chunk,
+            "filename": filename,
+            "indexed_at": indexed_at,
+            **tenant_payload(chat_id, workspace_id, organization_id),
+        })
+    # The same ids in every collection, so deletes by id and re-embedding copies line up
+    ids = [str(uuid.uuid4()) for _ in chunks]
 
+    vectors_by_model = {}
+    for collection in write_collections():
+        if collection.model not in vectors_by_model:
+            vectors_by_model[collection.model] = encode_batched(chunks, collection.model)
+        upsert_points(collection.name, ids, vectors_by_model[collection.model], payloads)
+
+    point_ids = [[] for _ in documents]
+    for point_id, owner in zip(ids, owners):
+        point_ids[owner].append(point_id)
+    return point_ids
+
+
+def encode_batched(chunks: List[str], model: str = None) -> list:
+    vectors = []
+    with timed("embedding.chunks"):
+        for i in range(0, len(chunks), settings.INGEST_EMBED_BATCH_SIZE):
+            vectors.extend(_encode(chunks[i:i + settings.INGEST_EMBED_BATCH_SIZE], model))
+    return vectors
+
+
+def upsert_points(collection: str, ids, vectors, payloads):
     # Ensure collection and index exist
-    ensure_collection_and_indexes(vector_size=len(vectors[0]))
-
-    points = []
-    for i, vector in enumerate(vectors):
-        points.append(PointStruct(
-            id=str(uuid.uuid4()),
-            vector=vector.tolist(),
-            payload={
-                "text": chunks[i],
-                "chat_id": str(chat_id),
-                "filename": filename
-            }
-        ))
-
-    qdrant.upsert(
-        collection_name=COLLECTION,
-        points=points
-    )
+    ensure_collection_and_indexes(len(vectors[0]), collection)
+    points = [
+        PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+        for point_id, vector, payload in zip(ids, vectors, payloads)
+    ]
+    for i in range(0, len(points), settings.INGEST_UPSERT_BATCH_SIZE):
+        with timed_dependency("qdrant", "upsert"):
+            get_qdrant().upsert(
+                collection_name=collection,
+                points=points[i:i + settings.INGEST_UPSERT_BATCH_SIZE]
+            )
+
+
+def _document_filter(chat_id, workspace_id, filename: str, indexed_before: float = None) -> Filter:
+    # A chat's file, or a workspace-level one when chat_id is None
+    must = [FieldCondition(key="filename", match=MatchValue(value=filename))]
+    if chat_id is not None:
+        must.append(FieldCondition(key="chat_id", match=MatchValue(value=str(chat_id))))
+    else:
+        must.append(FieldCondition(key="workspace_id", match=MatchValue(value=str(workspace_id))))
+        must.append(IsEmptyCondition(is_empty=PayloadField(key="chat_id")))
+    if indexed_before is not None:
+        # Only the copy that was deleted: a file uploaded again under the same name is indexed later.
+        # Points from before indexed_at existed cannot be told apart and are matched too
+        must.append(Filter(should=[
+            FieldCondition(key="indexed_at", range=Range(lte=indexed_before)),
+            IsEmptyCondition(is_empty=PayloadField(key="indexed_at")),
+        ]))
+    return Filter(must=must)
 
 
 # Delete embeddings for a file
-def delete_document_vectors(chat_id: uuid.UUID, filename: str):
-    qdrant.delete(
-        collection_name=COLLECTION,
-        points_selector=Filter(
-            must=[
-                FieldCondition(
-                    key="chat_id",
-                    match=MatchValue(value=str(chat_id)),
-                ),
-                FieldCondition(
-                    key="filename",
-                    match=MatchValue(value=filename),
-                ),
-            ]
-        ),
+def delete_document_vectors(chat_id: uuid.UUID, filename: str, workspace_id=None):
+    for collection in write_collections():
+        with timed_dependency("qdrant", "delete"):
+            get_qdrant().delete(
+                collection_name=collection.name,
+                points_selector=_document_filter(chat_id, workspace_id, filename),
+            )
+
+
+def _mark_deleted(filter_: Filter):
+    for collection in write_collections():
+        with timed_dependency("qdrant", "set_payload"):
+            get_qdrant().set_payload(collection_name=collection.name, payload={"deleted": True}, points=filter_)
+
+
+def hide_document_vectors(chat_id, workspace_id, filename: str, deleted_at: float):
+    """Exclude a logically deleted document from searches at once; the reclaimer deletes the points later."""
+    _mark_deleted(_document_filter(chat_id, workspace_id, filename, deleted_at))
+
+
+def hide_chat_vectors(chat_id):
+    _mark_deleted(Filter(must=[FieldCondition(key="chat_id", match=MatchValue(value=str(chat_id)))]))
+
+
+def _delete_matching(filter_: Filter) -> int:
+    # Deletes go to every live collection; the count reported is the active one's
+    qdrant = get_qdrant()
+    count = 0
+    for collection in write_collections():
+        matched = qdrant.count(collection_name=collection.name, count_filter=filter_, exact=True).count
+        if matched:
+            with timed_dependency("qdrant", "delete"):
+                qdrant.delete(collection_name=collection.name, points_selector=filter_)
+        if collection.status == "active":
+            count = matched
+    return count
+
+
+# Batched deletes for the reclaimer; each returns the number of points removed
+def delete_documents_vectors(documents) -> int:
+    """documents: (chat_id, workspace_id, filename, deleted_at timestamp), one filter for the whole batch."""
+    return _delete_matching(Filter(should=[_document_filter(*document) for document in documents]))
+
+
+def delete_chats_vectors(chat_ids) -> int:
+    return _delete_matching(
+        Filter(must=[FieldCondition(key="chat_id", match=MatchAny(any=[str(c) for c in chat_ids]))])
     )
+
+
+def delete_points(point_ids) -> int:
+    point_ids = list(point_ids)
+    for collection in write_collections():
+        with timed_dependency("qdrant", "delete"):
+            get_qdrant().delete(collection_name=collection.name, points_selector=PointIdsList(points=point_ids))
+    return len(point_ids)
+
+
+def scroll_points(batch_size: int, fields, collection: str = None):
+    """Every point's id and the given payload fields, a page at a time (the active collection by default)."""
+    collection = collection or active_collection().name
+    offset = None
+    while True:
+        with timed_dependency("qdrant", "scroll"):
+            points, offset = get_qdrant().scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=list(fields),
+                with_vectors=False,
+            )
+        yield from points
+        if offset is None:
+            return
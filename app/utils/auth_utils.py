@@ -1,4 +1,3 @@
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from app.core.config import settings
@@ -7,16 +6,18 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from app.core.db import get_db
+from app.services.password_hashing import hash_password_sync, verify_and_update_sync
+import uuid
 
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Blocking variants for scripts; request handlers use app.services.password_hashing
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return hash_password_sync(password, settings.PASSWORD_BCRYPT_ROUNDS)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_and_update_sync(plain_password, hashed_password, settings.PASSWORD_BCRYPT_ROUNDS)[0]
 
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=60000000)) -> str:
     to_encode = data.copy()
@@ -41,7 +42,8 @@ def get_current_user(
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
-    except JWTError:
+        user_id = uuid.UUID(user_id)
+    except (JWTError, ValueError):
         raise credentials_exception
 
     user = db.query(User).filter(User.id == user_id).first()
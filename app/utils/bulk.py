@@ -0,0 +1,28 @@
+from typing import Iterable, List
+
+from sqlalchemy import insert
+
+from app.core.db import engine
+
+
+def upsert(model, rows: List[dict], index_elements: List[str], update_columns: Iterable[str] = (),
+           increment_columns: Iterable[str] = ()):
+    """Multi-row INSERT that skips rows whose key already exists, or updates them: update_columns are
+    overwritten with the new values, increment_columns have the new values added.
+
+    Uses ON CONFLICT on PostgreSQL and SQLite; other dialects get a plain INSERT.
+    """
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return insert(model).values(rows)
+    statement = dialect_insert(model).values(rows)
+    table = model.__table__
+    set_ = {column: statement.excluded[column] for column in update_columns}
+    set_.update({column: table.c[column] + statement.excluded[column] for column in increment_columns})
+    if set_:
+        return statement.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    return statement.on_conflict_do_nothing(index_elements=index_elements)
@@ -0,0 +1,5 @@
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English with the OpenAI and Anthropic tokenizers; good enough for quotas
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
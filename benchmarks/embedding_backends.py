@@ -0,0 +1,70 @@
+"""Sentences/second and vector agreement of the embedding backends against the torch baseline.
+
+    python -m benchmarks.embedding_backends --sentences 2000 --threads 4
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.services.embedding import EMBEDDING_MODEL
+from app.services.onnx_encoder import COSINE_TOLERANCE, load_onnx_encoder
+
+WORDS = (
+    "workspace document upload invoice policy contract employee onboarding refund shipping "
+    "account password security quarterly report revenue forecast team department manager "
+    "vacation benefits compliance audit customer support ticket escalation release"
+).split()
+
+
+def make_sentences(n: int, seed: int = 7):
+    rng = random.Random(seed)
+    # Mixed lengths, like real queries (short) and document chunks (long)
+    return [" ".join(rng.choices(WORDS, k=rng.choice([6, 12, 40, 120, 200]))) for _ in range(n)]
+
+
+def run(encoder, sentences, batch_size: int):
+    encoder.encode(sentences[:batch_size], batch_size=batch_size)
+    started = time.perf_counter()
+    vectors = encoder.encode(sentences, batch_size=batch_size)
+    return np.asarray(vectors), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--sentences", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--onnx-dir", default="models/onnx")
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    sentences = make_sentences(args.sentences)
+    baseline, baseline_s = run(SentenceTransformer(args.model, device="cpu"), sentences, args.batch_size)
+    baseline = baseline / np.linalg.norm(baseline, axis=1, keepdims=True)
+    print(f"{'backend':<10} {'sent/s':>10} {'speedup':>8} {'mean cos':>9} {'min cos':>9}")
+    print(f"{'torch':<10} {len(sentences) / baseline_s:>10,.0f} {1.0:>8.2f} {1.0:>9.4f} {1.0:>9.4f}")
+
+    failed = False
+    for name, quantized in (("onnx", False), ("onnx-int8", True)):
+        encoder = load_onnx_encoder(args.model, args.onnx_dir, quantized=quantized, num_threads=args.threads)
+        vectors, seconds = run(encoder, sentences, args.batch_size)
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cosine = (vectors * baseline).sum(axis=1)
+        failed |= cosine.min() < 1 - COSINE_TOLERANCE
+        print(f"{name:<10} {len(sentences) / seconds:>10,.0f} {baseline_s / seconds:>8.2f} "
+              f"{cosine.mean():>9.4f} {cosine.min():>9.4f}")
+
+    if failed:
+        raise SystemExit(f"A backend fell outside the cosine tolerance of {COSINE_TOLERANCE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Embedding throughput: N worker processes with their own model vs. N thin clients of one sidecar.
+
+    python -m benchmarks.embedding_workers --workers 8 --mode local
+    python -m benchmarks.embedding_workers --workers 8 --mode sidecar --threads 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SENTENCE = "How do I rotate the API key for a workspace without downtime for existing chats?"
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0.0
+
+
+def worker(mode: str, socket_path: str, requests: int, batch: int, ready, start, results):
+    if mode == "sidecar":
+        os.environ["EMBEDDING_SIDECAR_SOCKET"] = socket_path
+    from app.services.embedding import EMBEDDING_MODEL, load_encoder
+
+    encoder = load_encoder(EMBEDDING_MODEL)
+    encoder.encode(SENTENCE)
+    ready.put((os.getpid(), rss_mb(os.getpid())))
+    start.wait()
+
+    texts = [f"{SENTENCE} #{i}" for i in range(batch)]
+    started = time.perf_counter()
+    for _ in range(requests):
+        encoder.encode(texts if batch > 1 else texts[0])
+    results.put((requests * batch, time.perf_counter() - started))
+
+
+def wait_for_socket(path: str, proc: subprocess.Popen, timeout: float = 120):
+    deadline = time.time() + timeout
+    while not os.path.exists(path):
+        if proc.poll() is not None or time.time() > deadline:
+            raise RuntimeError("Embedding sidecar failed to start")
+        time.sleep(0.2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=["local", "sidecar"], default="sidecar")
+    parser.add_argument("--requests", type=int, default=200, help="encode calls per worker")
+    parser.add_argument("--batch", type=int, default=1, help="sentences per encode call")
+    parser.add_argument("--threads", type=int, default=0, help="EMBEDDING_NUM_THREADS for whoever owns the model")
+    args = parser.parse_args()
+
+    if args.threads:
+        os.environ["EMBEDDING_NUM_THREADS"] = str(args.threads)
+
+    sidecar = None
+    socket_path = os.path.join(tempfile.mkdtemp(), "embed.sock")
+    if args.mode == "sidecar":
+        sidecar = subprocess.Popen([sys.executable, "-m", "app.services.embedding_server", "--socket", socket_path])
+        wait_for_socket(socket_path, sidecar)
+
+    ctx = mp.get_context("spawn")
+    ready, results, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [
+        ctx.Process(target=worker, args=(args.mode, socket_path, args.requests, args.batch, ready, start, results))
+        for _ in range(args.workers)
+    ]
+    try:
+        for p in procs:
+            p.start()
+        worker_rss = [ready.get()[1] for _ in procs]
+        sidecar_rss = rss_mb(sidecar.pid) if sidecar else 0.0
+
+        started = time.perf_counter()
+        start.set()
+        done = [results.get() for _ in procs]
+        wall = time.perf_counter() - started
+
+        sentences = sum(n for n, _ in done)
+        print(f"mode={args.mode} workers={args.workers} batch={args.batch} threads={args.threads or 'default'}")
+        print(f"  throughput: {sentences / wall:,.0f} sentences/s ({sentences} in {wall:.2f}s)")
+        print(f"  memory: workers {sum(worker_rss):,.0f} MB + sidecar {sidecar_rss:,.0f} MB "
+              f"= {sum(worker_rss) + sidecar_rss:,.0f} MB")
+    finally:
+        for p in procs:
+            p.join(timeout=5)
+        if sidecar:
+            sidecar.terminate()
+            sidecar.wait()
+
+
+if __name__ == "__main__":
+    main()
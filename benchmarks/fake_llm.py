@@ -0,0 +1,131 @@
+"""Local stand-in for the OpenAI and Anthropic APIs.
+
+Streams OpenAI chat.completion.chunk and Anthropic messages SSE at a configurable token rate:
+
+    python -m benchmarks.fake_llm --port 8900 --tokens 200 --tokens-per-second 80 --ttft-ms 300
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+CONFIG = {"tokens": 200, "tokens_per_second": 80.0, "ttft_ms": 300.0}
+
+
+def words(n: int):
+    return [f"tok{i} " for i in range(n)]
+
+
+def generation_seconds(tokens: int) -> float:
+    return CONFIG["ttft_ms"] / 1000 + tokens / max(CONFIG["tokens_per_second"], 1)
+
+
+async def paced(tokens):
+    await asyncio.sleep(CONFIG["ttft_ms"] / 1000)
+    rate = CONFIG["tokens_per_second"]
+    interval = 1 / rate if rate > 0 else 0
+    started = time.perf_counter()
+    for i, token in enumerate(tokens):
+        # Sleep to the schedule rather than per token so the rate holds under load
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield token
+
+
+def sse(data) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+
+async def openai_chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "gpt-fake")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    tokens = words(CONFIG["tokens"])
+
+    if not body.get("stream"):
+        await asyncio.sleep(generation_seconds(len(tokens)))
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "".join(tokens)}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        })
+
+    def chunk(delta, finish_reason=None):
+        return sse({
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    async def stream():
+        yield chunk({"role": "assistant", "content": ""})
+        async for token in paced(tokens):
+            yield chunk({"content": token})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+async def anthropic_messages(request: Request):
+    body = await request.json()
+    model = body.get("model", "claude-fake")
+    message_id = f"msg_{uuid.uuid4().hex}"
+    tokens = words(min(CONFIG["tokens"], body.get("max_tokens", CONFIG["tokens"])))
+
+    if not body.get("stream"):
+        await asyncio.sleep(generation_seconds(len(tokens)))
+        return JSONResponse({
+            "id": message_id, "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "text", "text": "".join(tokens)}],
+            "stop_reason": "end_turn", "usage": {"input_tokens": 0, "output_tokens": len(tokens)},
+        })
+
+    def event(name, data):
+        return f"event: {name}\n" + sse(data)
+
+    async def stream():
+        yield event("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+            "usage": {"input_tokens": 0, "output_tokens": 0}}})
+        yield event("content_block_start", {"type": "content_block_start", "index": 0,
+                                            "content_block": {"type": "text", "text": ""}})
+        async for token in paced(tokens):
+            yield event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                "delta": {"type": "text_delta", "text": token}})
+        yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        yield event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn"},
+                                      "usage": {"output_tokens": len(tokens)}})
+        yield event("message_stop", {"type": "message_stop"})
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+app = Starlette(routes=[
+    Route("/v1/chat/completions", openai_chat, methods=["POST"]),
+    Route("/v1/messages", anthropic_messages, methods=["POST"]),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--tokens", type=int, default=CONFIG["tokens"])
+    parser.add_argument("--tokens-per-second", type=float, default=CONFIG["tokens_per_second"])
+    parser.add_argument("--ttft-ms", type=float, default=CONFIG["ttft_ms"])
+    args = parser.parse_args()
+
+    CONFIG.update(tokens=args.tokens, tokens_per_second=args.tokens_per_second, ttft_ms=args.ttft_ms)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""End-to-end load test of the API against local stand-ins.
+
+Starts the fake LLM server (benchmarks.fake_llm) and the app under uvicorn with SQLite (or
+--database-url), in-memory Qdrant (or --qdrant-url) and a local Redis. Then it drives concurrent
+scenarios through /chat/chat, /chat/upload-document and /chat/history:
+
+    python -m benchmarks.loadtest --scenarios chat,history --concurrency 32 --requests 500
+    python -m benchmarks.loadtest --save-baseline main
+    python -m benchmarks.loadtest --compare main --tolerance 0.10
+
+Reports p50/p95/p99 latency, time to first token, throughput, errors and the server's peak RSS.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+SCENARIOS = ("chat", "upload", "history")
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, ttfts, errors, wall):
+    done = len(latencies)
+    return {
+        "requests": done + errors,
+        "errors": errors,
+        "throughput_rps": round(done / wall, 2) if wall else 0,
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) if latencies else None for p in (50, 95, 99)},
+        "ttft_ms": {f"p{p}": round(percentile(ttfts, p) * 1000, 1) if ttfts else None for p in (50, 95, 99)},
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else None,
+    }
+
+
+class RssSampler:
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._task = None
+
+    def _read(self) -> float:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except FileNotFoundError:
+            pass
+        return 0.0
+
+    async def _run(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, self._read())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+def start_services(args, workdir: str):
+    fake = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.fake_llm", "--port", str(args.llm_port),
+        "--tokens", str(args.llm_tokens), "--tokens-per-second", str(args.llm_tps), "--ttft-ms", str(args.llm_ttft_ms),
+    ])
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "REDIS_URL": args.redis_url,
+        "VECTOR_DB_URL": args.qdrant_url,
+        "VECTOR_DB_COLLECTION": f"bench_{uuid.uuid4().hex[:8]}",
+        "VECTOR_DB_API_KEY": "",
+        "CHATGPT_API_KEY": "bench",
+        "ANTHROPIC_API_KEY": "bench",
+        "RESET_PASSWORD_URL": "http://localhost/reset",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.llm_port}/v1",
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{args.llm_port}",
+        "WARMUP_BLOCKING": "true",
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_ROOT,
+         "--port", str(args.port), "--log-level", "warning"],
+        env=env, cwd=workdir if args.chdir else None,
+    )
+    return fake, app
+
+
+async def wait_ready(base_url: str, proc: subprocess.Popen, timeout: float = 300):
+    deadline = time.time() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.time() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                if (await client.get("/health/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise RuntimeError("API server did not become ready")
+
+
+async def seed(client: httpx.AsyncClient, chats: int, model: str):
+    email = f"bench-{uuid.uuid4().hex[:10]}@example.com"
+    r = await client.post("/auth/auth/register", json={"email": email, "password": "bench-password", "full_name": "Bench"})
+    r.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+
+    r = await client.post("/workspace/workspace/create", json={"name": f"bench-{uuid.uuid4().hex[:10]}"})
+    r.raise_for_status()
+    workspace_id = r.json()["id"]
+
+    chat_ids = []
+    for i in range(chats):
+        r = await client.post("/chat/create", json={"workspace_id": workspace_id, "title": f"bench {i}", "model": model})
+        r.raise_for_status()
+        chat_ids.append(r.json()["chat_id"])
+    return chat_ids
+
+
+async def one_chat(client, chat_id, model, i):
+    started = time.perf_counter()
+    ttft = None
+    body = {"chat_id": chat_id, "message": f"Question {i}: what does the onboarding policy say?", "model": model}
+    async with client.stream("POST", "/chat/chat", json=body) as r:
+        if r.status_code != 200:
+            await r.aread()
+            return False, time.perf_counter() - started, None
+        async for chunk in r.aiter_raw():
+            if chunk and ttft is None:
+                ttft = time.perf_counter() - started
+    return True, time.perf_counter() - started, ttft
+
+
+async def one_upload(client, chat_id, model, i, doc=" ".join(f"policy clause {n}." for n in range(2000))):
+    started = time.perf_counter()
+    files = {"file": (f"bench-{i}-{uuid.uuid4().hex[:6]}.txt", doc.encode(), "text/plain")}
+    r = await client.post("/chat/upload-document", params={"chat_id": chat_id}, files=files)
+    return r.status_code == 200, time.perf_counter() - started, None
+
+
+async def one_history(client, chat_id, model, i):
+    started = time.perf_counter()
+    r = await client.get(f"/chat/history/{chat_id}", params={"limit": 100})
+    return r.status_code == 200, time.perf_counter() - started, None
+
+
+RUNNERS = {"chat": one_chat, "upload": one_upload, "history": one_history}
+
+
+async def run_scenario(client, name, chat_ids, model, concurrency, requests):
+    runner = RUNNERS[name]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ttfts, errors = [], [], 0
+
+    async def task(i):
+        nonlocal errors
+        async with semaphore:
+            try:
+                ok, latency, ttft = await runner(client, chat_ids[i % len(chat_ids)], model, i)
+            except httpx.HTTPError:
+                ok, latency, ttft = False, 0, None
+        if ok:
+            latencies.append(latency)
+            if ttft is not None:
+                ttfts.append(ttft)
+        else:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(task(i) for i in range(requests)))
+    return summarize(latencies, ttfts, errors, time.perf_counter() - started)
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if not previous:
+            continue
+        for metric in ("latency_ms", "ttft_ms"):
+            for pct in ("p50", "p95", "p99"):
+                old, new = previous[metric].get(pct), current[metric].get(pct)
+                if old and new and new > old * (1 + tolerance):
+                    regressions.append(f"{name} {metric} {pct}: {old} -> {new}")
+        if current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name} throughput_rps: {previous['throughput_rps']} -> {current['throughput_rps']}")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name} errors: {previous['errors']} -> {current['errors']}")
+    if results["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(f"peak_rss_mb: {baseline['peak_rss_mb']} -> {results['peak_rss_mb']}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'scenario':<10} {'reqs':>6} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'ttft p50':>9} {'ttft p95':>9}")
+    for name, r in results["scenarios"].items():
+        lat, ttft = r["latency_ms"], r["ttft_ms"]
+        print(f"{name:<10} {r['requests']:>6} {r['errors']:>5} {r['throughput_rps']:>8} "
+              f"{lat['p50'] or '-':>9} {lat['p95'] or '-':>9} {lat['p99'] or '-':>9} "
+              f"{ttft['p50'] or '-':>9} {ttft['p95'] or '-':>9}")
+    print(f"peak server RSS: {results['peak_rss_mb']:.0f} MB")
+
+
+async def main_async(args):
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    with tempfile.TemporaryDirectory() as workdir:
+        fake, app = start_services(args, workdir)
+        try:
+            await wait_ready(base_url, app)
+            limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+                chat_ids = await seed(client, args.chats, args.model)
+                results = {"config": vars(args), "scenarios": {}}
+                with RssSampler(app.pid) as rss:
+                    for name in scenarios:
+                        results["scenarios"][name] = await run_scenario(
+                            client, name, chat_ids, args.model, args.concurrency, args.requests
+                        )
+                results["peak_rss_mb"] = round(rss.peak_mb, 1)
+        finally:
+            for proc in (app, fake):
+                proc.terminate()
+                proc.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="chat,upload,history")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--chats", type=int, default=16)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--llm-port", type=int, default=8900)
+    parser.add_argument("--llm-tokens", type=int, default=200)
+    parser.add_argument("--llm-tps", type=float, default=80)
+    parser.add_argument("--llm-ttft-ms", type=float, default=300)
+    parser.add_argument("--database-url", default="", help="defaults to a throwaway SQLite file")
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/15")
+    parser.add_argument("--qdrant-url", default=":memory:")
+    parser.add_argument("--chdir", action="store_true", help="run the server in the temp dir (keeps uploads/ out of the tree)")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    print_results(results)
+
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("REGRESSIONS:\n  " + "\n  ".join(regressions))
+            raise SystemExit(1)
+        print(f"no regressions against baseline '{args.compare}' (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
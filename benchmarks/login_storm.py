@@ -0,0 +1,156 @@
+"""Login storm: sign-in throughput next to the latency of everything else.
+
+Starts the app under uvicorn (SQLite, in-memory Qdrant, no Redis needed) once per hash pool size,
+registers --users accounts, then fires --logins concurrent logins while a probe keeps calling a
+cheap sync endpoint (/org/organization/list). PASSWORD_HASH_WORKERS=0 hashes in the request
+threadpool, as the auth endpoints used to:
+
+    python -m benchmarks.login_storm --hash-workers 0,2 --logins 400 --concurrency 64
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.loadtest import REPO_ROOT, percentile, wait_ready
+
+PASSWORD = "storm-password"
+
+
+def start_app(args, workdir: str, hash_workers: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "REDIS_URL": "redis://127.0.0.1:6379/15",
+        "VECTOR_DB_URL": ":memory:",
+        "VECTOR_DB_COLLECTION": f"bench_{uuid.uuid4().hex[:8]}",
+        "VECTOR_DB_API_KEY": "",
+        "CHATGPT_API_KEY": "bench",
+        "ANTHROPIC_API_KEY": "bench",
+        "RESET_PASSWORD_URL": "http://localhost/reset",
+        "WARMUP_BLOCKING": "true",
+        "WARMUP_COMPONENTS": "schema",
+        "RECLAIM_ENABLED": "false",
+        "PASSWORD_HASH_WORKERS": str(hash_workers),
+        "PASSWORD_BCRYPT_ROUNDS": str(args.rounds),
+        "PASSWORD_HASH_MAX_QUEUE": str(args.max_queue),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_ROOT,
+         "--port", str(args.port), "--log-level", "warning"],
+        env=env, cwd=workdir,
+    )
+
+
+def ms(values, pct):
+    value = percentile(values, pct)
+    return round(value * 1000, 1) if value is not None else None
+
+
+async def probe(client, token: str, stop: asyncio.Event, interval: float):
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        r = await client.get("/org/organization/list", headers={"Authorization": f"Bearer {token}"})
+        if r.status_code == 200:
+            latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def storm(client, emails, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def login(i):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # The login endpoint takes the registration schema
+                body = {"email": emails[i % len(emails)], "password": PASSWORD, "full_name": "Storm"}
+                r = await client.post("/auth/auth/login", json=body)
+                status = r.status_code
+            except httpx.HTTPError:
+                status = "error"
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(i) for i in range(logins)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def run(args, hash_workers: int):
+    base_url = f"http://127.0.0.1:{args.port}"
+    with tempfile.TemporaryDirectory() as workdir:
+        app = start_app(args, workdir, hash_workers)
+        try:
+            await wait_ready(base_url, app)
+            limits = httpx.Limits(max_connections=args.concurrency + 8, max_keepalive_connections=args.concurrency + 8)
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+                emails = [f"storm-{i}-{uuid.uuid4().hex[:6]}@example.com" for i in range(args.users)]
+                tokens = []
+                for email in emails:
+                    r = await client.post("/auth/auth/register", json={"email": email, "password": PASSWORD, "full_name": "Storm"})
+                    r.raise_for_status()
+                    tokens.append(r.json()["access_token"])
+
+                stop = asyncio.Event()
+                idle = asyncio.create_task(probe(client, tokens[0], stop, args.probe_interval))
+                await asyncio.sleep(args.idle_seconds)
+                stop.set()
+                idle_latencies = await idle
+
+                stop = asyncio.Event()
+                busy = asyncio.create_task(probe(client, tokens[0], stop, args.probe_interval))
+                login_latencies, statuses, wall = await storm(client, emails, args.logins, args.concurrency)
+                stop.set()
+                busy_latencies = await busy
+        finally:
+            app.terminate()
+            app.wait()
+    return {
+        "hash_workers": hash_workers,
+        "logins_ok": statuses.get(200, 0),
+        "rejected": statuses.get(503, 0),
+        "other": sum(n for status, n in statuses.items() if status not in (200, 503)),
+        "login_rps": round(statuses.get(200, 0) / wall, 1),
+        "login_p50": ms(login_latencies, 50),
+        "login_p99": ms(login_latencies, 99),
+        "probe_idle_p99": ms(idle_latencies, 99),
+        "probe_storm_p50": ms(busy_latencies, 50),
+        "probe_storm_p99": ms(busy_latencies, 99),
+        "probe_storm_n": len(busy_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hash-workers", default="0,2", help="PASSWORD_HASH_WORKERS values to compare")
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12, help="PASSWORD_BCRYPT_ROUNDS")
+    parser.add_argument("--max-queue", type=int, default=64, help="PASSWORD_HASH_MAX_QUEUE")
+    parser.add_argument("--probe-interval", type=float, default=0.02)
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--port", type=int, default=8902)
+    args = parser.parse_args()
+
+    results = [asyncio.run(run(args, int(n))) for n in args.hash_workers.split(",")]
+    columns = list(results[0])
+    print(" ".join(f"{c:>15}" for c in columns))
+    for r in results:
+        print(" ".join(f"{str(r[c] if r[c] is not None else '-'):>15}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
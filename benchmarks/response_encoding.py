@@ -0,0 +1,123 @@
+"""Encode cost of chat history responses: the old path against FastJSONResponse.
+
+Loads a chat of N messages from a throwaway SQLite database, then times, per history size:
+ORM rows vs selected columns, FastAPI's jsonable_encoder + json.dumps vs orjson, and gzip.
+
+    python -m benchmarks.response_encoding --sizes 500,5000,50000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp(prefix="response-encoding-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}")
+for name in ("CHATGPT_API_KEY", "ANTHROPIC_API_KEY", "REDIS_URL", "RESET_PASSWORD_URL", "VECTOR_DB_URL",
+             "VECTOR_DB_COLLECTION", "VECTOR_DB_API_KEY"):
+    os.environ.setdefault(name, "bench")
+
+import gzip  # noqa: E402
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from app.api.chat import MESSAGE_COLUMNS, serialize_message  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.db import SessionLocal, engine, init_schema  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.utils.bulk import upsert  # noqa: E402
+
+WORDS = "the invoice policy refund team report quarterly revenue forecast onboarding contract".split()
+
+
+def populate(chat_id, user_id, n: int, seed: int = 7):
+    rng = random.Random(seed)
+    started = datetime(2026, 1, 1)
+    rows = [
+        {
+            # Seeded ids: the run is reproducible (SQLite gives UUID columns numeric affinity)
+            "id": uuid.UUID(int=rng.getrandbits(128), version=4),
+            "user_id": user_id,
+            "chat_id": chat_id,
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(5, 40))),
+            "response": " ".join(rng.choices(WORDS, k=rng.randint(40, 400))),
+            "status": "complete",
+            "created_at": started + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+    with engine.begin() as conn:
+        for i in range(0, n, 500):
+            conn.execute(upsert(Message, rows[i:i + 500], ["id"]))
+
+
+def best(fn, repeat: int):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000, statistics.median(times) * 1000, result
+
+
+def stdlib_encode(payload) -> bytes:
+    # What FastAPI does for a returned dict: jsonable_encoder, then JSONResponse.render
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="500,5000,50000", help="Messages per history")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gzip-level", type=int, default=settings.RESPONSE_GZIP_LEVEL)
+    args = parser.parse_args()
+
+    init_schema()
+    print(f"{'messages':>9} {'step':<28} {'best ms':>9} {'median ms':>10} {'bytes':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        chat_id, user_id = uuid.uuid4(), uuid.uuid4()
+        populate(chat_id, user_id, size)
+        db = SessionLocal()
+        try:
+            def load_orm():
+                db.expunge_all()
+                return db.query(Message).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
+
+            def load_columns():
+                return db.query(*MESSAGE_COLUMNS).filter(Message.chat_id == chat_id).order_by(Message.created_at).all()
+
+            orm_rows = load_orm()
+            column_rows = load_columns()
+            old_payload = {"items": [serialize_message(m) for m in orm_rows], "next_cursor": None}
+            new_payload = {"items": [serialize_message(m) for m in column_rows], "next_cursor": None}
+
+            steps = [
+                ("load ORM rows", lambda: load_orm()),
+                ("load columns", lambda: load_columns()),
+                ("jsonable_encoder + json", lambda: stdlib_encode(old_payload)),
+                ("orjson", lambda: orjson.dumps(new_payload)),
+            ]
+            body = orjson.dumps(new_payload)
+            steps.append((f"gzip level {args.gzip_level}", lambda: gzip.compress(body, compresslevel=args.gzip_level)))
+            results = {}
+            for name, fn in steps:
+                best_ms, median_ms, result = best(fn, args.repeat)
+                results[name] = best_ms
+                size_bytes = len(result) if isinstance(result, bytes) else ""
+                print(f"{size:>9} {name:<28} {best_ms:>9.2f} {median_ms:>10.2f} {size_bytes:>12}")
+            old = results["load ORM rows"] + results["jsonable_encoder + json"]
+            new = results["load columns"] + results["orjson"]
+            print(f"{size:>9} {'load + encode speedup':<28} {old / new:>9.2f}x")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
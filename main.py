@@ -1,14 +1,19 @@
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+from app.core.lifecycle import lifespan, FirstRequestTimer
 from fastapi import FastAPI
-from app.models import user, workspace, workspace_user, message, chat 
-from app.api import auth,chat,root,workspace,org_hierarchy
+from app.api import auth,chat,root,workspace,org_hierarchy,metrics,file_upload,analytics
+from app.core.metrics import RequestContextMiddleware, bind_db_pool
+from app.core.db import pool_usage
+from app.core.admission import AdmissionControl
+from app.services.vector_store import embedding_queue_depth
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
-from app.core.db import Base, engine
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+# Innermost of the middlewares so that CORS headers and request ids still reach shed responses
+app.add_middleware(AdmissionControl, pool_usage=pool_usage, embedding_queue_depth=embedding_queue_depth)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -16,11 +21,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(FirstRequestTimer)
+app.add_middleware(RequestContextMiddleware)
+bind_db_pool(pool_usage)
 
 security = HTTPBearer()
-Base.metadata.create_all(bind=engine)
 app.include_router(root.router)
+app.include_router(metrics.router)
 app.include_router(auth.router, prefix="/auth")
 app.include_router(chat.router, prefix="/chat")
 app.include_router(workspace.router, prefix="/workspace")
+app.include_router(file_upload.router, prefix="/files")
 app.include_router(org_hierarchy.router, prefix="/org")
+app.include_router(analytics.router, prefix="/analytics")